@@ -5,7 +5,7 @@ import logging
 from app.database.session import get_db_session
 from app.schemas.user import loginSchema
 from app.models.usuarios import usuarios
-from app.utils.security import verify_password
+from app.utils.passwords import password_pool
 from app.core.config import settings
 from app.utils.security import create_access_token
 from app.utils.security import get_current_user
@@ -48,7 +48,7 @@ async def login_user(
         )
 
     # 2) Verificar la contraseña
-    if not verify_password(user_in.password, existing_user.password_hash):
+    if not await password_pool.verify(user_in.password, existing_user.password_hash):
         logger.warning("Intento de login con contraseña incorrecta para el correo: %s", user_in.correo)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -103,7 +103,7 @@ async def login_token(
         )
 
     # 2) Verificar password
-    if not verify_password(password, existing_user.password_hash):
+    if not await password_pool.verify(password, existing_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Correo o contraseña incorrectos.",
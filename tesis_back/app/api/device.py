@@ -1,12 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import base64
+import math
+from datetime import datetime, timedelta
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import func, select, tuple_
 import logging
 import uuid
-from app.database.session import get_db_session
+from app.database.session import get_db_session, get_read_db_session
 from app.models.dispositivos import dispositivos
+from app.models.lectura import lectura
+from app.models.lectura_hora import lectura_hora
+from app.models.perfil_umbral import perfil_umbral
 from app.schemas.dispositivos import DispositivoBase, DispositivoCreate, DispositivoUpdate,DispositivoRead
+from app.schemas.lecturas import LecturaHoraRead, LecturaPage, LecturaRead
+from app.service.downsampling import lttb
 from app.utils.security import get_current_user, require_role
+from app.service.registry_events import notify_registry_change
 
 router = APIRouter(
     prefix="/dispositivos",
@@ -15,6 +25,80 @@ router = APIRouter(
 
 logger = logging.getLogger(__name__)
 
+MAX_RANGO_RESUMEN = timedelta(days=366)
+MAX_LECTURAS_PAGINA = 5000
+MAX_PUNTOS = 5000
+LTTB_FACTOR = 4  # LTTB trabaja sobre max_puntos * LTTB_FACTOR promedios calculados en SQL
+
+COLUMNAS_METRICA = {
+    "ph": "valor_ph",
+    "temperatura": "valor_temperatura",
+    "turbidez": "valor_turbidez",
+    "tds": "valor_conductividad",
+}
+
+
+async def obtener_dispositivo_visible(session: AsyncSession, mac: str, current_user) -> dispositivos:
+    """
+    Busca un dispositivo por MAC aplicando las reglas de propiedad de
+    listar_dispositivos: admin/operador ven todos, usuario solo los suyos.
+    """
+    stmt = select(dispositivos).where(dispositivos.mac == mac)
+    dispositivo = (await session.execute(stmt)).scalar_one_or_none()
+
+    if dispositivo is None:
+        logger.warning("Dispositivo no encontrado con MAC: %s", mac)
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dispositivo no encontrado.",
+        )
+
+    if current_user.rol not in ("admin", "operador") and dispositivo.id_usuario != current_user.id_usuario:
+        logger.warning("Usuario %s intentó acceder al dispositivo ajeno %s", current_user.id_usuario, mac)
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="No tiene permisos sobre este dispositivo.",
+        )
+    return dispositivo
+
+
+async def validar_perfil_umbral(session: AsyncSession, id_perfil: int | None) -> None:
+    if id_perfil is None:
+        return
+    existe = (await session.execute(
+        select(perfil_umbral.id_perfil).where(perfil_umbral.id_perfil == id_perfil)
+    )).scalar_one_or_none()
+    if existe is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El perfil de umbrales indicado no existe.",
+        )
+
+
+def hora_local(fecha: datetime | None) -> datetime | None:
+    """fecha_de_medicion se guarda en hora local sin zona: se convierte igual."""
+    if fecha is None or fecha.tzinfo is None:
+        return fecha
+    return fecha.astimezone().replace(tzinfo=None)
+
+
+def validar_rango(desde: datetime | None, hasta: datetime | None, defecto: timedelta, maximo: timedelta) -> tuple[datetime, datetime]:
+    desde, hasta = hora_local(desde), hora_local(hasta)
+    hasta = hasta or datetime.now()
+    desde = desde or (hasta - defecto)
+    if desde >= hasta:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El parámetro 'desde' debe ser anterior a 'hasta'.",
+        )
+    if hasta - desde > maximo:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"El rango consultado no puede superar {maximo.days} días.",
+        )
+    return desde, hasta
+
+
 @router.post("/", response_model=DispositivoRead, status_code=status.HTTP_201_CREATED)
 async def crear_dispositivo(
     data: DispositivoCreate,
@@ -40,6 +124,8 @@ async def crear_dispositivo(
             detail="Ya existe un dispositivo registrado con esa dirección MAC.",
         )
 
+    await validar_perfil_umbral(session, data.id_perfil_umbral)
+
     # 2) Generar device_key (secreto interno por dispositivo)
     device_key = uuid.uuid4().hex
 
@@ -75,13 +161,15 @@ async def crear_dispositivo(
         estado_dispositivo=1,
         device_key=device_key,
         id_padre=data.id_padre,
+        id_perfil_umbral=data.id_perfil_umbral,
     )
 
     session.add(nuevo_dispositivo)
     await session.commit()
     await session.refresh(nuevo_dispositivo)
-    
-    
+    # la MAC pudo quedar cacheada como "no registrada" en el worker
+    await notify_registry_change(macs=[nuevo_dispositivo.mac])
+
 
     logger.info(
         "Dispositivo creado: id=%s, mac=%s, usuario=%s",
@@ -121,7 +209,7 @@ async def obtener_dispositivo_por_mac(
 async def listar_dispositivos(
     skip: int = 0,
     limit: int = 50,
-    session: AsyncSession = Depends(get_db_session),
+    session: AsyncSession = Depends(get_read_db_session),
     current_user = Depends(get_current_user),
 ):
     """
@@ -169,14 +257,20 @@ async def actualizar_dispositivo(
             detail="Dispositivo no encontrado.",
         )
 
+    await validar_perfil_umbral(session, data.id_perfil_umbral)
+
     # Actualizar campos
     for var, value in vars(data).items():
         if value is not None:
             setattr(dispositivo, var, value)
+    # id_perfil_umbral: null explícito quita el perfil (vuelve a los umbrales globales)
+    if "id_perfil_umbral" in data.model_fields_set and data.id_perfil_umbral is None:
+        dispositivo.id_perfil_umbral = None
 
     session.add(dispositivo)
     await session.commit()
     await session.refresh(dispositivo)
+    await notify_registry_change(macs=[mac])
 
     logger.info("Dispositivo actualizado: id=%s, mac=%s", dispositivo.id_dispositivo, dispositivo.mac)
     return dispositivo
@@ -204,5 +298,171 @@ async def eliminar_dispositivo(
 
     await session.delete(dispositivo)
     await session.commit()
+    await notify_registry_change(macs=[mac])
 
-    logger.info("Dispositivo eliminado: mac=%s", mac)
\ No newline at end of file
+    logger.info("Dispositivo eliminado: mac=%s", mac)
+
+
+@router.get("/{mac}/resumen-horario", response_model=list[LecturaHoraRead])
+async def resumen_horario(
+    mac: str,
+    desde: datetime | None = None,
+    hasta: datetime | None = None,
+    session: AsyncSession = Depends(get_read_db_session),
+    current_user = Depends(get_current_user),
+):
+    """
+    Resumen por hora (min/max/promedio/cantidad) de un sensor, desde la
+    tabla pre-agregada lectura_hora. Por defecto las últimas 24 horas.
+    """
+    dispositivo = await obtener_dispositivo_visible(session, mac, current_user)
+    desde, hasta = validar_rango(desde, hasta, timedelta(hours=24), MAX_RANGO_RESUMEN)
+
+    stmt = (
+        select(lectura_hora)
+        .where(
+            lectura_hora.id_dispositivo == dispositivo.id_dispositivo,
+            lectura_hora.hora_inicio >= desde,
+            lectura_hora.hora_inicio < hasta,
+        )
+        .order_by(lectura_hora.hora_inicio)
+    )
+    filas = (await session.execute(stmt)).scalars().all()
+
+    logger.info("Resumen horario: mac=%s desde=%s hasta=%s filas=%d", mac, desde, hasta, len(filas))
+    return filas
+
+
+
+def _codificar_cursor(fecha: datetime, id_lectura: int) -> str:
+    raw = f"{fecha.isoformat()}|{id_lectura}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decodificar_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        fecha, id_lectura = raw.split("|")
+        return datetime.fromisoformat(fecha), int(id_lectura)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor inválido.",
+        )
+
+
+async def _promedios_por_intervalo(
+    session: AsyncSession,
+    id_dispositivo: int,
+    desde: datetime,
+    hasta: datetime,
+    puntos: int,
+) -> list:
+    """Agrupa en SQL las lecturas del rango en `puntos` intervalos de igual duración."""
+    intervalo = max(1, math.ceil((hasta - desde).total_seconds() / puntos))
+    # intervalos contados desde `desde` (no desde el epoch): así son a lo sumo `puntos`
+    bucket = func.floor(
+        (func.unix_timestamp(lectura.fecha_de_medicion) - func.unix_timestamp(desde)) / intervalo
+    ).label("intervalo")
+
+    stmt = (
+        select(
+            bucket,
+            func.min(lectura.fecha_de_medicion).label("fecha_de_medicion"),
+            func.avg(lectura.valor_ph).label("valor_ph"),
+            func.avg(lectura.valor_temperatura).label("valor_temperatura"),
+            func.avg(lectura.valor_turbidez).label("valor_turbidez"),
+            func.avg(lectura.valor_conductividad).label("valor_conductividad"),
+            func.count().label("cantidad"),
+        )
+        .where(
+            lectura.id_dispositivo == id_dispositivo,
+            lectura.fecha_de_medicion >= desde,
+            lectura.fecha_de_medicion < hasta,
+        )
+        .group_by(bucket.name)
+        .order_by(bucket.name)
+    )
+    return (await session.execute(stmt)).all()
+
+
+@router.get("/{mac}/lecturas", response_model=LecturaPage)
+async def listar_lecturas(
+    mac: str,
+    desde: datetime | None = None,
+    hasta: datetime | None = None,
+    limit: int = Query(1000, ge=1, le=MAX_LECTURAS_PAGINA),
+    cursor: str | None = None,
+    muestreo: Literal["ninguno", "promedio", "lttb"] = "ninguno",
+    max_puntos: int = Query(1000, ge=3, le=MAX_PUNTOS),
+    metrica: Literal["ph", "temperatura", "turbidez", "tds"] = "ph",
+    session: AsyncSession = Depends(get_read_db_session),
+    current_user = Depends(get_current_user),
+):
+    """
+    Lecturas de un sensor en un rango de tiempo (por defecto las últimas 24 horas).
+
+    - muestreo=ninguno: lecturas crudas, paginadas por cursor sobre
+      (fecha_de_medicion, id_lectura); usar `siguiente` como `cursor`.
+    - muestreo=promedio: como máximo `max_puntos` promedios por intervalo.
+    - muestreo=lttb: `max_puntos` puntos elegidos con LTTB según `metrica`,
+      sobre promedios pre-calculados en SQL para no traer todas las filas.
+    """
+    dispositivo = await obtener_dispositivo_visible(session, mac, current_user)
+    desde, hasta = validar_rango(desde, hasta, timedelta(hours=24), MAX_RANGO_RESUMEN)
+
+    if muestreo != "ninguno":
+        puntos = max_puntos * LTTB_FACTOR if muestreo == "lttb" else max_puntos
+        filas = await _promedios_por_intervalo(session, dispositivo.id_dispositivo, desde, hasta, puntos)
+
+        if muestreo == "lttb" and len(filas) > max_puntos:
+            columna = COLUMNAS_METRICA[metrica]
+            xs = [f.fecha_de_medicion.timestamp() for f in filas]
+            ys = [float(getattr(f, columna)) for f in filas]
+            filas = [filas[i] for i in lttb(xs, ys, max_puntos)]
+
+        logger.info(
+            "Lecturas muestreadas: mac=%s muestreo=%s desde=%s hasta=%s puntos=%d",
+            mac, muestreo, desde, hasta, len(filas),
+        )
+        return LecturaPage(
+            lecturas=[LecturaRead.model_validate(f) for f in filas],
+            muestreo=muestreo,
+        )
+
+    stmt = (
+        select(
+            lectura.id_lectura,
+            lectura.fecha_de_medicion,
+            lectura.valor_ph,
+            lectura.valor_temperatura,
+            lectura.valor_turbidez,
+            lectura.valor_conductividad,
+        )
+        .where(
+            lectura.id_dispositivo == dispositivo.id_dispositivo,
+            lectura.fecha_de_medicion >= desde,
+            lectura.fecha_de_medicion < hasta,
+        )
+    )
+    if cursor is not None:
+        # keyset: continuar justo después de la última fila entregada
+        c_fecha, c_id = _decodificar_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(lectura.fecha_de_medicion, lectura.id_lectura) > tuple_(c_fecha, c_id)
+        )
+    stmt = stmt.order_by(lectura.fecha_de_medicion, lectura.id_lectura).limit(limit + 1)
+
+    filas = (await session.execute(stmt)).all()
+    siguiente = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        ultima = filas[-1]
+        siguiente = _codificar_cursor(ultima.fecha_de_medicion, ultima.id_lectura)
+
+    logger.info("Lecturas: mac=%s desde=%s hasta=%s filas=%d", mac, desde, hasta, len(filas))
+    return LecturaPage(
+        lecturas=[LecturaRead.model_validate(f) for f in filas],
+        siguiente=siguiente,
+        muestreo=muestreo,
+    )
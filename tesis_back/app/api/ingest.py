@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import time
+import zlib
+import paho.mqtt.publish as mqtt_publish
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.database.session import get_db_session
+from app.models.dispositivos import dispositivos
+from app.models.enums import DeviceRole
+from app.mqtt.codec import CodecError, decode_batch, encode, encode_batch, is_binary
+from app.mqtt.parsing import BINARY_TOPIC_SUFFIX, device_ts_valid, parse_payload, parse_topic
+from app.schemas.lecturas import IngestaResultado, LoteIngesta
+from app.utils.metrics import Counter
+
+router = APIRouter(
+    prefix="/ingest",
+    tags=["ingest"],
+)
+
+logger = logging.getLogger(__name__)
+
+INGEST_HTTP_READINGS = Counter("ingest_http_readings_total", "Lecturas recibidas por POST /ingest/batch", ["result"])
+
+BINARY_CONTENT_TYPE = "application/octet-stream"
+_lote = TypeAdapter(LoteIngesta)
+
+
+async def _leer_cuerpo(request: Request) -> bytes:
+    """Cuerpo completo (descomprimido si viene en gzip), con límites de tamaño."""
+    demasiado_grande = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail="El lote supera el tamaño máximo permitido.",
+    )
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > settings.INGEST_MAX_BODY_BYTES:
+        raise demasiado_grande
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > settings.INGEST_MAX_BODY_BYTES:
+            raise demasiado_grande
+
+    if request.headers.get("content-encoding", "").lower() != "gzip":
+        return bytes(body)
+    # descompresión acotada: un gzip pequeño puede expandirse a gigabytes
+    d = zlib.decompressobj(31)
+    try:
+        data = d.decompress(body, settings.INGEST_MAX_DECOMPRESSED_BYTES)
+    except zlib.error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="gzip inválido.")
+    if d.unconsumed_tail:
+        raise demasiado_grande
+    return data
+
+
+def _entradas_json(body: bytes, mac_gw: str) -> tuple[dict[str, list[tuple[str, bytes]]], int]:
+    """{mac_esp: [(topic, payload binario)]} a partir del JSON compacto."""
+    try:
+        lote = _lote.validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=e.errors(include_url=False, include_context=False, include_input=False)[:10],
+        )
+    por_sensor: dict[str, list[tuple[str, bytes]]] = {}
+    invalidas = 0
+    now = time.time()
+    max_age = settings.DEVICE_TS_BATCH_MAX_AGE_SECONDS
+    for mac_esp, ts, ph, temperatura, turbidez, tds in lote["lecturas"]:
+        if ts is not None and not device_ts_valid(ts, now, max_age):
+            invalidas += 1
+            continue
+        entradas = por_sensor.get(mac_esp)
+        if entradas is None:
+            entradas = por_sensor[mac_esp] = []
+            topic = f"gateways/{mac_gw}/sensors/{mac_esp}/telemetry{BINARY_TOPIC_SUFFIX}"
+        else:
+            topic = entradas[0][0]
+        # mismo formato que publican los sensores en <topic>/bin (app.mqtt.codec)
+        entradas.append((topic, encode(ph, temperatura, turbidez, tds, timestamp=ts)))
+    return por_sensor, invalidas
+
+
+def _entradas_binario(body: bytes, mac_gw: str) -> tuple[dict[str, list[tuple[str, bytes]]], int]:
+    """{mac_esp: [(topic, payload)]} a partir de un lote binario (codec.encode_batch)."""
+    try:
+        entries = decode_batch(body)
+    except CodecError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Lote binario inválido: {e}")
+    por_sensor: dict[str, list[tuple[str, bytes]]] = {}
+    invalidas = 0
+    now = time.time()
+    max_age = settings.DEVICE_TS_BATCH_MAX_AGE_SECONDS
+    for topic, payload in entries:
+        macs = parse_topic(topic)
+        if macs is None or macs[0] != mac_gw:
+            invalidas += 1
+            continue
+        try:
+            _, ts, _ = parse_payload(payload, macs[2] or is_binary(payload))
+        except (ValidationError, CodecError):
+            invalidas += 1
+            continue
+        if ts is not None and not device_ts_valid(ts, now, max_age):
+            invalidas += 1
+            continue
+        por_sensor.setdefault(macs[1], []).append((topic, payload))
+    return por_sensor, invalidas
+
+
+def _publicar(topic: str, lotes: list[bytes]) -> None:
+    mqtt_publish.multiple(
+        [{"topic": topic, "payload": lote, "qos": 1} for lote in lotes],
+        hostname=settings.MQTT_BROKER,
+        port=settings.MQTT_PORT,
+    )
+
+
+@router.post(
+    "/batch",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=IngestaResultado,
+)
+async def ingestar_lote(
+    request: Request,
+    x_device_key: str = Header(...),
+    session: AsyncSession = Depends(get_db_session),
+):
+    """
+    Ingesta por lotes de un gateway, para enlaces de alta latencia.
+
+    - Autenticación: encabezado X-Device-Key con el device_key del gateway.
+    - Cuerpo JSON compacto {"lecturas": [[mac_esp, ts, ph, temperatura, turbidez, tds], ...]}
+      o binario (Content-Type: application/octet-stream) con el formato de
+      lotes del bridge (app.mqtt.codec.encode_batch). Content-Encoding: gzip opcional.
+    - Se rechazan las lecturas de sensores que no son hijos del gateway y las
+      de ts adelantado o más viejo que DEVICE_TS_BATCH_MAX_AGE_SECONDS; el
+      resto se publica al worker MQTT como lotes del bridge, así pasan por la
+      misma persistencia, resumen horario, tiempo real y alertas.
+    """
+    if not settings.MQTT_BATCH_TOPIC:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ingesta por lotes deshabilitada (MQTT_BATCH_TOPIC vacío).",
+        )
+
+    # 1) Autenticar el gateway por su device_key
+    gateway = (await session.execute(
+        select(dispositivos.id_dispositivo, dispositivos.mac).where(
+            dispositivos.device_key == x_device_key,
+            dispositivos.rol_dispositivo == DeviceRole.gateway,
+        )
+    )).one_or_none()
+    if gateway is None:
+        logger.warning("Ingesta por lotes con device_key inválido")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="device_key inválido.",
+        )
+
+    # 2) Decodificar el lote
+    body = await _leer_cuerpo(request)
+    if request.headers.get("content-type", "").startswith(BINARY_CONTENT_TYPE):
+        por_sensor, rechazadas = _entradas_binario(body, gateway.mac)
+    else:
+        por_sensor, rechazadas = _entradas_json(body, gateway.mac)
+    total = sum(len(e) for e in por_sensor.values()) + rechazadas
+    if total > settings.INGEST_MAX_READINGS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"El lote supera {settings.INGEST_MAX_READINGS} lecturas.",
+        )
+
+    # 3) Validar gateway -> sensores con una sola consulta
+    validos = set()
+    if por_sensor:
+        validos = set((await session.execute(
+            select(dispositivos.mac).where(
+                dispositivos.mac.in_(list(por_sensor)),
+                dispositivos.id_padre == gateway.id_dispositivo,
+                dispositivos.rol_dispositivo == DeviceRole.sensor,
+            )
+        )).scalars().all())
+    invalidos = sorted(set(por_sensor) - validos)
+
+    entradas = []
+    for mac_esp, lecturas in por_sensor.items():
+        if mac_esp in validos:
+            entradas.extend(lecturas)
+        else:
+            rechazadas += len(lecturas)
+
+    # 4) Publicar al worker en lotes del bridge (en orden por sensor)
+    chunk = settings.INGEST_FORWARD_CHUNK
+    lotes = [encode_batch(entradas[i:i + chunk]) for i in range(0, len(entradas), chunk)]
+    if lotes:
+        topic = settings.MQTT_BATCH_TOPIC.replace("+", gateway.mac)
+        try:
+            await asyncio.to_thread(_publicar, topic, lotes)
+        except Exception as e:
+            logger.error("No se pudo publicar el lote del gateway %s err=%s", gateway.mac, e)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Broker MQTT no disponible, reintente.",
+                headers={"Retry-After": "5"},
+            )
+
+    INGEST_HTTP_READINGS.labels("accepted").inc(len(entradas))
+    INGEST_HTTP_READINGS.labels("rejected").inc(rechazadas)
+    logger.info(
+        "Ingesta por lotes gateway=%s aceptadas=%d rechazadas=%d sensores_invalidos=%d mensajes=%d",
+        gateway.mac, len(entradas), rechazadas, len(invalidos), len(lotes),
+    )
+    return IngestaResultado(
+        aceptadas=len(entradas),
+        rechazadas=rechazadas,
+        sensores_invalidos=invalidos,
+        mensajes=len(lotes),
+    )
@@ -0,0 +1,165 @@
+import csv
+import io
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta
+from typing import Literal
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.device import obtener_dispositivo_visible, validar_rango
+from app.database.session import AsyncReadSessionLocal, get_read_db_session
+from app.models.dispositivos import dispositivos
+from app.models.lectura import lectura
+from app.utils.security import get_current_user
+
+router = APIRouter(
+    prefix="/lecturas",
+    tags=["lecturas"],
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_RANGO_EXPORT = timedelta(days=366)
+EXPORT_CHUNK = 2000  # filas que se traen del cursor del servidor por vez
+
+COLUMNAS = (
+    "mac",
+    "id_lectura",
+    "fecha_de_medicion",
+    "valor_ph",
+    "valor_temperatura",
+    "valor_turbidez",
+    "valor_conductividad",
+)
+
+
+async def _particiones(stmt):
+    """
+    Recorre el resultado con un cursor del lado del servidor (stream_results),
+    de a EXPORT_CHUNK filas. Abre su propia sesión porque el cuerpo de la
+    respuesta se genera después de que termina el endpoint.
+    """
+    async with AsyncReadSessionLocal() as session:
+        result = await session.stream(stmt.execution_options(yield_per=EXPORT_CHUNK))
+        async for filas in result.partitions():
+            yield filas
+
+
+def _csv_chunk(filas, con_encabezado: bool) -> bytes:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if con_encabezado:
+        writer.writerow(COLUMNAS)
+    for f in filas:
+        writer.writerow((
+            f.mac, f.id_lectura, f.fecha_de_medicion.isoformat(),
+            f.valor_ph, f.valor_temperatura, f.valor_turbidez, f.valor_conductividad,
+        ))
+    return buf.getvalue().encode("utf-8")
+
+
+def _ndjson_chunk(filas) -> bytes:
+    lineas = [
+        json.dumps({
+            "mac": f.mac,
+            "id_lectura": f.id_lectura,
+            "fecha_de_medicion": f.fecha_de_medicion.isoformat(),
+            "valor_ph": float(f.valor_ph),
+            "valor_temperatura": float(f.valor_temperatura),
+            "valor_turbidez": float(f.valor_turbidez),
+            "valor_conductividad": float(f.valor_conductividad),
+        }, separators=(",", ":"))
+        for f in filas
+    ]
+    return ("\n".join(lineas) + "\n").encode("utf-8")
+
+
+async def _cuerpo(stmt, formato: str, comprimir: bool):
+    # wbits=31: formato gzip (no zlib crudo), comprimido a medida que se genera
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+    primero = True
+    total = 0
+
+    async for filas in _particiones(stmt):
+        total += len(filas)
+        chunk = _csv_chunk(filas, primero) if formato == "csv" else _ndjson_chunk(filas)
+        primero = False
+        if gz is not None:
+            chunk = gz.compress(chunk)
+            if not chunk:
+                continue
+        yield chunk
+
+    if formato == "csv" and primero:
+        # sin filas: igual se entrega el encabezado
+        chunk = _csv_chunk((), True)
+        yield gz.compress(chunk) if gz is not None else chunk
+    if gz is not None:
+        yield gz.flush()
+
+    logger.info("Exportación terminada: formato=%s gzip=%s filas=%d", formato, comprimir, total)
+
+
+@router.get("/export")
+async def exportar_lecturas(
+    mac: str | None = None,
+    desde: datetime | None = None,
+    hasta: datetime | None = None,
+    formato: Literal["csv", "ndjson"] = "csv",
+    gzip: bool = False,
+    session: AsyncSession = Depends(get_read_db_session),
+    current_user = Depends(get_current_user),
+):
+    """
+    Exporta lecturas en CSV o NDJSON (opcionalmente gzip), en streaming:
+    la memoria usada no depende de la cantidad de filas.
+    - mac: un dispositivo puntual; sin mac, todos los visibles.
+    - admin/operador: cualquier dispositivo; usuario: solo los suyos.
+    """
+    desde, hasta = validar_rango(desde, hasta, timedelta(hours=24), MAX_RANGO_EXPORT)
+
+    stmt = (
+        select(
+            dispositivos.mac,
+            lectura.id_lectura,
+            lectura.fecha_de_medicion,
+            lectura.valor_ph,
+            lectura.valor_temperatura,
+            lectura.valor_turbidez,
+            lectura.valor_conductividad,
+        )
+        .join(dispositivos, dispositivos.id_dispositivo == lectura.id_dispositivo)
+        .where(
+            lectura.fecha_de_medicion >= desde,
+            lectura.fecha_de_medicion < hasta,
+        )
+    )
+
+    if mac is not None:
+        dispositivo = await obtener_dispositivo_visible(session, mac, current_user)
+        stmt = stmt.where(lectura.id_dispositivo == dispositivo.id_dispositivo)
+        stmt = stmt.order_by(lectura.fecha_de_medicion, lectura.id_lectura)
+    else:
+        if current_user.rol not in ("admin", "operador"):
+            stmt = stmt.where(dispositivos.id_usuario == current_user.id_usuario)
+        stmt = stmt.order_by(lectura.id_dispositivo, lectura.fecha_de_medicion, lectura.id_lectura)
+
+    logger.info(
+        "Exportando lecturas: rol=%s user_id=%s mac=%s desde=%s hasta=%s formato=%s gzip=%s",
+        current_user.rol, current_user.id_usuario, mac, desde, hasta, formato, gzip,
+    )
+
+    nombre = f"lecturas_{desde:%Y%m%d%H%M}_{hasta:%Y%m%d%H%M}.{formato}"
+    media_type = "text/csv" if formato == "csv" else "application/x-ndjson"
+    if gzip:
+        nombre += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        _cuerpo(stmt, formato, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+    )
@@ -0,0 +1,89 @@
+import asyncio
+import logging
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.device import obtener_dispositivo_visible
+from app.database.session import AsyncSessionLocal, get_db_session
+from app.models.dispositivos import dispositivos
+from app.service.live_hub import live_hub
+from app.utils.security import get_current_user, get_user_from_token
+
+router = APIRouter(
+    prefix="/live",
+    tags=["live"],
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def mac_gateway(session: AsyncSession, dispositivo: dispositivos) -> str | None:
+    if dispositivo.id_padre is None:
+        return None
+    return (await session.execute(
+        select(dispositivos.mac).where(dispositivos.id_dispositivo == dispositivo.id_padre)
+    )).scalar_one_or_none()
+
+
+@router.websocket("/dispositivos/{mac}")
+async def live_dispositivo(websocket: WebSocket, mac: str, token: str):
+    """
+    Telemetría en vivo de un sensor por WebSocket.
+    - Autenticación: ?token=<JWT> (mismas reglas de propiedad que GET /dispositivos/{mac}/lecturas).
+    - Primero se envía la ventana de los últimos minutos y luego cada lectura nueva.
+    """
+    async with AsyncSessionLocal() as session:
+        try:
+            current_user = await get_user_from_token(token, session)
+            dispositivo = await obtener_dispositivo_visible(session, mac, current_user)
+        except HTTPException as e:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+            return
+        mac_gw = await mac_gateway(session, dispositivo)
+
+    await websocket.accept()
+    await live_hub.backfill(mac, mac_gw, dispositivo.id_dispositivo)
+    sub = live_hub.subscribe(mac)
+    logger.info("[LIVE] Conexión abierta mac=%s user_id=%s", mac, current_user.id_usuario)
+
+    async def enviar():
+        while True:
+            await websocket.send_text(await sub.get())
+
+    async def esperar_cierre():
+        # el cliente no manda nada; esto solo detecta la desconexión
+        while True:
+            await websocket.receive_text()
+
+    tareas = [asyncio.create_task(enviar()), asyncio.create_task(esperar_cierre())]
+    try:
+        await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for t in tareas:
+            t.cancel()
+        live_hub.unsubscribe(sub)
+        logger.info("[LIVE] Conexión cerrada mac=%s descartados=%d", mac, sub.dropped)
+
+
+@router.get("/dispositivos/{mac}/estadisticas")
+async def estadisticas_ventana(
+    mac: str,
+    session: AsyncSession = Depends(get_db_session),
+    current_user = Depends(get_current_user),
+):
+    """
+    mean/min/max y pendiente (por minuto) de cada métrica en la ventana en
+    vivo, calculadas por el worker sobre su ring buffer.
+    - 503 si el worker no responde.
+    """
+    dispositivo = await obtener_dispositivo_visible(session, mac, current_user)
+    mac_gw = await mac_gateway(session, dispositivo)
+    snap = await live_hub.snapshot(mac, mac_gw, stats=True)
+    if snap is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El worker no respondió.",
+        )
+    return {"mac": mac, "lecturas": len(snap["rows"]), "estadisticas": snap["stats"] or {}}
@@ -0,0 +1,152 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database.session import get_db_session, get_read_db_session
+from app.models.dispositivos import dispositivos
+from app.models.perfil_umbral import perfil_umbral
+from app.schemas.perfiles import PerfilUmbralCreate, PerfilUmbralRead, PerfilUmbralUpdate
+from app.service.registry_events import notify_threshold_change
+from app.utils.security import get_current_user, require_role
+
+router = APIRouter(
+    prefix="/perfiles-umbral",
+    tags=["perfiles-umbral"],
+)
+
+logger = logging.getLogger(__name__)
+
+
+def validar_limites(perfil: perfil_umbral) -> None:
+    for campo in ("ph", "temperatura"):
+        minimo = getattr(perfil, f"{campo}_min")
+        maximo = getattr(perfil, f"{campo}_max")
+        if minimo is not None and maximo is not None and minimo >= maximo:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{campo}_min debe ser menor que {campo}_max.",
+            )
+
+
+async def obtener_perfil(session: AsyncSession, id_perfil: int) -> perfil_umbral:
+    perfil = await session.get(perfil_umbral, id_perfil)
+    if perfil is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Perfil de umbrales no encontrado.",
+        )
+    return perfil
+
+
+async def validar_nombre(session: AsyncSession, nombre: str, id_perfil: int | None = None) -> None:
+    stmt = select(perfil_umbral.id_perfil).where(perfil_umbral.nombre == nombre)
+    existente = (await session.execute(stmt)).scalar_one_or_none()
+    if existente is not None and existente != id_perfil:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Ya existe un perfil de umbrales con ese nombre.",
+        )
+
+
+@router.post("/", response_model=PerfilUmbralRead, status_code=status.HTTP_201_CREATED)
+async def crear_perfil(
+    data: PerfilUmbralCreate,
+    session: AsyncSession = Depends(get_db_session),
+    current_user=Depends(require_role("admin", "operador")),
+):
+    """
+    Crea un perfil de umbrales de alerta. Se asigna a un gateway (rige para
+    todos sus sensores) o a un sensor con id_perfil_umbral en /dispositivos.
+    """
+    await validar_nombre(session, data.nombre)
+    perfil = perfil_umbral(**data.model_dump())
+    validar_limites(perfil)
+
+    session.add(perfil)
+    await session.commit()
+    await session.refresh(perfil)
+    # el worker lo carga antes de que se asigne a un dispositivo
+    await notify_threshold_change(perfil.id_perfil)
+
+    logger.info("Perfil de umbrales creado: id=%s nombre=%s", perfil.id_perfil, perfil.nombre)
+    return perfil
+
+
+@router.get("/", response_model=list[PerfilUmbralRead])
+async def listar_perfiles(
+    session: AsyncSession = Depends(get_read_db_session),
+    current_user=Depends(get_current_user),
+):
+    """
+    Lista los perfiles de umbrales.
+    """
+    result = await session.execute(select(perfil_umbral).order_by(perfil_umbral.id_perfil))
+    return result.scalars().all()
+
+
+@router.get("/{id_perfil}", response_model=PerfilUmbralRead)
+async def obtener_perfil_por_id(
+    id_perfil: int,
+    session: AsyncSession = Depends(get_db_session),
+    current_user=Depends(get_current_user),
+):
+    """
+    Obtiene un perfil de umbrales por su id.
+    """
+    return await obtener_perfil(session, id_perfil)
+
+
+@router.patch("/{id_perfil}", response_model=PerfilUmbralRead)
+async def actualizar_perfil(
+    id_perfil: int,
+    data: PerfilUmbralUpdate,
+    session: AsyncSession = Depends(get_db_session),
+    current_user=Depends(require_role("admin", "operador")),
+):
+    """
+    Actualiza solo los campos enviados (null quita el límite). El worker MQTT
+    recarga los perfiles sin reiniciar.
+    """
+    perfil = await obtener_perfil(session, id_perfil)
+    cambios = data.model_dump(exclude_unset=True)
+    if cambios.get("nombre") is None:
+        cambios.pop("nombre", None)
+    else:
+        await validar_nombre(session, cambios["nombre"], id_perfil)
+
+    for var, value in cambios.items():
+        setattr(perfil, var, value)
+    validar_limites(perfil)
+
+    await session.commit()
+    await session.refresh(perfil)
+    await notify_threshold_change(id_perfil)
+
+    logger.info("Perfil de umbrales actualizado: id=%s campos=%s", id_perfil, sorted(cambios))
+    return perfil
+
+
+@router.delete("/{id_perfil}", status_code=status.HTTP_204_NO_CONTENT)
+async def eliminar_perfil(
+    id_perfil: int,
+    session: AsyncSession = Depends(get_db_session),
+    current_user=Depends(require_role("admin")),
+):
+    """
+    Elimina un perfil que no esté asignado a ningún dispositivo.
+    """
+    perfil = await obtener_perfil(session, id_perfil)
+    en_uso = (await session.execute(
+        select(dispositivos.mac).where(dispositivos.id_perfil_umbral == id_perfil).limit(1)
+    )).scalar_one_or_none()
+    if en_uso is not None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="El perfil está asignado a dispositivos; reasígnelos antes de eliminarlo.",
+        )
+
+    await session.delete(perfil)
+    await session.commit()
+    await notify_threshold_change(id_perfil)
+
+    logger.info("Perfil de umbrales eliminado: id=%s", id_perfil)
@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from app.database.session import get_db_session
+from app.database.session import get_db_session, get_read_db_session
 from app.schemas.user import UserCreate, UserRead, changePasswordSchema
 from app.models.usuarios import usuarios
 import logging
-from app.utils.security import get_current_user, hash_password, verify_password, require_role
+from app.utils.security import get_current_user, require_role
+from app.utils.passwords import password_pool
+from app.service.registry_events import notify_registry_change
+from app.service.principal_cache import principal_cache
 
 router = APIRouter(
     prefix="/usuarios",
@@ -62,7 +65,7 @@ async def create_user(
         correo=user_in.correo,
         celular=user_in.celular,
         rol=user_in.rol,
-        password_hash=hash_password(user_in.password),
+        password_hash=await password_pool.hash(user_in.password),
         estado_cuenta=True,
     )
 
@@ -99,7 +102,7 @@ async def list_users(
     skip: int = 0,
     limit: int = 50,
     solo_activos: bool = True,
-    session: AsyncSession = Depends(get_db_session),
+    session: AsyncSession = Depends(get_read_db_session),
     current_user=Depends(require_role("admin", "operador")),
 ):
     stmt = select(usuarios)
@@ -175,6 +178,9 @@ async def update_user(
 
     await session.commit()
     await session.refresh(user)
+    principal_cache.invalidate_user(user_id)
+    # el worker cachea el correo del dueño de cada sensor
+    await notify_registry_change(id_usuario=user_id)
 
     return user
 
@@ -219,6 +225,8 @@ async def delete_user(
 
     user.estado_cuenta = False
     await session.commit()
+    principal_cache.invalidate_user(user_id)
+    await notify_registry_change(id_usuario=user_id)
     return
 
 
@@ -241,14 +249,15 @@ async def change_password(
         )
 
     # 2) Verificar contraseña actual
-    if not verify_password(data.current_password, user.password_hash):
+    if not await password_pool.verify(data.current_password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Contraseña actual incorrecta.",
         )
 
     # 3) Hashear y guardar nueva contraseña
-    user.password_hash = hash_password(data.new_password)
+    user.password_hash = await password_pool.hash(data.new_password)
 
     await session.commit()
+    principal_cache.invalidate_user(user.id_usuario)
     return
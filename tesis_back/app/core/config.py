@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 BASE_DIR = Path(__file__).resolve().parents[1]
@@ -12,7 +13,22 @@ class Settings(BaseSettings):
     DB_NAME: str
     DB_USER: str
     DB_PASSWORD: str
+    DATABASE_URL: str = "" # si se define reemplaza a DB_* (p.ej. sqlite+aiosqlite:///bench.db en benchmarks)
+    DB_READ_REPLICA_URL: str = "" # URL SQLAlchemy de una réplica para listados, series y exportaciones
     
+    #Pool de conexiones (app/database/session.py)
+    DB_PROCESS_ROLE: Literal["", "api", "worker"] = "" # vacío = según el proceso (python -m app.mqtt.* es worker)
+    DB_POOL_SIZE_API: int = 10 # por proceso de uvicorn
+    DB_MAX_OVERFLOW_API: int = 10
+    DB_POOL_TIMEOUT_API: float = 10 # espera máxima por una conexión libre
+    DB_POOL_RECYCLE_API: int = 1800 # menor que el wait_timeout de MySQL y de proxies/NAT intermedios
+    DB_POOL_SIZE_WORKER: int = 4 # writer, rollup, registry y heartbeat
+    DB_MAX_OVERFLOW_WORKER: int = 2
+    DB_POOL_TIMEOUT_WORKER: float = 30
+    DB_POOL_RECYCLE_WORKER: int = 1800
+    DB_POOL_PRE_PING: bool = False # True vuelve al ping en cada checkout
+    DB_POOL_PING_IDLE_SECONDS: float = 60 # sin pre-ping solo se verifica una conexión ociosa más que esto
+
     #MQTT
     MQTT_BROKER: str
     MQTT_PORT: int
@@ -28,17 +44,112 @@ class Settings(BaseSettings):
         env_file_encoding="utf-8",
     )
     #Telemetria
-    PH_MIN: float
+    PH_MIN: float # límites globales: rigen para los dispositivos sin perfil_umbral
     PH_MAX: float
     TURB_MAX: float
     TDS_MAX: float
     ALERT_COOLDOWN_MINUTES: int
+    THRESHOLD_PROFILES_REFRESH_SECONDS: float = 300 # recarga periódica de perfil_umbral en el worker, además de la recarga por evento
+    ALERT_RULES_BATCH_SIZE: int = 256 # lecturas evaluadas juntas como máximo (se evalúa antes si la cola se vacía)
     
+    #Hash de contraseñas (app/utils/passwords.py)
+    PASSWORD_HASH_EXECUTOR: Literal["process", "thread"] = "process"
+    PASSWORD_HASH_WORKERS: int = 0 # 0 = min(4, núcleos); también es el máximo de bcrypt en paralelo
+    PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS: float = 2 # espera máxima por un lugar en el pool; si no, 503
+    PASSWORD_HASH_MAX_WAITING: int = 100 # con más pedidos esperando se responde 503 de inmediato
+
+    #Cache de autenticación (app/service/principal_cache.py)
+    AUTH_PRINCIPAL_TTL_SECONDS: float = 30 # usuario autenticado en memoria; 0 consulta la base en cada petición
+    AUTH_CACHE_MAX_ENTRIES: int = 10000 # tokens y usuarios (LRU)
+
+    #Ingesta HTTP por lotes (POST /ingest/batch)
+    INGEST_MAX_BODY_BYTES: int = 10_000_000 # cuerpo tal como llega (comprimido o no)
+    INGEST_MAX_DECOMPRESSED_BYTES: int = 50_000_000 # tope al descomprimir gzip
+    INGEST_MAX_READINGS: int = 100000 # lecturas por petición
+    INGEST_FORWARD_CHUNK: int = 1000 # lecturas por lote MQTT publicado al worker
+
+    #Logging
+    LOG_CONSOLE_LEVEL: str = "INFO"
+    LOG_FILE_LEVEL: str = "INFO" # DEBUG agrega las líneas por mensaje del worker (solo para diagnóstico)
+    LOG_FILE_MAX_BYTES: int = 10_000_000 # rotación de logs/app.log
+    LOG_FILE_BACKUPS: int = 5
+    LOG_ASYNC: bool = True # handlers en un hilo aparte (QueueHandler + QueueListener)
+    LOG_QUEUE_MAXSIZE: int = 100000 # con la cola llena se descartan logs en lugar de bloquear
+    LOG_RATE_LIMIT_PER_SECOND: float = 20 # por tipo de mensaje; 0 lo desactiva
+    LOG_RATE_LIMIT_BURST: int = 100
+    LOG_RATE_LIMITED_LOGGERS: str = "app.mqtt" # prefijos de logger separados por coma
+
     #Correo
     SMTP_HOST: str
     SMTP_PORT: int
     SMTP_USER: str
     SMTP_PASSWORD: str
     SMTP_FROM_NAME: str
+    SMTP_STARTTLS: bool = True # False para un servidor SMTP local de pruebas
+    SMTP_TIMEOUT_SECONDS: float = 15
+    SMTP_IDLE_CHECK_SECONDS: float = 60 # tras este tiempo sin uso se verifica la sesión con NOOP
+
+    #Despacho de alertas (worker MQTT)
+    ALERT_BATCH_WINDOW_SECONDS: float = 5 # alertas de la misma ventana van en un solo correo por destinatario
+    ALERT_MAX_RETRIES: int = 5
+    ALERT_RETRY_BASE_SECONDS: float = 2 # backoff exponencial: 2, 4, 8... (máx. 60 s)
+    ALERT_OUTBOX_MAXSIZE: int = 10000
+
+    #Persistencia de lecturas (worker MQTT)
+    LECTURA_BATCH_SIZE: int = 500 # filas por INSERT multi-fila
+    LECTURA_FLUSH_INTERVAL_SECONDS: float = 1.0 # tiempo máximo que una lectura espera en memoria
+    LECTURA_MAX_PENDING: int = 50000 # tope de filas pendientes si la base no responde
+    ROLLUP_FLUSH_INTERVAL_SECONDS: float = 60 # cierre de horas terminadas (también de sensores inactivos)
+    ROLLUP_MAX_PENDING: int = 200000
+
+    #Cache de registro de dispositivos (worker MQTT)
+    REGISTRY_CACHE_TTL_SECONDS: float = 300
+    REGISTRY_NEGATIVE_TTL_SECONDS: float = 60 # MACs no registradas / relaciones inválidas
+    REGISTRY_CACHE_MAX_ENTRIES: int = 50000
+    MQTT_CONTROL_TOPIC: str = "control/registry" # la API publica aquí las invalidaciones
+    MQTT_EDGE_LIMITS_TOPIC: str = "control/edge-limits" # el worker publica (retained) los límites para el borde; vacío lo desactiva
+
+    #Heartbeat y dispositivos sin reportar (app/mqtt/heartbeat.py)
+    HEARTBEAT_ENABLED: bool = True
+    HEARTBEAT_FLUSH_INTERVAL_SECONDS: float = 30 # dispositivos.ultimo_heartbeat se escribe en lote cada este tiempo
+    HEARTBEAT_FLUSH_CHUNK: int = 1000 # ids por UPDATE ... CASE
+    DEVICE_HEARTBEAT_INTERVAL_SECONDS: float = 60 # intervalo esperado de reporte (ancho de slot de la rueda)
+    DEVICE_OFFLINE_MISSED_INTERVALS: int = 3 # intervalos sin mensajes para considerar offline (> EDGE_MAX_INTERVAL con bridge)
+
+    #Payload binario de telemetría (app/mqtt/codec.py)
+    MQTT_BINARY_TOPIC_ENABLED: bool = True # suscribirse también a <MQTT_TOPIC>/bin
+    DEVICE_TS_MAX_SKEW_SECONDS: float = 300 # fuera de este margen se usa la hora de recepción
+    DEVICE_TS_MAX_AGE_SECONDS: float = 300 # antigüedad máxima aceptada en mensajes sueltos
+    DEVICE_TS_BATCH_MAX_AGE_SECONDS: float = 604800 # en lotes (spool del bridge, POST /ingest/batch); más viejas se rechazan
+    MQTT_BATCH_TOPIC: str = "bridge/+/batch" # lotes del bridge de la Raspberry; vacío lo desactiva
+    MQTT_SUMMARY_TOPIC: str = "gateways/+/sensors/+/summary" # resúmenes del bridge (EDGE_ENABLED); vacío lo desactiva
+
+    #Pool de consumers (worker MQTT)
+    WORKER_CONSUMERS: int = 4 # shards; cada sensor siempre cae en el mismo
+    WORKER_STATS_INTERVAL_SECONDS: float = 60
+    WORKER_METRICS_PORT: int = 9101 # GET /metrics del worker; 0 lo desactiva
+    WORKER_METRICS_HOST: str = "127.0.0.1"
+    INGEST_QUEUE_MAXSIZE: int = 10000 # por shard
+    INGEST_QUEUE_POLICY: Literal["block", "drop_oldest", "coalesce"] = "drop_oldest"
+    INGEST_QUEUE_BLOCK_TIMEOUT_SECONDS: float = 30 # política block: espera máxima antes de descartar la lectura
+
+    #Multi-proceso (python -m app.mqtt.launcher)
+    WORKER_PROCESSES: int = 0 # 0 = uno por núcleo; cada sensor (hash de mac_esp) pertenece a un solo proceso
+    WORKER_RESTART_BACKOFF_SECONDS: float = 2 # espera antes de relanzar un proceso caído (se duplica, máx. 60 s)
+
+    #Telemetría en vivo (worker -> API por MQTT)
+    LIVE_PUBLISH_ENABLED: bool = True
+    MQTT_LIVE_TOPIC_PREFIX: str = "live" # el worker publica en live/<mac_esp>
+    LIVE_WINDOW_MINUTES: int = 10
+    LIVE_CLIENT_BUFFER: int = 1000 # eventos por conexión antes de descartar los más viejos
+    REALTIME_BUFFER_CAPACITY: int = 320 # lecturas por sensor en la ventana del worker (10 min a 1 cada 2 s + margen)
+    MQTT_LIVE_SNAPSHOT_TOPIC: str = "control/live-snapshot" # la API pide aquí la ventana al worker (responde en <topic>/reply/<id>); vacío usa la base
+    LIVE_SNAPSHOT_TIMEOUT_SECONDS: float = 2 # sin respuesta del worker la ventana se arma desde la base
+
+    #Checkpoint del estado del worker (arranque en caliente)
+    CHECKPOINT_ENABLED: bool = True
+    CHECKPOINT_DIR: str = "state" # relativo a tesis_back/
+    CHECKPOINT_INTERVAL_SECONDS: float = 5 # journal con los sensores que cambiaron
+    CHECKPOINT_FULL_INTERVAL_SECONDS: float = 60 # foto completa (incluye ventanas de tiempo real)
 
 settings = Settings()
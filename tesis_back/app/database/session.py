@@ -1,20 +1,171 @@
+import sys
+import time
 from app.core.config import settings
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from app.utils.metrics import Counter, Gauge, Histogram
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from collections.abc import AsyncGenerator
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
-DATABASE_URL = (
-    
+DATABASE_URL = settings.DATABASE_URL or (
+
     f"mysql+aiomysql://{settings.DB_USER}:{settings.DB_PASSWORD}"
     f"@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
 )
 
-engine = create_async_engine(
-    
-    DATABASE_URL,
-    echo=False, # En caso de querer ver los queris en la consola cambiar a true
-    pool_pre_ping=True, # Comprueba si la conexcion sigue viva
+# -------------------------------------------------
+# Métricas de consultas y del pool (hooks del engine)
+# -------------------------------------------------
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Duración de las sentencias SQL por tipo",
+    ["operation"],
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total",
+    "Sentencias SQL que terminaron en error",
+    ["operation"],
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds",
+    "Espera para obtener una conexión del pool (incluye abrirla si hace falta)",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts_total",
+    "Checkouts que superaron el pool_timeout (pool agotado)",
+    ["pool"],
+)
+DB_POOL_PINGS = Counter(
+    "db_pool_pings_total",
+    "Pings de conexiones ociosas al sacarlas del pool",
+    ["pool", "result"],
 )
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Conexiones en uso", ["pool"])
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Conexiones por encima de pool_size", ["pool"])
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+
+
+def _operation(statement: str) -> str:
+    # solo la primera palabra: pocas etiquetas, sin parsear el SQL
+    op = statement.lstrip()[:6].upper()
+    return op if op in _OPERATIONS else "OTHER"
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Pool estándar de SQLAlchemy que mide la espera de cada checkout."""
+
+    pool_name = "primary"
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_CHECKOUT_TIMEOUTS.labels(self.pool_name).inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(self.pool_name).observe(time.perf_counter() - t0)
+
+    def recreate(self):
+        # engine.dispose() reemplaza el pool: conservar la etiqueta
+        pool = super().recreate()
+        pool.pool_name = self.pool_name
+        return pool
+
+
+def process_role() -> str:
+    """
+    "worker" para python -m app.mqtt.worker / app.mqtt.launcher (y sus
+    procesos hijos), "api" para el resto. DB_PROCESS_ROLE lo fuerza.
+    """
+    if settings.DB_PROCESS_ROLE:
+        return settings.DB_PROCESS_ROLE
+    spec = getattr(sys.modules.get("__main__"), "__spec__", None)
+    return "worker" if spec is not None and spec.name.startswith("app.mqtt.") else "api"
+
+
+def _pool_options(role: str) -> dict:
+    if role == "worker":
+        return {
+            "pool_size": settings.DB_POOL_SIZE_WORKER,
+            "max_overflow": settings.DB_MAX_OVERFLOW_WORKER,
+            "pool_timeout": settings.DB_POOL_TIMEOUT_WORKER,
+            "pool_recycle": settings.DB_POOL_RECYCLE_WORKER,
+        }
+    return {
+        "pool_size": settings.DB_POOL_SIZE_API,
+        "max_overflow": settings.DB_MAX_OVERFLOW_API,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_API,
+        "pool_recycle": settings.DB_POOL_RECYCLE_API,
+    }
+
+
+def _instrument(engine: AsyncEngine, name: str) -> None:
+    sync_engine = engine.sync_engine
+    pool = sync_engine.pool
+    pool.pool_name = name
+    DB_POOL_CHECKED_OUT.labels(name).set_function(lambda: sync_engine.pool.checkedout())
+    DB_POOL_OVERFLOW.labels(name).set_function(lambda: max(0, sync_engine.pool.overflow()))
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_SECONDS.labels(_operation(statement)).observe(time.perf_counter() - context._query_start)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(exception_context):
+        statement = exception_context.statement or ""
+        DB_QUERY_ERRORS.labels(_operation(statement)).inc()
+
+    # Liveness sin pool_pre_ping: en lugar de un ping por checkout, solo se
+    # verifica una conexión que estuvo ociosa más de DB_POOL_PING_IDLE_SECONDS
+    # (las demás se usaron hace poco). pool_recycle descarta las viejas antes
+    # del wait_timeout del servidor, y si igual falla una consulta por
+    # desconexión SQLAlchemy invalida el pool y la siguiente usa conexiones nuevas.
+    @event.listens_for(pool, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        connection_record.info["checkin_at"] = time.monotonic()
+
+    @event.listens_for(pool, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        if settings.DB_POOL_PRE_PING:
+            return
+        checkin_at = connection_record.info.get("checkin_at")
+        if checkin_at is None or time.monotonic() - checkin_at < settings.DB_POOL_PING_IDLE_SECONDS:
+            return
+        try:
+            ok = sync_engine.dialect.do_ping(dbapi_connection)
+        except Exception:
+            ok = False
+        DB_POOL_PINGS.labels(name, "ok" if ok else "dead").inc()
+        if not ok:
+            # el pool descarta esta conexión y reintenta con otra
+            raise exc.DisconnectionError("conexión ociosa sin respuesta")
+
+
+def _create_engine(url: str, name: str) -> AsyncEngine:
+    new_engine = create_async_engine(
+        url,
+        echo=False, # En caso de querer ver los queris en la consola cambiar a true
+        pool_pre_ping=settings.DB_POOL_PRE_PING, # ping en cada checkout (más caro); ver _instrument
+        poolclass=TimedQueuePool,
+        **_pool_options(process_role()),
+    )
+    _instrument(new_engine, name)
+    return new_engine
+
+
+engine = _create_engine(DATABASE_URL, "primary")
+
+# réplica de lectura para consultas pesadas; sin DB_READ_REPLICA_URL es el mismo primario
+read_engine = _create_engine(settings.DB_READ_REPLICA_URL, "replica") if settings.DB_READ_REPLICA_URL else engine
+
 
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
@@ -22,6 +173,22 @@ AsyncSessionLocal = async_sessionmaker(
     class_=AsyncSession
 )
 
+AsyncReadSessionLocal = async_sessionmaker(
+    bind=read_engine,
+    expire_on_commit=False,
+    class_=AsyncSession
+)
+
 async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         yield session
+
+
+async def get_read_db_session() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Sesión de solo lectura (réplica si DB_READ_REPLICA_URL está definida).
+    Para listados, series de lecturas y exportaciones: la réplica puede ir
+    unos segundos atrasada, no usar para leer algo recién escrito.
+    """
+    async with AsyncReadSessionLocal() as session:
+        yield session
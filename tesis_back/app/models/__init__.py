@@ -6,5 +6,7 @@ class Base(DeclarativeBase):
 from app.models.usuarios import usuarios
 from app.models.dispositivos import dispositivos
 from app.models.lectura import lectura
+from app.models.lectura_hora import lectura_hora
+from app.models.perfil_umbral import perfil_umbral
 
-__all__ = ["dispositivos", "lectura", "usuarios"]
+__all__ = ["dispositivos", "lectura", "lectura_hora", "perfil_umbral", "usuarios"]
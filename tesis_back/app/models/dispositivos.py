@@ -100,6 +100,12 @@ class dispositivos(Base):
         unique=True,
         index=True,
     )
+    # perfil de umbrales de alerta; en un sensor sin perfil rige el de su gateway
+    id_perfil_umbral: Mapped[int | None] = mapped_column(
+        BigInteger,
+        ForeignKey("perfil_umbral.id_perfil"),
+        nullable=True,
+    )
     
     # Relaciones
     usuario: Mapped["usuarios"] = relationship(
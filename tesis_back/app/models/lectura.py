@@ -1,12 +1,17 @@
 from __future__ import annotations
 from datetime import datetime
-from sqlalchemy import BigInteger, TIMESTAMP, Numeric, ForeignKey, func
+from sqlalchemy import BigInteger, TIMESTAMP, Numeric, ForeignKey, Index, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from app.models import Base
 from app.models.dispositivos import dispositivos
 
 class lectura(Base):
     __tablename__ = "lectura"
+    __table_args__ = (
+        # consultas por rango de tiempo y paginación por (id_dispositivo, fecha_de_medicion);
+        # también cubre la FK, así que no hace falta un índice aparte en id_dispositivo
+        Index("ix_lectura_dispositivo_fecha", "id_dispositivo", "fecha_de_medicion"),
+    )
     
     id_lectura: Mapped[int] = mapped_column(
         BigInteger,
@@ -17,7 +22,6 @@ class lectura(Base):
         BigInteger,
         ForeignKey("dispositivos.id_dispositivo"),
         nullable=False,
-        index=True,
     )
     fecha_de_medicion: Mapped[datetime] = mapped_column(
         TIMESTAMP,
@@ -0,0 +1,52 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import BigInteger, Integer, DateTime, Numeric, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+from app.models import Base
+
+# Resumen por sensor y por hora, calculado por el worker MQTT a partir de las
+# lecturas. Los dashboards consultan esta tabla en lugar de recorrer `lectura`.
+
+class lectura_hora(Base):
+    __tablename__ = "lectura_hora"
+    __table_args__ = (
+        UniqueConstraint("id_dispositivo", "hora_inicio", name="uq_lectura_hora_dispositivo_hora"),
+    )
+
+    id_lectura_hora: Mapped[int] = mapped_column(
+        BigInteger,
+        primary_key=True,
+        autoincrement=True,
+    )
+    id_dispositivo: Mapped[int] = mapped_column(
+        BigInteger,
+        ForeignKey("dispositivos.id_dispositivo"),
+        nullable=False,
+    )
+    hora_inicio: Mapped[datetime] = mapped_column(
+        DateTime,
+        nullable=False,
+    )
+    cantidad: Mapped[int] = mapped_column(
+        Integer,
+        nullable=False,
+    )
+
+    ph_min: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
+    ph_max: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
+    ph_promedio: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
+
+    temperatura_min: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
+    temperatura_max: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
+    temperatura_promedio: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
+
+    turbidez_min: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
+    turbidez_max: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
+    turbidez_promedio: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
+
+    conductividad_min: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
+    conductividad_max: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
+    conductividad_promedio: Mapped[float] = mapped_column(Numeric(10, 2), nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<lectura_hora(id_dispositivo={self.id_dispositivo}, hora_inicio={self.hora_inicio}, cantidad={self.cantidad})>"
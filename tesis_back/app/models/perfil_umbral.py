@@ -0,0 +1,40 @@
+from __future__ import annotations
+from datetime import datetime
+from sqlalchemy import BigInteger, String, TIMESTAMP, Numeric, func
+from sqlalchemy.orm import Mapped, mapped_column
+from app.models import Base
+
+# Límites de alerta que se asignan a un gateway (todo el sitio) o a un
+# sensor puntual. Un límite en NULL no genera alerta. Sin perfil asignado el
+# worker usa los globales PH_MIN, PH_MAX, TURB_MAX y TDS_MAX.
+
+class perfil_umbral(Base):
+    __tablename__ = "perfil_umbral"
+
+    id_perfil: Mapped[int] = mapped_column(
+        BigInteger,
+        primary_key=True,
+        autoincrement=True,
+    )
+    nombre: Mapped[str] = mapped_column(
+        String(100),
+        nullable=False,
+        unique=True,
+    )
+
+    ph_min: Mapped[float | None] = mapped_column(Numeric(10, 2), nullable=True)
+    ph_max: Mapped[float | None] = mapped_column(Numeric(10, 2), nullable=True)
+    temperatura_min: Mapped[float | None] = mapped_column(Numeric(10, 2), nullable=True)
+    temperatura_max: Mapped[float | None] = mapped_column(Numeric(10, 2), nullable=True)
+    turbidez_max: Mapped[float | None] = mapped_column(Numeric(10, 2), nullable=True)
+    tds_max: Mapped[float | None] = mapped_column(Numeric(10, 2), nullable=True)
+
+    fecha_de_actualizacion: Mapped[datetime] = mapped_column(
+        TIMESTAMP,
+        nullable=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+
+    def __repr__(self) -> str:
+        return f"<perfil_umbral(id_perfil={self.id_perfil}, nombre={self.nombre!r})>"
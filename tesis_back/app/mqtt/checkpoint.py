@@ -0,0 +1,304 @@
+import asyncio
+import copy
+import logging
+import os
+import pickle
+import struct
+import time
+import zlib
+from pathlib import Path
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"TWCK"
+VERSION = 1
+# base: MAGIC | versión (1 byte) | generación (uint64) | zlib(pickle(estado))
+_BASE_HEADER = struct.Struct("<4sBQ")
+# journal: MAGIC | versión | generación de la base a la que aplica,
+# seguido de registros longitud (uint32) | zlib(pickle({key: (alerta, acumulador)}))
+_JOURNAL_HEADER = _BASE_HEADER
+_RECORD_LEN = struct.Struct("<I")
+
+
+def resolve_path(path: str) -> Path:
+    """Las rutas relativas se toman desde tesis_back/ (igual que logs/)."""
+    p = Path(path)
+    if not p.is_absolute():
+        p = Path(__file__).resolve().parents[2] / p
+    return p
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _append(path: Path, data: bytes) -> None:
+    with open(path, "ab") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _copy_entry(entry: dict | None) -> dict | None:
+    """
+    Copia de un estado de alerta o acumulador horario: el dict y los dicts
+    que el loop modifica en el lugar (sum/min/max). El resto se reemplaza
+    entero, no se modifica, y se comparte.
+    """
+    if entry is None:
+        return None
+    return {k: dict(v) if isinstance(v, dict) else v for k, v in entry.items()}
+
+
+async def _copy_chunked(state: dict, copy_value, chunk: int = 1000) -> dict:
+    """
+    Copia de un dict de estado por sensor cediendo el loop cada `chunk`
+    sensores. Un sensor que cambia después de copiado ya quedó marcado para
+    el journal nuevo, así que la foto sigue siendo consistente al restaurar.
+    """
+    out = {}
+    items = list(state.items())
+    for i in range(0, len(items), chunk):
+        if i:
+            await asyncio.sleep(0)
+        for key, value in items[i:i + chunk]:
+            out[key] = copy_value(value)
+    return out
+
+
+class WorkerCheckpoint:
+    """
+    Checkpoint local del estado en memoria del worker: estado de alertas
+    (cooldowns), acumuladores horarios y ventanas de tiempo real.
+
+    - Base: foto completa, escrita de forma atómica (archivo temporal +
+      os.replace) cada `full_interval` segundos.
+    - Journal: cada `interval` segundos se agregan solo los sensores que
+      cambiaron (alerta + acumulador horario). Las ventanas de tiempo real
+      cambian con cada lectura y solo viajan en la base.
+
+    Cada base tiene un número de generación y el journal lleva en su cabecera
+    la generación sobre la que aplica; así un journal viejo que sobrevivió a
+    un corte nunca se reaplica sobre una base más nueva.
+    En el event loop solo se toma una copia superficial del estado; pickle,
+    compresión y disco van en un hilo aparte.
+    """
+
+    def __init__(
+        self,
+        directory: str = settings.CHECKPOINT_DIR,
+        name: str = "worker_state",
+        interval: float = settings.CHECKPOINT_INTERVAL_SECONDS,
+        full_interval: float = settings.CHECKPOINT_FULL_INTERVAL_SECONDS,
+    ):
+        self.dir = resolve_path(directory)
+        self.base_path = self.dir / f"{name}.bin"
+        self.journal_path = self.dir / f"{name}.journal"
+        self.interval = interval
+        self.full_interval = full_interval
+
+        self._dirty: set[str] = set()
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+        self.journal_records = 0
+        self.full_snapshots = 0
+        self.last_full_ms = 0.0
+        self.last_full_bytes = 0
+        self.last_copy_ms = 0.0  # tiempo de la foto en el loop (lo único que lo frena)
+        self.last_journal_ms = 0.0
+
+    def mark(self, key: str) -> None:
+        self._dirty.add(key)
+
+    # -----------------------------
+    # Arranque en caliente
+    # -----------------------------
+    def load(self) -> tuple[dict, dict, dict, list]:
+        """
+        Devuelve (alert_state, acumuladores horarios, ventanas de tiempo real,
+        filas horarias pendientes). Sin checkpoint o si está dañado, todo vacío.
+        """
+        t0 = time.perf_counter()
+        empty = ({}, {}, {}, [])
+        try:
+            raw = self.base_path.read_bytes()
+        except FileNotFoundError:
+            logger.info("[CHECKPOINT] Sin checkpoint previo en %s", self.base_path)
+            return empty
+
+        try:
+            magic, version, generation = _BASE_HEADER.unpack_from(raw)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"cabecera desconocida {magic!r} v{version}")
+            state = pickle.loads(zlib.decompress(raw[_BASE_HEADER.size:]))
+        except Exception as e:
+            logger.error("[CHECKPOINT] Base inválida, se arranca en frío err=%s", e)
+            return empty
+
+        self._generation = generation
+        alert_state = state["alert_state"]
+        hourly = state["hourly"]
+        replayed = self._replay_journal(generation, alert_state, hourly)
+
+        logger.info(
+            "[CHECKPOINT] Restaurado gen=%d guardado=%s sensores_alerta=%d horas_abiertas=%d "
+            "ventanas=%d pendientes=%d registros_journal=%d en %.1f ms",
+            generation, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(state["saved_at"])),
+            len(alert_state), len(hourly), len(state["realtime"]), len(state["pending_rows"]),
+            replayed, (time.perf_counter() - t0) * 1000,
+        )
+        return alert_state, hourly, state["realtime"], state["pending_rows"]
+
+    def _replay_journal(self, generation: int, alert_state: dict, hourly: dict) -> int:
+        try:
+            raw = self.journal_path.read_bytes()
+        except FileNotFoundError:
+            return 0
+        if len(raw) < _JOURNAL_HEADER.size:
+            return 0
+        magic, version, journal_gen = _JOURNAL_HEADER.unpack_from(raw)
+        if magic != MAGIC or version != VERSION or journal_gen != generation:
+            logger.info("[CHECKPOINT] Journal de otra generación (%d != %d), se ignora", journal_gen, generation)
+            return 0
+
+        pos = _JOURNAL_HEADER.size
+        count = 0
+        while pos + _RECORD_LEN.size <= len(raw):
+            (length,) = _RECORD_LEN.unpack_from(raw, pos)
+            start = pos + _RECORD_LEN.size
+            if start + length > len(raw):
+                logger.warning("[CHECKPOINT] Registro final del journal incompleto, se descarta")
+                break
+            try:
+                record = pickle.loads(zlib.decompress(raw[start:start + length]))
+            except Exception as e:
+                logger.warning("[CHECKPOINT] Registro del journal dañado, se corta la reproducción err=%s", e)
+                break
+            for key, (alert, acc) in record.items():
+                if alert is None:
+                    alert_state.pop(key, None)
+                else:
+                    alert_state[key] = alert
+                if acc is None:
+                    hourly.pop(key, None)
+                else:
+                    hourly[key] = acc
+            pos = start + length
+            count += 1
+        return count
+
+    # -----------------------------
+    # Escritura
+    # -----------------------------
+    async def save_journal(self, alert_state: dict, hourly: dict) -> None:
+        if not self._dirty:
+            return
+        async with self._lock:
+            keys, self._dirty = self._dirty, set()
+            # copia en el loop: consistente con el estado en este instante
+            record = {key: (_copy_entry(alert_state.get(key)), _copy_entry(hourly.get(key))) for key in keys}
+
+            def _write():
+                data = zlib.compress(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL), 1)
+                if not self.journal_path.exists():
+                    _write_atomic(
+                        self.journal_path,
+                        _JOURNAL_HEADER.pack(MAGIC, VERSION, self._generation),
+                    )
+                _append(self.journal_path, _RECORD_LEN.pack(len(data)) + data)
+
+            t0 = time.perf_counter()
+            try:
+                await asyncio.to_thread(_write)
+            except Exception as e:
+                self._dirty |= keys
+                logger.exception("[CHECKPOINT] Error escribiendo journal err=%s", e)
+                return
+            self.journal_records += 1
+            self.last_journal_ms = (time.perf_counter() - t0) * 1000
+
+    async def save_full(
+        self,
+        alert_state: dict,
+        hourly: dict,
+        realtime: dict,
+        pending_rows: list | None = None,
+    ) -> None:
+        """
+        Foto completa y journal nuevo (vacío) de la generación siguiente.
+        `pending_rows` solo se pasa al cerrar: en una foto periódica esas filas
+        se escribirían en la base y se duplicarían al restaurar.
+        """
+        async with self._lock:
+            # lo que se marque durante la escritura queda para el journal nuevo
+            keys, self._dirty = self._dirty, set()
+            generation = self._generation + 1
+            # en el loop solo la copia (las ventanas se copian como arrays);
+            # pickle y zlib del estado completo corren en el hilo
+            t0 = time.perf_counter()
+            state = {
+                "saved_at": time.time(),
+                "alert_state": await _copy_chunked(alert_state, _copy_entry),
+                "hourly": await _copy_chunked(hourly, _copy_entry),
+                "realtime": await _copy_chunked(realtime, copy.copy),
+                "pending_rows": list(pending_rows or []),
+            }
+            self.last_copy_ms = (time.perf_counter() - t0) * 1000
+
+            def _write() -> int:
+                payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+                self.dir.mkdir(parents=True, exist_ok=True)
+                data = _BASE_HEADER.pack(MAGIC, VERSION, generation) + zlib.compress(payload, 1)
+                _write_atomic(self.base_path, data)
+                _write_atomic(self.journal_path, _JOURNAL_HEADER.pack(MAGIC, VERSION, generation))
+                return len(data)
+
+            t0 = time.perf_counter()
+            try:
+                size = await asyncio.to_thread(_write)
+            except Exception as e:
+                # el journal de la generación actual sigue valiendo: que lo completen
+                self._dirty |= keys
+                logger.exception("[CHECKPOINT] Error escribiendo checkpoint completo err=%s", e)
+                return
+            self._generation = generation
+            self.full_snapshots += 1
+            self.last_full_bytes = size
+            self.last_full_ms = (time.perf_counter() - t0) * 1000
+            logger.info(
+                "[CHECKPOINT] Base gen=%d bytes=%d latencia_ms=%.1f",
+                generation, size, self.last_full_ms,
+            )
+
+    async def run(self, alert_state: dict, hourly: dict, realtime: dict) -> None:
+        logger.info(
+            "[CHECKPOINT] Iniciado en %s journal=%.0fs base=%.0fs",
+            self.base_path, self.interval, self.full_interval,
+        )
+        last_full = time.monotonic()
+        while True:
+            await asyncio.sleep(self.interval)
+            if time.monotonic() - last_full >= self.full_interval:
+                await self.save_full(alert_state, hourly, realtime)
+                last_full = time.monotonic()
+            else:
+                await self.save_journal(alert_state, hourly)
+
+    def stats(self) -> dict:
+        return {
+            "generation": self._generation,
+            "dirty": len(self._dirty),
+            "journal_records": self.journal_records,
+            "full_snapshots": self.full_snapshots,
+            "last_full_bytes": self.last_full_bytes,
+            "last_full_ms": round(self.last_full_ms, 2),
+            "last_copy_ms": round(self.last_copy_ms, 2),
+            "last_journal_ms": round(self.last_journal_ms, 2),
+        }
@@ -0,0 +1,163 @@
+"""
+Codificación binaria compacta de la telemetría (alternativa al JSON).
+
+Formato v1, little-endian, sin padding:
+
+    offset  tipo     campo
+    0       uint8    MAGIC (0xA7; nunca es el primer byte de un JSON en UTF-8)
+    1       uint8    versión (1)
+    2       uint8    flags: bit 0 = trae timestamp, bit 1 = trae secuencia
+    3       float32  ph
+    7       float32  temperatura
+    11      float32  turbidez
+    15      float32  tds
+    19      float64  timestamp del dispositivo (epoch en segundos)  [opcional]
+    ..      uint32   número de secuencia                            [opcional]
+
+19 bytes sin opcionales y 31 con ambos (el JSON equivalente ronda los 70).
+Se reconoce por el primer byte o por el sufijo /bin del topic.
+
+Al final está el formato de los lotes que arma el bridge de la Raspberry.
+"""
+import struct
+
+MAGIC = 0xA7
+VERSION = 1
+FLAG_TIMESTAMP = 0x01
+FLAG_SEQUENCE = 0x02
+
+_HEADER = struct.Struct("<BBB4f")
+# un Struct precompilado por combinación de flags: el mensaje entero se lee
+# con un solo unpack_from
+_LAYOUTS = {
+    0: struct.Struct("<BBB4f"),
+    FLAG_TIMESTAMP: struct.Struct("<BBB4fd"),
+    FLAG_SEQUENCE: struct.Struct("<BBB4fI"),
+    FLAG_TIMESTAMP | FLAG_SEQUENCE: struct.Struct("<BBB4fdI"),
+}
+_MAGIC_BYTE = bytes([MAGIC])
+
+
+class CodecError(ValueError):
+    """Payload binario mal formado (longitud, versión, flags o valores no finitos)."""
+
+
+def is_binary(payload: bytes) -> bool:
+    return payload[:1] == _MAGIC_BYTE
+
+
+def encode(
+    ph: float,
+    temperatura: float,
+    turbidez: float,
+    tds: float,
+    timestamp: float | None = None,
+    sequence: int | None = None,
+) -> bytes:
+    flags = (FLAG_TIMESTAMP if timestamp is not None else 0) | (FLAG_SEQUENCE if sequence is not None else 0)
+    values = [MAGIC, VERSION, flags, ph, temperatura, turbidez, tds]
+    if timestamp is not None:
+        values.append(timestamp)
+    if sequence is not None:
+        values.append(sequence & 0xFFFFFFFF)
+    return _LAYOUTS[flags].pack(*values)
+
+
+def decode(payload: bytes) -> tuple[float, float, float, float, float | None, int | None]:
+    """
+    (ph, temperatura, turbidez, tds, timestamp, secuencia); timestamp y
+    secuencia son None si el mensaje no los trae. Lee directo sobre el
+    buffer del mensaje (memoryview + unpack_from), sin copias intermedias.
+
+    Los valores no se redondean: un float32 conserva ~7 dígitos (7.2 llega
+    como 7.199999809), muy por debajo de los 2 decimales que guarda la base,
+    y redondear los cuatro costaba más que el resto del decode.
+    """
+    view = memoryview(payload)
+    if len(view) < _HEADER.size:
+        raise CodecError(f"longitud {len(view)} < {_HEADER.size}")
+    if view[0] != MAGIC:
+        raise CodecError(f"magic inválido 0x{view[0]:02X}")
+    if view[1] != VERSION:
+        raise CodecError(f"versión no soportada {view[1]}")
+    flags = view[2]
+    layout = _LAYOUTS.get(flags)
+    if layout is None:
+        raise CodecError(f"flags desconocidos 0x{flags:02X}")
+    if len(view) != layout.size:
+        raise CodecError(f"longitud {len(view)} != {layout.size} (flags=0x{flags:02X})")
+
+    values = layout.unpack_from(view)
+    ph, temperatura, turbidez, tds = values[3:7]
+    # x - x es nan para nan e inf: un solo chequeo para los cuatro valores
+    if (ph - ph) + (temperatura - temperatura) + (turbidez - turbidez) + (tds - tds) != 0:
+        raise CodecError("valores no finitos")
+    timestamp = sequence = None
+    if flags == FLAG_TIMESTAMP | FLAG_SEQUENCE:
+        timestamp, sequence = values[7], values[8]
+    elif flags == FLAG_TIMESTAMP:
+        timestamp = values[7]
+    elif flags == FLAG_SEQUENCE:
+        sequence = values[7]
+    if timestamp is not None and timestamp - timestamp != 0:
+        raise CodecError("timestamp no finito")
+    return ph, temperatura, turbidez, tds, timestamp, sequence
+
+
+# -----------------------------
+# Lotes del bridge (tesis_raspberry/uplink.py)
+# -----------------------------
+# Un lote agrupa varios mensajes de telemetría en un solo publish hacia el
+# broker central: cabecera (magic 0xB7, versión, cantidad) y por cada
+# mensaje largo del topic (uint16), largo del payload (uint32), topic en
+# UTF-8 y payload tal cual (JSON o binario).
+BATCH_MAGIC = 0xB7
+BATCH_VERSION = 1
+_BATCH_HEADER = struct.Struct("<BBH")
+_ENTRY_HEADER = struct.Struct("<HI")
+
+
+def encode_batch(entries: list[tuple[str, bytes]]) -> bytes:
+    out = bytearray(_BATCH_HEADER.pack(BATCH_MAGIC, BATCH_VERSION, len(entries)))
+    for topic, payload in entries:
+        topic_bytes = topic.encode("utf-8")
+        out += _ENTRY_HEADER.pack(len(topic_bytes), len(payload))
+        out += topic_bytes
+        out += payload
+    return bytes(out)
+
+
+def decode_batch(payload: bytes) -> list[tuple[str, bytes]]:
+    """
+    [(topic, payload)] de un lote. Valida el lote completo antes de
+    devolver nada: uno mal formado se descarta entero (CodecError).
+    """
+    view = memoryview(payload)
+    size = len(view)
+    if size < _BATCH_HEADER.size:
+        raise CodecError(f"lote de longitud {size} < {_BATCH_HEADER.size}")
+    magic, version, count = _BATCH_HEADER.unpack_from(view)
+    if magic != BATCH_MAGIC:
+        raise CodecError(f"magic de lote inválido 0x{magic:02X}")
+    if version != BATCH_VERSION:
+        raise CodecError(f"versión de lote no soportada {version}")
+
+    entries = []
+    offset = _BATCH_HEADER.size
+    for _ in range(count):
+        if offset + _ENTRY_HEADER.size > size:
+            raise CodecError(f"lote truncado en la entrada {len(entries)}")
+        topic_len, payload_len = _ENTRY_HEADER.unpack_from(view, offset)
+        offset += _ENTRY_HEADER.size
+        end = offset + topic_len + payload_len
+        if end > size:
+            raise CodecError(f"lote truncado en la entrada {len(entries)}")
+        try:
+            topic = str(view[offset:offset + topic_len], "utf-8")
+        except UnicodeDecodeError as e:
+            raise CodecError(f"topic inválido en la entrada {len(entries)}") from e
+        entries.append((topic, bytes(view[offset + topic_len:end])))
+        offset = end
+    if offset != size:
+        raise CodecError(f"{size - offset} bytes sobrantes al final del lote")
+    return entries
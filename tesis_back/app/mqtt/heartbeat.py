@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime
+from sqlalchemy import case, select, update
+from app.core.config import settings
+from app.database.session import AsyncSessionLocal
+from app.models.dispositivos import dispositivos
+
+logger = logging.getLogger(__name__)
+
+
+class _Device:
+    __slots__ = ("id", "gateway", "mac", "mac_gw", "correo", "seen", "seen_wall", "offline", "scheduled")
+
+    def __init__(self, id_dispositivo: int, gateway: bool):
+        self.id = id_dispositivo
+        self.gateway = gateway
+        self.mac = ""
+        self.mac_gw = None
+        self.correo = ""
+        self.seen = 0.0          # time.monotonic() del último mensaje (rueda)
+        self.seen_wall = 0.0     # time.time() del último mensaje (ultimo_heartbeat)
+        self.offline = False
+        self.scheduled = False   # está en algún slot de la rueda
+
+
+class HeartbeatTracker:
+    """
+    Última vez visto de gateways y sensores, sin timers ni escrituras por
+    mensaje:
+
+    - mark() solo actualiza la entrada en memoria del dispositivo y lo anota
+      como pendiente; run() escribe dispositivos.ultimo_heartbeat cada
+      `flush_interval` segundos con un UPDATE ... CASE por bloque de ids.
+    - Rueda de tiempo (hashed timing wheel) con slots de `interval` segundos:
+      cada dispositivo está en un único slot, el de su vencimiento. mark() no
+      lo mueve; al girar la rueda se revisan los del slot actual y los que
+      recibieron mensajes se reprograman a su vencimiento real. Así el costo
+      es a lo sumo una reprogramación por dispositivo y período, no por
+      mensaje.
+    - Un dispositivo que pasa `missed` intervalos sin mensajes queda offline
+      y se llama on_offline(dev, segundos_sin_datos); al volver a reportar,
+      on_online(dev).
+    - Con confirm_gateways (modo multi-proceso, cada proceso ve solo parte de
+      los sensores de un gateway) un gateway vencido se compara primero con
+      el ultimo_heartbeat de la base, que escriben todos los procesos.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        interval: float = settings.DEVICE_HEARTBEAT_INTERVAL_SECONDS,
+        missed: int = settings.DEVICE_OFFLINE_MISSED_INTERVALS,
+        flush_interval: float = settings.HEARTBEAT_FLUSH_INTERVAL_SECONDS,
+        chunk_size: int = settings.HEARTBEAT_FLUSH_CHUNK,
+        confirm_gateways: bool = False,
+    ):
+        self._session_factory = session_factory
+        self.interval = interval
+        self.missed = missed
+        self.timeout = interval * missed
+        self.flush_interval = flush_interval
+        self.chunk_size = chunk_size
+        self.confirm_gateways = confirm_gateways
+        self.on_offline = None   # callback(dev, segundos_sin_datos)
+        self.on_online = None    # callback(dev)
+
+        self._devices: dict[int, _Device] = {}
+        self._dirty: set[int] = set()
+        # vencimiento < ahora + timeout + interval: alcanza una vuelta sin rondas extra
+        self._slots: list[list[_Device]] = [[] for _ in range(missed + 2)]
+        self._tick = math.floor(time.monotonic() / interval)  # último tick procesado
+        self._closed = False
+
+        self.offline_count = 0
+        self.went_offline = 0
+        self.came_online = 0
+        self.rescheduled = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def mark(self, id_dispositivo: int, gateway: bool, mac: str, mac_gw: str | None, correo: str) -> None:
+        """Registra un mensaje del dispositivo (no bloquea ni toca la base)."""
+        dev = self._devices.get(id_dispositivo)
+        if dev is None:
+            dev = self._devices[id_dispositivo] = _Device(id_dispositivo, gateway)
+        dev.mac = mac
+        dev.mac_gw = mac_gw
+        dev.correo = correo
+        dev.seen = time.monotonic()
+        dev.seen_wall = time.time()
+        self._dirty.add(id_dispositivo)
+        if not dev.scheduled:
+            self._schedule(dev)
+        if dev.offline:
+            dev.offline = False
+            self.offline_count -= 1
+            self.came_online += 1
+            if self.on_online is not None:
+                self.on_online(dev)
+
+    def _schedule(self, dev: _Device) -> None:
+        tick = math.ceil((dev.seen + self.timeout) / self.interval)
+        self._slots[tick % len(self._slots)].append(dev)
+        dev.scheduled = True
+
+    # -----------------------------
+    # Rueda de tiempo
+    # -----------------------------
+    async def advance(self) -> int:
+        """Procesa los slots vencidos hasta ahora; devuelve cuántos quedaron offline."""
+        now = time.monotonic()
+        current = math.floor(now / self.interval)
+        expired: list[_Device] = []
+        while self._tick < current:
+            self._tick += 1
+            slot_index = self._tick % len(self._slots)
+            slot = self._slots[slot_index]
+            if not slot:
+                continue
+            self._slots[slot_index] = []
+            for dev in slot:
+                dev.scheduled = False
+                if now - dev.seen >= self.timeout:
+                    expired.append(dev)
+                else:
+                    self.rescheduled += 1
+                    self._schedule(dev)
+
+        if self.confirm_gateways and expired:
+            expired = await self._confirm(expired, now)
+
+        for dev in expired:
+            dev.offline = True
+            self.offline_count += 1
+            self.went_offline += 1
+            if self.on_offline is not None:
+                self.on_offline(dev, now - dev.seen)
+        return len(expired)
+
+    async def _confirm(self, expired: list[_Device], now: float) -> list[_Device]:
+        """Descarta los gateways que otro proceso vio hace menos de `timeout`."""
+        gateways = {dev.id: dev for dev in expired if dev.gateway}
+        if not gateways:
+            return expired
+        try:
+            async with self._session_factory() as session:
+                stmt = select(dispositivos.id_dispositivo, dispositivos.ultimo_heartbeat).where(
+                    dispositivos.id_dispositivo.in_(gateways)
+                )
+                rows = (await session.execute(stmt)).all()
+        except Exception as e:
+            logger.exception("[HEARTBEAT] Error consultando ultimo_heartbeat gateways=%d err=%s", len(gateways), e)
+            return expired
+
+        wall_offset = time.time() - now
+        alive = set()
+        for id_dispositivo, ultimo in rows:
+            if ultimo is None:
+                continue
+            seen = ultimo.timestamp() - wall_offset
+            if now - seen < self.timeout:
+                dev = gateways[id_dispositivo]
+                if seen > dev.seen:
+                    dev.seen = seen
+                self.rescheduled += 1
+                self._schedule(dev)
+                alive.add(id_dispositivo)
+        return [dev for dev in expired if dev.id not in alive]
+
+    # -----------------------------
+    # Escritura de ultimo_heartbeat
+    # -----------------------------
+    async def flush(self) -> bool:
+        if not self._dirty:
+            return True
+        ids, self._dirty = self._dirty, set()
+        values = {}
+        for id_dispositivo in ids:
+            dev = self._devices.get(id_dispositivo)
+            if dev is not None:
+                values[id_dispositivo] = datetime.fromtimestamp(int(dev.seen_wall))
+        items = list(values.items())
+
+        t0 = time.perf_counter()
+        try:
+            async with self._session_factory() as session:
+                for i in range(0, len(items), self.chunk_size):
+                    chunk = dict(items[i:i + self.chunk_size])
+                    # un UPDATE por bloque: SET ultimo_heartbeat = CASE id_dispositivo WHEN ... END
+                    stmt = (
+                        update(dispositivos)
+                        .where(dispositivos.id_dispositivo.in_(chunk))
+                        .values(ultimo_heartbeat=case(chunk, value=dispositivos.id_dispositivo))
+                        .execution_options(synchronize_session=False)
+                    )
+                    await session.execute(stmt)
+                await session.commit()
+        except Exception as e:
+            self.failed_flushes += 1
+            # se reintentan en el próximo ciclo, con el valor que tengan entonces
+            self._dirty |= ids
+            logger.exception("[HEARTBEAT] Error actualizando ultimo_heartbeat filas=%d err=%s", len(items), e)
+            return False
+
+        self.last_flush_ms = (time.perf_counter() - t0) * 1000
+        self.flushes += 1
+        self.rows_written += len(items)
+        logger.info("[HEARTBEAT] filas=%d latencia_ms=%.1f", len(items), self.last_flush_ms)
+        return True
+
+    async def run(self) -> None:
+        logger.info(
+            "[HEARTBEAT] Iniciado intervalo=%.0fs offline_tras=%d intervalos flush=%.0fs",
+            self.interval, self.missed, self.flush_interval,
+        )
+        next_flush = time.monotonic() + self.flush_interval
+        while not self._closed:
+            # despertar en el próximo borde de tick o flush, lo que venga antes
+            now = time.monotonic()
+            next_tick = (math.floor(now / self.interval) + 1) * self.interval
+            await asyncio.sleep(max(0.0, min(next_tick, next_flush) - now))
+            try:
+                offline = await self.advance()
+                if offline:
+                    logger.warning("[HEARTBEAT] %d dispositivos sin reportar", offline)
+            except Exception as e:
+                logger.exception("[HEARTBEAT] Error revisando la rueda err=%s", e)
+            if time.monotonic() >= next_flush:
+                await self.flush()
+                next_flush = time.monotonic() + self.flush_interval
+
+    async def close(self) -> None:
+        """Detiene el timer y escribe los heartbeats pendientes."""
+        self._closed = True
+        if not await self.flush():
+            logger.error("[HEARTBEAT] Cierre con %d heartbeats sin persistir", len(self._dirty))
+
+    def stats(self) -> dict:
+        return {
+            "devices": len(self._devices),
+            "offline": self.offline_count,
+            "went_offline": self.went_offline,
+            "came_online": self.came_online,
+            "rescheduled": self.rescheduled,
+            "pending": len(self._dirty),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+# Políticas cuando la cola está llena
+POLICY_BLOCK = "block"              # el productor espera (backpressure hacia paho / broker)
+POLICY_DROP_OLDEST = "drop_oldest"  # se descarta la lectura más vieja del mismo sensor
+POLICY_COALESCE = "coalesce"        # se reemplazan las pendientes del sensor por la última
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_COALESCE)
+
+
+class SensorQueue:
+    """
+    Cola acotada agrupada por sensor.
+
+    Mantiene una deque FIFO por sensor y entrega en round-robin entre
+    sensores: el orden por sensor se respeta y un sensor ruidoso no
+    acapara al consumer. Cuando se llena aplica la política configurada.
+    No es thread-safe: se usa solo desde el hilo del event loop.
+    """
+
+    def __init__(self, maxsize: int, policy: str = POLICY_DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de cola desconocida: {policy!r} (opciones: {', '.join(POLICIES)})")
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+
+        self._pending: OrderedDict[str, deque] = OrderedDict()
+        self._size = 0
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+
+        self.dropped = 0
+        self.coalesced = 0
+        self.high_watermark = 0
+
+    def qsize(self) -> int:
+        return self._size
+
+    def full(self) -> bool:
+        return self._size >= self.maxsize
+
+    def _append(self, key: str, item) -> None:
+        dq = self._pending.get(key)
+        if dq is None:
+            dq = deque()
+            self._pending[key] = dq
+        dq.append(item)
+        self._size += 1
+        if self._size > self.high_watermark:
+            self.high_watermark = self._size
+        if self._size >= self.maxsize:
+            self._not_full.clear()
+        self._not_empty.set()
+
+    def _drop_from(self, key: str) -> None:
+        dq = self._pending[key]
+        dq.popleft()
+        self._size -= 1
+        self.dropped += 1
+        if not dq:
+            del self._pending[key]
+        if self.dropped % 1000 == 1:
+            logger.warning("[QUEUE] Cola llena (%d), descartadas=%d coalescidas=%d", self.maxsize, self.dropped, self.coalesced)
+
+    def put_nowait(self, key: str, item) -> None:
+        if self._size < self.maxsize:
+            self._append(key, item)
+            return
+
+        if self.policy == POLICY_BLOCK:
+            raise asyncio.QueueFull
+
+        dq = self._pending.get(key)
+        if self.policy == POLICY_COALESCE and dq:
+            # el sensor ya tenía lecturas esperando: solo sobrevive la última
+            self.coalesced += len(dq)
+            self._size -= len(dq)
+            dq.clear()
+        elif dq:
+            self._drop_from(key)
+        else:
+            # el sensor no tenía pendientes: se sacrifica la lectura más
+            # vieja del sensor que lleva más tiempo esperando
+            self._drop_from(next(iter(self._pending)))
+        self._append(key, item)
+
+    async def put(self, key: str, item) -> None:
+        """Encola; con la política block espera a que haya espacio."""
+        while self.policy == POLICY_BLOCK and self._size >= self.maxsize:
+            self._not_full.clear()
+            await self._not_full.wait()
+        self.put_nowait(key, item)
+
+    async def get(self):
+        while self._size == 0:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        key, dq = next(iter(self._pending.items()))
+        item = dq.popleft()
+        self._size -= 1
+        if dq:
+            # round-robin: el sensor pasa al final de la fila
+            self._pending.move_to_end(key)
+        else:
+            del self._pending[key]
+        if self._size < self.maxsize:
+            self._not_full.set()
+        return item
+
+    def stats(self) -> dict:
+        return {
+            "depth": self._size,
+            "maxsize": self.maxsize,
+            "sensors": len(self._pending),
+            "high_watermark": self.high_watermark,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
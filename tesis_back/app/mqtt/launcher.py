@@ -0,0 +1,126 @@
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from app.core.config import settings
+from app.mqtt import worker
+from app.utils.logging_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF_SECONDS = 60
+STABLE_AFTER_SECONDS = 60  # un proceso que vivió esto reinicia el backoff
+
+
+def _run_partition(index: int, count: int) -> None:
+    # el supervisor decide cuándo cerrar: el hijo solo atiende SIGINT
+    # (KeyboardInterrupt en worker.main), que dispara el cierre ordenado
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # proceso nuevo (spawn): cada partición configura su logging y rota su
+    # propio archivo
+    configure_logging(f"worker_p{index}.log")
+    worker.main(partition_index=index, partition_count=count)
+
+
+class WorkerSupervisor:
+    """
+    Lanza N procesos worker y los mantiene vivos.
+
+    Cada proceso se suscribe al topic completo y procesa solo los sensores
+    cuyo hash de mac_esp le corresponde, así el estado por sensor (alertas,
+    horas en curso, ventana en tiempo real, checkpoint) tiene un único dueño.
+    Si un proceso muere se relanza la misma partición con backoff exponencial.
+    """
+
+    def __init__(
+        self,
+        count: int = settings.WORKER_PROCESSES,
+        restart_backoff: float = settings.WORKER_RESTART_BACKOFF_SECONDS,
+    ):
+        self.count = count if count > 0 else (os.cpu_count() or 1)
+        self.restart_backoff = restart_backoff
+        # spawn y no fork: el padre ya tiene hilos (QueueListener del logging)
+        # y un fork podría heredar sus locks tomados
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs: list[multiprocessing.Process | None] = [None] * self.count
+        self._started_at = [0.0] * self.count
+        self._backoff = [restart_backoff] * self.count
+        self._restart_at = [0.0] * self.count
+        self._stopping = False
+        self.restarts = 0
+
+    def _spawn(self, index: int) -> None:
+        proc = self._ctx.Process(
+            target=_run_partition,
+            args=(index, self.count),
+            name=f"mqtt-worker-{index}",
+        )
+        proc.start()
+        self._procs[index] = proc
+        self._started_at[index] = time.monotonic()
+        logger.info("[SUPERVISOR] Partición %d/%d iniciada pid=%s", index, self.count, proc.pid)
+
+    def _check(self, index: int) -> None:
+        proc = self._procs[index]
+        now = time.monotonic()
+        if proc is not None:
+            if proc.is_alive():
+                if now - self._started_at[index] >= STABLE_AFTER_SECONDS:
+                    self._backoff[index] = self.restart_backoff
+                return
+            proc.join()
+            self._procs[index] = None
+            wait = self._backoff[index]
+            self._restart_at[index] = now + wait
+            self._backoff[index] = min(wait * 2, MAX_BACKOFF_SECONDS)
+            logger.error(
+                "[SUPERVISOR] Partición %d terminó exitcode=%s, se relanza en %.1fs",
+                index, proc.exitcode, wait,
+            )
+            return
+        if now >= self._restart_at[index]:
+            self.restarts += 1
+            self._spawn(index)
+
+    def _request_stop(self, signum, frame) -> None:
+        self._stopping = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._request_stop)
+        logger.info("[SUPERVISOR] Lanzando %d procesos worker", self.count)
+        for index in range(self.count):
+            self._spawn(index)
+        try:
+            while not self._stopping:
+                time.sleep(1)
+                for index in range(self.count):
+                    self._check(index)
+        except KeyboardInterrupt:
+            # Ctrl+C ya llegó a todo el grupo de procesos: no reenviar SIGINT,
+            # un segundo KeyboardInterrupt cortaría el cierre ordenado del hijo
+            self.stop(signal_children=False)
+            return
+        self.stop()
+
+    def stop(self, timeout: float = 60, signal_children: bool = True) -> None:
+        logger.info("[SUPERVISOR] Cerrando procesos worker...")
+        alive = [p for p in self._procs if p is not None and p.is_alive()]
+        if signal_children:
+            for proc in alive:
+                try:
+                    os.kill(proc.pid, signal.SIGINT)
+                except ProcessLookupError:
+                    pass
+        deadline = time.monotonic() + timeout
+        for proc in alive:
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                logger.error("[SUPERVISOR] %s no cerró a tiempo, se termina", proc.name)
+                proc.terminate()
+                proc.join()
+        logger.info("[SUPERVISOR] Procesos cerrados (reinicios=%d)", self.restarts)
+
+
+if __name__ == "__main__":
+    WorkerSupervisor().run()
@@ -0,0 +1,77 @@
+import re
+from pydantic import TypeAdapter, ValidationError
+from app.core.config import settings
+from app.mqtt.codec import CodecError, decode
+from app.schemas.lecturas import ResumenMQTT, TelemetriaMQTT
+
+# gateways/<mac_gw>/sensors/<mac_esp>/telemetry[/bin]
+TOPIC_RE = re.compile(r"gateways/([^/]+)/sensors/([^/]+)/telemetry(/bin)?")
+BINARY_TOPIC_SUFFIX = "/bin"
+# gateways/<mac_gw>/sensors/<mac_esp>/summary (resúmenes del bridge)
+SUMMARY_TOPIC_RE = re.compile(r"gateways/([^/]+)/sensors/([^/]+)/summary")
+
+_telemetria = TypeAdapter(TelemetriaMQTT)
+_resumen = TypeAdapter(ResumenMQTT)
+
+
+def parse_topic(topic: str) -> tuple[str, str, bool] | None:
+    """(mac_gw, mac_esp, binario) o None si el topic no es de telemetría."""
+    m = TOPIC_RE.fullmatch(topic)
+    if m is None:
+        return None
+    return m.group(1), m.group(2), m.group(3) is not None
+
+
+def parse_summary_topic(topic: str) -> tuple[str, str] | None:
+    """(mac_gw, mac_esp) o None si el topic no es de resumen."""
+    m = SUMMARY_TOPIC_RE.fullmatch(topic)
+    if m is None:
+        return None
+    return m.group(1), m.group(2)
+
+
+def parse_summary(payload: bytes) -> dict:
+    """Valida un resumen (ResumenMQTT) directo desde los bytes. Lanza ValidationError."""
+    return _resumen.validate_json(payload)
+
+
+def parse_telemetry(payload: bytes) -> dict:
+    """
+    Valida el JSON directo desde los bytes del mensaje (parser de
+    pydantic-core, sin decode a str, json.loads ni modelo intermedio) y
+    devuelve el dict {"ph", "temperatura", "turbidez", "tds"}.
+    Lanza ValidationError; ver invalid_reason().
+    """
+    return _telemetria.validate_json(payload)
+
+
+def parse_payload(payload: bytes, binary: bool) -> tuple[dict, float | None, int | None]:
+    """
+    (telemetry, timestamp del dispositivo, secuencia) para JSON o binario
+    (app.mqtt.codec). `binary` si el topic termina en /bin o el payload
+    empieza con el byte mágico (codec.is_binary). En JSON timestamp y
+    secuencia son None. Lanza ValidationError o CodecError.
+    """
+    if binary:
+        ph, temperatura, turbidez, tds, timestamp, sequence = decode(payload)
+        return {"ph": ph, "temperatura": temperatura, "turbidez": turbidez, "tds": tds}, timestamp, sequence
+    return _telemetria.validate_json(payload), None, None
+
+
+def device_ts_valid(device_ts: float, now: float, max_age: float) -> bool:
+    """
+    El timestamp del dispositivo sirve como hora de medición: no está
+    adelantado más que DEVICE_TS_MAX_SKEW_SECONDS ni es más viejo que max_age.
+    """
+    age = now - device_ts
+    return -settings.DEVICE_TS_MAX_SKEW_SECONDS <= age <= max_age
+
+
+def invalid_reason(e: ValidationError | CodecError) -> str:
+    """Clasifica el error para métricas/logs: json (incluye UTF-8 inválido), schema o binary."""
+    if isinstance(e, CodecError):
+        return "binary"
+    errors = e.errors(include_url=False, include_context=False, include_input=False)
+    if errors and errors[0]["type"] == "json_invalid":
+        return "json"
+    return "schema"
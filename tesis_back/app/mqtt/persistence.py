@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from sqlalchemy import insert
+from app.core.config import settings
+from app.database.session import AsyncSessionLocal
+from app.models.lectura import lectura
+
+logger = logging.getLogger(__name__)
+
+
+class LecturaBatchWriter:
+    """
+    Persistencia write-behind de lecturas.
+
+    El consumer solo agrega filas en memoria (add); una tarea aparte (run)
+    las escribe en micro-lotes con un único INSERT multi-fila, cuando se
+    llena el lote o cuando vence el intervalo de flush.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = settings.LECTURA_BATCH_SIZE,
+        flush_interval: float = settings.LECTURA_FLUSH_INTERVAL_SECONDS,
+        max_pending: int = settings.LECTURA_MAX_PENDING,
+    ):
+        self._session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._pending: deque[dict] = deque()
+        self._wakeup = asyncio.Event()
+        self._closed = False
+
+        # métricas
+        self.batches = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.failed_batches = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def add(self, id_dispositivo: int, ts: datetime, telemetry: dict) -> None:
+        """Agrega una lectura validada al lote en curso (no bloquea)."""
+        if len(self._pending) >= self.max_pending:
+            # la base no da abasto: se descarta la lectura más antigua
+            self._pending.popleft()
+            self.rows_dropped += 1
+            if self.rows_dropped % 1000 == 1:
+                logger.warning("[DB FLUSH] Buffer lleno, descartadas=%d pendientes=%d", self.rows_dropped, len(self._pending))
+
+        self._pending.append({
+            "id_dispositivo": id_dispositivo,
+            "fecha_de_medicion": ts,
+            "valor_ph": telemetry["ph"],
+            "valor_temperatura": telemetry["temperatura"],
+            "valor_turbidez": telemetry["turbidez"],
+            "valor_conductividad": telemetry["tds"],
+        })
+
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def run(self) -> None:
+        logger.info(
+            "[DB FLUSH] Writer iniciado batch_size=%d flush_interval=%.2fs",
+            self.batch_size, self.flush_interval,
+        )
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            # vaciar lotes completos y luego el remanente por tiempo
+            while self._pending:
+                ok = await self._flush_once()
+                if not ok or len(self._pending) < self.batch_size:
+                    break
+
+    async def close(self) -> None:
+        """Detiene el writer y escribe lo que quede pendiente."""
+        self._closed = True
+        self._wakeup.set()
+        while self._pending:
+            if not await self._flush_once():
+                logger.error("[DB FLUSH] Cierre con %d lecturas sin persistir", len(self._pending))
+                break
+
+    async def _flush_once(self) -> bool:
+        pending = self._pending
+        rows = [pending.popleft() for _ in range(min(self.batch_size, len(pending)))]
+
+        t0 = time.perf_counter()
+        try:
+            async with self._session_factory() as session:
+                # un solo INSERT ... VALUES (...), (...), ... por lote
+                await session.execute(insert(lectura).values(rows))
+                await session.commit()
+        except Exception as e:
+            self.failed_batches += 1
+            # devolver el lote al frente para reintentar en el siguiente ciclo
+            self._pending.extendleft(reversed(rows))
+            overflow = len(self._pending) - self.max_pending
+            for _ in range(max(overflow, 0)):
+                self._pending.popleft()
+                self.rows_dropped += 1
+            logger.exception("[DB FLUSH] Error insertando lote filas=%d err=%s", len(rows), e)
+            return False
+
+        elapsed_ms = (time.perf_counter() - t0) * 1000
+        self.batches += 1
+        self.rows_written += len(rows)
+        self.last_batch_size = len(rows)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+
+        logger.info(
+            "[DB FLUSH] filas=%d latencia_ms=%.1f pendientes=%d total=%d",
+            len(rows), elapsed_ms, len(self._pending), self.rows_written,
+        )
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "failed_batches": self.failed_batches,
+            "pending": len(self._pending),
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+        }
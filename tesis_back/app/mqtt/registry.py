@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from sqlalchemy import select
+from app.core.config import settings
+from app.database.session import AsyncSessionLocal
+from app.models.dispositivos import dispositivos
+from app.models.enums import DeviceRole
+from app.models.usuarios import usuarios
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class RegistroSensor:
+    """Cadena gateway -> sensor -> usuario ya validada."""
+    id_gateway: int
+    id_sensor: int
+    id_usuario: int
+    correo: str
+    id_perfil: int | None = None  # perfil de umbrales del sensor o, si no tiene, del gateway
+
+
+class DeviceRegistryCache:
+    """
+    Cache en proceso de la relación gateway/sensor/usuario, por (mac_gw, mac_esp).
+
+    - Entradas positivas con TTL y expulsión LRU.
+    - Entradas negativas (MAC no registrada, relación inválida, usuario inexistente)
+      con un TTL más corto, para que topics falsificados no golpeen la base.
+    - Las escrituras de la API invalidan por MAC o por usuario (ver handle_event).
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        ttl: float = settings.REGISTRY_CACHE_TTL_SECONDS,
+        negative_ttl: float = settings.REGISTRY_NEGATIVE_TTL_SECONDS,
+        max_entries: int = settings.REGISTRY_CACHE_MAX_ENTRIES,
+    ):
+        self._session_factory = session_factory
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+        # (mac_gw, mac_esp) -> (expira_en, RegistroSensor | None, id_usuario | None)
+        self._entries: OrderedDict[tuple[str, str], tuple[float, RegistroSensor | None, int | None]] = OrderedDict()
+        # consultas en curso, para no repetir la misma carga en paralelo
+        self._inflight: dict[tuple[str, str], asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def resolve(self, mac_gw: str, mac_esp: str) -> RegistroSensor | None:
+        """Devuelve el registro validado o None si el par no es válido."""
+        key = (mac_gw, mac_esp)
+        cached = self._entries.get(key)
+        if cached is not None:
+            expires_at, registro, _ = cached
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                if registro is None:
+                    self.negative_hits += 1
+                    logger.debug("[REGISTRY] negativo en cache mac_gw=%s mac_esp=%s", mac_gw, mac_esp)
+                else:
+                    self.hits += 1
+                return registro
+            del self._entries[key]
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await pending
+
+        self.misses += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            registro, id_usuario = await self._load(mac_gw, mac_esp)
+            self._store(key, registro, id_usuario)
+            fut.set_result(registro)
+            return registro
+        except Exception as e:
+            fut.set_exception(e)
+            # evitar "Future exception was never retrieved" si nadie más esperaba
+            fut.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def _store(self, key: tuple[str, str], registro: RegistroSensor | None, id_usuario: int | None) -> None:
+        ttl = self.ttl if registro is not None else self.negative_ttl
+        self._entries[key] = (time.monotonic() + ttl, registro, id_usuario)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _load(self, mac_gw: str, mac_esp: str) -> tuple[RegistroSensor | None, int | None]:
+        async with self._session_factory() as session:
+            stmt = select(dispositivos).where(dispositivos.mac.in_((mac_gw, mac_esp)))
+            by_mac = {d.mac: d for d in (await session.execute(stmt)).scalars().all()}
+            gw = by_mac.get(mac_gw)
+            esp = by_mac.get(mac_esp)
+
+            if gw is None:
+                logger.warning("[DEVICE INVALID] gateway no registrado mac_gw=%s", mac_gw)
+                return None, None
+
+            if esp is None:
+                logger.warning("[DEVICE INVALID] sensor no registrado mac_esp=%s", mac_esp)
+                return None, None
+
+            if gw.rol_dispositivo != DeviceRole.gateway:
+                logger.warning("[DEVICE INVALID] mac_gw=%s no es gateway (rol=%s)", mac_gw, gw.rol_dispositivo)
+                return None, None
+
+            if esp.rol_dispositivo != DeviceRole.sensor:
+                logger.warning("[DEVICE INVALID] mac_esp=%s no es sensor (rol=%s)", mac_esp, esp.rol_dispositivo)
+                return None, None
+
+            if esp.id_padre != gw.id_dispositivo:
+                logger.warning(
+                    "[DEVICE INVALID] relación inválida: sensor.id_padre=%s gateway.id=%s mac_esp=%s mac_gw=%s",
+                    esp.id_padre,
+                    gw.id_dispositivo,
+                    mac_esp,
+                    mac_gw,
+                )
+                return None, None
+
+            user_id = esp.id_usuario
+            stmt_user = select(usuarios.id_usuario, usuarios.nombre, usuarios.correo).where(usuarios.id_usuario == user_id)
+            user = (await session.execute(stmt_user)).one_or_none()
+
+        if user is None:
+            logger.warning("[USER INVALID] no existe usuario id_usuario=%s (mac_esp=%s)", user_id, mac_esp)
+            return None, user_id
+
+        logger.info("[USER VALID] id_usuario=%s nombre=%s correo=%s", user.id_usuario, user.nombre, user.correo)
+        registro = RegistroSensor(
+            id_gateway=gw.id_dispositivo,
+            id_sensor=esp.id_dispositivo,
+            id_usuario=user.id_usuario,
+            correo=user.correo,
+            id_perfil=esp.id_perfil_umbral or gw.id_perfil_umbral,
+        )
+        return registro, user_id
+
+    # -----------------------------
+    # Invalidación
+    # -----------------------------
+    def invalidate_mac(self, mac: str) -> int:
+        keys = [k for k in self._entries if mac in k]
+        for k in keys:
+            del self._entries[k]
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def invalidate_user(self, id_usuario: int) -> int:
+        keys = [k for k, (_, _, uid) in self._entries.items() if uid == id_usuario]
+        for k in keys:
+            del self._entries[k]
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def handle_event(self, event: dict) -> None:
+        """
+        Aplica un evento de invalidación publicado por la API
+        (ver app.service.registry_events). Formato:
+        {"macs": [...], "id_usuario": int | None}
+        """
+        removed = 0
+        for mac in event.get("macs") or ():
+            removed += self.invalidate_mac(mac)
+        id_usuario = event.get("id_usuario")
+        if id_usuario is not None:
+            removed += self.invalidate_user(int(id_usuario))
+        logger.info("[REGISTRY] invalidación evento=%s entradas=%d", event, removed)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
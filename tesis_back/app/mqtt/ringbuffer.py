@@ -0,0 +1,157 @@
+from array import array
+
+try:  # numpy es opcional: si está, las estadísticas se calculan vectorizadas
+    import numpy as np
+except ImportError:
+    np = None
+
+METRICS = ("ph", "temperatura", "turbidez", "tds")
+
+
+class SensorRingBuffer:
+    """
+    Ventana de tiempo real de un sensor en formato columnar.
+
+    En lugar de una deque de (datetime, dict) guarda un array float64 de
+    timestamps (epoch en segundos) y un array float32 por métrica, con
+    capacidad fija preasignada. Agregar y descartar por antigüedad es O(1)
+    amortizado; si se llena la capacidad se pisa la lectura más vieja.
+    Las lecturas más viejas que la última guardada se rechazan: la ventana
+    queda ordenada y evict() solo necesita mirar la cabeza.
+    """
+
+    __slots__ = ("capacity", "window_seconds", "_ts", "_cols", "_head", "_size")
+
+    def __init__(self, capacity: int, window_seconds: float):
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self._ts = array("d", [0.0]) * capacity
+        self._cols = tuple(array("f", [0.0]) * capacity for _ in METRICS)
+        self._head = 0  # posición de la lectura más vieja
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, ts: float, ph: float, temperatura: float, turbidez: float, tds: float) -> bool:
+        cap = self.capacity
+        if self._size and ts < self._ts[(self._head + self._size - 1) % cap]:
+            # fuera de orden (p.ej. lote atrasado del bridge): no entra a la ventana
+            return False
+        if self._size == cap:
+            idx = self._head
+            self._head = (self._head + 1) % cap
+        else:
+            idx = (self._head + self._size) % cap
+            self._size += 1
+
+        self._ts[idx] = ts
+        c_ph, c_temp, c_turb, c_tds = self._cols
+        c_ph[idx] = ph
+        c_temp[idx] = temperatura
+        c_turb[idx] = turbidez
+        c_tds[idx] = tds
+
+        self.evict(ts - self.window_seconds)
+        return True
+
+    def evict(self, cutoff: float) -> None:
+        """Descarta las lecturas anteriores a `cutoff` (epoch en segundos)."""
+        ts = self._ts
+        cap = self.capacity
+        while self._size and ts[self._head] < cutoff:
+            self._head = (self._head + 1) % cap
+            self._size -= 1
+
+    def _ordered(self, arr: array) -> array:
+        """Copia de la ventana en orden cronológico."""
+        start = self._head
+        end = start + self._size
+        if end <= self.capacity:
+            return arr[start:end]
+        return arr[start:] + arr[:end - self.capacity]
+
+    def timestamps(self) -> array:
+        return self._ordered(self._ts)
+
+    def rows(self):
+        """Itera (ts, ph, temperatura, turbidez, tds) en orden cronológico."""
+        cap = self.capacity
+        for i in range(self._size):
+            idx = (self._head + i) % cap
+            yield (self._ts[idx],) + tuple(col[idx] for col in self._cols)
+
+    def window_stats(self) -> dict:
+        """
+        mean/min/max y pendiente (unidades por minuto, mínimos cuadrados)
+        de cada métrica sobre la ventana actual.
+        """
+        n = self._size
+        if n == 0:
+            return {}
+        ts = self.timestamps()
+
+        if np is not None:
+            t = np.frombuffer(ts, dtype=np.float64)
+            t = t - t.mean()
+            denom = float((t * t).sum())
+            out = {}
+            for metric, col in zip(METRICS, self._cols):
+                v = np.frombuffer(self._ordered(col), dtype=np.float32).astype(np.float64)
+                slope = float((t * (v - v.mean())).sum() / denom) * 60 if denom else 0.0
+                out[metric] = {"mean": float(v.mean()), "min": float(v.min()), "max": float(v.max()), "slope": slope}
+            return out
+
+        t_mean = sum(ts) / n
+        t = [x - t_mean for x in ts]
+        denom = sum(x * x for x in t)
+        out = {}
+        for metric, col in zip(METRICS, self._cols):
+            v = self._ordered(col)
+            v_mean = sum(v) / n
+            slope = (sum(x * (y - v_mean) for x, y in zip(t, v)) / denom) * 60 if denom else 0.0
+            out[metric] = {"mean": v_mean, "min": min(v), "max": max(v), "slope": slope}
+        return out
+
+    def __copy__(self):
+        """Copia independiente (los arrays se copian en C): la foto del checkpoint."""
+        other = SensorRingBuffer.__new__(SensorRingBuffer)
+        other.capacity = self.capacity
+        other.window_seconds = self.window_seconds
+        other._ts = self._ts[:]
+        other._cols = tuple(col[:] for col in self._cols)
+        other._head = self._head
+        other._size = self._size
+        return other
+
+    # Serialización compacta para los checkpoints del worker: solo la
+    # ventana válida, en orden, como bytes crudos de cada array.
+    def __getstate__(self):
+        return (
+            self.capacity,
+            self.window_seconds,
+            self.timestamps().tobytes(),
+            tuple(self._ordered(col).tobytes() for col in self._cols),
+        )
+
+    def __setstate__(self, state):
+        capacity, window_seconds, ts_bytes, cols_bytes = state
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self._ts = array("d", [0.0]) * capacity
+        self._cols = tuple(array("f", [0.0]) * capacity for _ in METRICS)
+        ts = array("d")
+        ts.frombytes(ts_bytes)
+        # un checkpoint guardado con más capacidad: quedan las más nuevas
+        skip = max(0, len(ts) - capacity)
+        n = len(ts) - skip
+        self._ts[:n] = ts[skip:]
+        for col, raw in zip(self._cols, cols_bytes):
+            values = array("f")
+            values.frombytes(raw)
+            col[:n] = values[skip:]
+        self._head = 0
+        self._size = n
+
+    def nbytes(self) -> int:
+        return self._ts.itemsize * self.capacity + sum(c.itemsize * self.capacity for c in self._cols)
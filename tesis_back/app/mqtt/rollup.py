@@ -0,0 +1,309 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.core.config import settings
+from app.database.session import AsyncSessionLocal
+from app.models.lectura_hora import lectura_hora
+
+logger = logging.getLogger(__name__)
+
+# campo de la telemetría -> prefijo de columna en lectura_hora
+METRIC_COLUMNS = {
+    "ph": "ph",
+    "temperatura": "temperatura",
+    "turbidez": "turbidez",
+    "tds": "conductividad",
+}
+
+
+def hour_floor(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def _new_acc(id_dispositivo: int, hour_start: datetime) -> dict:
+    return {
+        "id_dispositivo": id_dispositivo,
+        "hour_start": hour_start,
+        "count": 0,
+        "sum": {k: 0.0 for k in METRIC_COLUMNS},
+        "min": {k: None for k in METRIC_COLUMNS},
+        "max": {k: None for k in METRIC_COLUMNS},
+    }
+
+
+def _acc_to_row(acc: dict) -> dict:
+    count = acc["count"]
+    row = {
+        "id_dispositivo": acc["id_dispositivo"],
+        "hora_inicio": acc["hour_start"],
+        "cantidad": count,
+    }
+    for field, col in METRIC_COLUMNS.items():
+        row[f"{col}_min"] = acc["min"][field]
+        row[f"{col}_max"] = acc["max"][field]
+        row[f"{col}_promedio"] = acc["sum"][field] / count
+    return row
+
+
+def _upsert_statement(rows: list[dict]):
+    """
+    INSERT multi-fila con ON DUPLICATE KEY UPDATE que combina con lo ya
+    guardado (p.ej. una hora parcial escrita antes de un reinicio).
+    MySQL evalúa las asignaciones en orden, por eso `cantidad` va al final:
+    los promedios ponderados deben ver la cantidad anterior.
+    """
+    stmt = mysql_insert(lectura_hora).values(rows)
+    new = stmt.inserted
+    t = lectura_hora.__table__.c
+    updates = []
+    for col in METRIC_COLUMNS.values():
+        updates.append((f"{col}_min", func.least(t[f"{col}_min"], new[f"{col}_min"])))
+        updates.append((f"{col}_max", func.greatest(t[f"{col}_max"], new[f"{col}_max"])))
+        updates.append((
+            f"{col}_promedio",
+            (t[f"{col}_promedio"] * t.cantidad + new[f"{col}_promedio"] * new.cantidad)
+            / (t.cantidad + new.cantidad),
+        ))
+    updates.append(("cantidad", t.cantidad + new.cantidad))
+    return stmt.on_duplicate_key_update(updates)
+
+
+def _upsert_statement_sqlite(rows: list[dict]):
+    """
+    Equivalente para SQLite (base de reemplazo de los benchmarks). Aquí el
+    SET ve los valores anteriores en todas las columnas, el orden no importa.
+    """
+    stmt = sqlite_insert(lectura_hora).values(rows)
+    new = stmt.excluded
+    t = lectura_hora.__table__.c
+    updates = {"cantidad": t.cantidad + new.cantidad}
+    for col in METRIC_COLUMNS.values():
+        # min()/max() con varios argumentos son escalares en SQLite
+        updates[f"{col}_min"] = func.min(t[f"{col}_min"], new[f"{col}_min"])
+        updates[f"{col}_max"] = func.max(t[f"{col}_max"], new[f"{col}_max"])
+        updates[f"{col}_promedio"] = (
+            (t[f"{col}_promedio"] * t.cantidad + new[f"{col}_promedio"] * new.cantidad)
+            / (t.cantidad + new.cantidad)
+        )
+    return stmt.on_conflict_do_update(index_elements=["id_dispositivo", "hora_inicio"], set_=updates)
+
+
+class HourlyRollup:
+    """
+    Acumuladores horarios por sensor (min/max/suma/cantidad) y su
+    persistencia en `lectura_hora`.
+
+    Una hora se cierra cuando llega una lectura de la hora siguiente o,
+    si el sensor dejó de reportar, cuando el timer de run() ve que la hora
+    ya terminó. Las lecturas de horas anteriores a la en curso se juntan en
+    acumuladores aparte que se cierran en cada flush (el upsert las combina).
+    Las filas cerradas se escriben en un único upsert por ciclo.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        flush_interval: float = settings.ROLLUP_FLUSH_INTERVAL_SECONDS,
+        max_pending: int = settings.ROLLUP_MAX_PENDING,
+        batch_size: int = settings.LECTURA_BATCH_SIZE,
+    ):
+        self._session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self.acc: dict[str, dict] = {}   # sensor_key -> acumulador de la hora en curso
+        self._closed: list[dict] = []    # filas listas para escribir
+        self._late: dict[tuple[str, datetime], dict] = {}  # (sensor_key, hora) atrasadas
+        self.on_close = None             # callback(key) al cerrar una hora (checkpoint)
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+
+    def add(self, key: str, id_dispositivo: int, ts: datetime, telemetry: dict) -> None:
+        current_hour = hour_floor(ts)
+
+        acc = self.acc.get(key)
+        if acc is not None and current_hour < acc["hour_start"]:
+            # lectura atrasada: va a su propio acumulador sin cerrar la hora en curso
+            acc = self._late_acc(key, id_dispositivo, current_hour)
+        elif acc is not None and acc["hour_start"] != current_hour:
+            self._close(key, acc)
+            acc = None
+        if acc is None:
+            acc = _new_acc(id_dispositivo, current_hour)
+            self.acc[key] = acc
+
+        # acumular (solo si existen valores)
+        # Nota: el schema siempre trae los 4, pero igual dejamos defensivo
+        for field in METRIC_COLUMNS:
+            v = telemetry.get(field)
+            if v is None:
+                continue
+            v = float(v)
+            acc["sum"][field] += v
+            lo = acc["min"][field]
+            if lo is None or v < lo:
+                acc["min"][field] = v
+            hi = acc["max"][field]
+            if hi is None or v > hi:
+                acc["max"][field] = v
+
+        acc["count"] += 1
+
+    def add_summary(
+        self,
+        key: str,
+        id_dispositivo: int,
+        ts: datetime,
+        count: int,
+        minimos: dict,
+        maximos: dict,
+        promedios: dict,
+    ) -> None:
+        """
+        Suma un resumen de `count` lecturas (min/max/promedio por métrica)
+        que el bridge no reenvió de a una (procesamiento en el borde).
+        """
+        hour = hour_floor(ts)
+        acc = self.acc.get(key)
+        if acc is not None and hour < acc["hour_start"]:
+            # llegó después de lecturas de la hora siguiente: fila parcial aparte
+            # (el upsert la combina) sin cerrar la hora en curso
+            self._merge(self._late_acc(key, id_dispositivo, hour), count, minimos, maximos, promedios)
+            return
+        if acc is not None and acc["hour_start"] != hour:
+            self._close(key, acc)
+            acc = None
+        if acc is None:
+            acc = _new_acc(id_dispositivo, hour)
+            self.acc[key] = acc
+        self._merge(acc, count, minimos, maximos, promedios)
+
+    def _late_acc(self, key: str, id_dispositivo: int, hour: datetime) -> dict:
+        acc = self._late.get((key, hour))
+        if acc is None:
+            acc = _new_acc(id_dispositivo, hour)
+            self._late[(key, hour)] = acc
+        return acc
+
+    def _close_late(self) -> None:
+        """Pasa las horas atrasadas a filas: una por sensor y hora en cada flush."""
+        late, self._late = self._late, {}
+        for (key, _), acc in late.items():
+            self._close(key, acc)
+
+    @staticmethod
+    def _merge(acc: dict, count: int, minimos: dict, maximos: dict, promedios: dict) -> None:
+        for field in METRIC_COLUMNS:
+            acc["sum"][field] += promedios[field] * count
+            lo = acc["min"][field]
+            if lo is None or minimos[field] < lo:
+                acc["min"][field] = minimos[field]
+            hi = acc["max"][field]
+            if hi is None or maximos[field] > hi:
+                acc["max"][field] = maximos[field]
+        acc["count"] += count
+
+    def _close(self, key: str, acc: dict) -> None:
+        if self.on_close is not None:
+            self.on_close(key)
+        count = acc["count"]
+        if count == 0:
+            logger.info("[HOUR FLUSH] sensor=%s hour_start=%s (sin datos)", key, acc["hour_start"])
+            return
+        row = _acc_to_row(acc)
+        logger.info(
+            "[HOUR FLUSH] sensor=%s hour_start=%s count=%s avg_ph=%.2f",
+            key, acc["hour_start"], count, row["ph_promedio"],
+        )
+        self._closed.append(row)
+        if len(self._closed) > self.max_pending:
+            overflow = len(self._closed) - self.max_pending
+            del self._closed[:overflow]
+            self.rows_dropped += overflow
+            logger.warning("[HOUR FLUSH] Pendientes excedidas, descartadas=%d", self.rows_dropped)
+
+    def close_idle(self, now: datetime | None = None) -> int:
+        """Cierra las horas ya terminadas de sensores que no volvieron a reportar."""
+        current_hour = hour_floor(now or datetime.now())
+        stale = [k for k, acc in self.acc.items() if acc["hour_start"] < current_hour]
+        for key in stale:
+            self._close(key, self.acc.pop(key))
+        return len(stale)
+
+    def close_all(self) -> None:
+        """Cierra también las horas en curso (parciales); el upsert las combina luego."""
+        for key in list(self.acc):
+            self._close(key, self.acc.pop(key))
+
+    async def run(self) -> None:
+        logger.info("[HOUR FLUSH] Rollup iniciado intervalo=%.0fs", self.flush_interval)
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            idle = self.close_idle()
+            if idle:
+                logger.info("[HOUR FLUSH] %d horas cerradas por inactividad", idle)
+            await self.flush()
+
+    def restore(self, acc: dict[str, dict], pending_rows: list[dict]) -> None:
+        """Carga el estado de un checkpoint (arranque en caliente)."""
+        self.acc.update(acc)
+        self._closed[:0] = pending_rows
+
+    async def close(self, partial: bool = True) -> None:
+        """
+        partial=False deja las horas en curso en memoria (las guarda el
+        checkpoint) y solo escribe las ya cerradas.
+        """
+        if partial:
+            self.close_all()
+        await self.flush()
+
+    def pending_rows(self) -> list[dict]:
+        # las horas atrasadas todavía abiertas también van al checkpoint
+        return list(self._closed) + [_acc_to_row(acc) for acc in self._late.values()]
+
+    async def flush(self) -> bool:
+        self._close_late()
+        if not self._closed:
+            return True
+        rows, self._closed = self._closed, []
+
+        t0 = time.perf_counter()
+        try:
+            async with self._session_factory() as session:
+                upsert = _upsert_statement
+                if session.get_bind().dialect.name == "sqlite":
+                    upsert = _upsert_statement_sqlite
+                # al cambiar la hora cierran casi todos los sensores a la vez
+                for i in range(0, len(rows), self.batch_size):
+                    await session.execute(upsert(rows[i:i + self.batch_size]))
+                await session.commit()
+        except Exception as e:
+            self.failed_flushes += 1
+            self._closed[:0] = rows
+            logger.exception("[HOUR FLUSH] Error guardando resumen horario filas=%d err=%s", len(rows), e)
+            return False
+
+        self.last_flush_ms = (time.perf_counter() - t0) * 1000
+        self.rows_written += len(rows)
+        logger.info("[HOUR FLUSH] filas=%d latencia_ms=%.1f", len(rows), self.last_flush_ms)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "open_hours": len(self.acc),
+            "late_hours": len(self._late),
+            "pending_rows": len(self._closed),
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
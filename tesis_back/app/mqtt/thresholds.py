@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import math
+import time
+from sqlalchemy import select
+from app.core.config import settings
+from app.database.session import AsyncSessionLocal
+from app.models.perfil_umbral import perfil_umbral
+from app.utils.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+ALERT_THRESHOLD_PROFILES = Gauge("alert_threshold_profiles", "Perfiles de umbrales cargados en el worker")
+ALERT_THRESHOLD_RELOADS = Counter("alert_threshold_reloads_total", "Recargas de perfil_umbral", ["result"])
+ALERT_RULES_BATCH = Histogram(
+    "alert_rules_batch_size",
+    "Lecturas evaluadas juntas por el motor de reglas",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+
+# Reglas posibles, en orden de bit: (límite del perfil, métrica, comparación, motivo).
+# Un perfil compilado es un vector de límites en este orden (NaN = regla apagada)
+# y el resultado de evaluar una lectura es una máscara de bits de las reglas que
+# dispararon; el texto del motivo solo se arma cuando hace falta.
+RULES = (
+    ("ph_min", "ph", "<", "pH bajo ({value} < {limit})"),
+    ("ph_max", "ph", ">", "pH alto ({value} > {limit})"),
+    ("temperatura_min", "temperatura", "<", "Temperatura baja ({value} < {limit})"),
+    ("temperatura_max", "temperatura", ">", "Temperatura alta ({value} > {limit})"),
+    ("turbidez_max", "turbidez", ">=", "Turbidez alta ({value} >= {limit})"),
+    ("tds_max", "tds", ">", "TDS alto ({value} > {limit})"),
+)
+LIMIT_FIELDS = tuple(rule[0] for rule in RULES)
+
+
+class CompiledProfile:
+    """Reglas activas de un perfil, listas para evaluar."""
+
+    __slots__ = ("id_perfil", "nombre", "limits", "_checks")
+
+    def __init__(self, id_perfil: int | None, nombre: str, limits: dict):
+        self.id_perfil = id_perfil
+        self.nombre = nombre
+        self.limits = tuple(
+            float(limits[field]) if limits.get(field) is not None else math.nan
+            for field in LIMIT_FIELDS
+        )
+        # solo las reglas con límite: (bit, métrica, comparación, límite)
+        self._checks = tuple(
+            (1 << i, metric, op, limit)
+            for i, ((_, metric, op, _), limit) in enumerate(zip(RULES, self.limits))
+            if not math.isnan(limit)
+        )
+
+    def evaluate(self, telemetry: dict) -> int:
+        """Máscara de las reglas que dispara una lectura (0 = normal)."""
+        mask = 0
+        for bit, metric, op, limit in self._checks:
+            value = telemetry[metric]
+            if op == "<":
+                fired = value < limit
+            elif op == ">=":
+                fired = value >= limit
+            else:
+                fired = value > limit
+            if fired:
+                mask |= bit
+        return mask
+
+    def reasons(self, telemetry: dict, mask: int) -> list[str]:
+        return [
+            template.format(value=telemetry[metric], limit=self.limits[i])
+            for i, (_, metric, _, template) in enumerate(RULES)
+            if mask & (1 << i)
+        ]
+
+    @staticmethod
+    def rule_names(mask: int) -> list[str]:
+        return [field for i, field in enumerate(LIMIT_FIELDS) if mask & (1 << i)]
+
+
+class ThresholdProfiles:
+    """
+    Perfiles de umbrales (tabla perfil_umbral) compilados en memoria del worker.
+
+    - El perfil de una lectura es el del sensor o, si no tiene, el de su
+      gateway (RegistroSensor.id_perfil); sin perfil rige el global de
+      PH_MIN, PH_MAX, TURB_MAX y TDS_MAX.
+    - evaluate_batch evalúa un micro-lote de lecturas, cada una solo con
+      las reglas activas de su perfil. Se probó una versión con numpy
+      (lecturas x reglas): armar los arrays desde los dicts cuesta más de
+      lo que ahorra la comparación, aun con lotes de 2048 lecturas.
+    - Recarga en caliente: la API publica un evento de control al cambiar
+      un perfil (request_reload), y además se recarga cada refresh_interval
+      por si el evento se pierde. Un id desconocido (perfil recién creado)
+      también pide una recarga; mientras tanto se usa el global. Si tras la
+      recarga sigue sin existir (registro desactualizado que apunta a un
+      perfil borrado) no vuelve a pedir recargas; si aparece, lo trae la
+      próxima recarga por evento o periódica.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        refresh_interval: float = settings.THRESHOLD_PROFILES_REFRESH_SECONDS,
+    ):
+        self._session_factory = session_factory
+        self.refresh_interval = refresh_interval
+        self.default = CompiledProfile(None, "global", {
+            "ph_min": settings.PH_MIN,
+            "ph_max": settings.PH_MAX,
+            "turbidez_max": settings.TURB_MAX,
+            "tds_max": settings.TDS_MAX,
+        })
+        self._profiles: dict[int, CompiledProfile] = {}
+        self._missing: set[int] = set()  # ids que ya pidieron recarga (o que no existen)
+        self._reload = asyncio.Event()
+        self.on_reload = None  # callback(ThresholdProfiles) tras cada carga exitosa
+
+        self.reloads = 0
+        self.unknown = 0
+        self.evaluated = 0
+        ALERT_THRESHOLD_PROFILES.set_function(lambda: len(self._profiles))
+
+    def get(self, id_perfil: int | None) -> CompiledProfile:
+        if id_perfil is None:
+            return self.default
+        profile = self._profiles.get(id_perfil)
+        if profile is None:
+            self.unknown += 1
+            if id_perfil not in self._missing:
+                self._missing.add(id_perfil)
+                self._reload.set()
+            return self.default
+        return profile
+
+    def evaluate_batch(self, profiles: list[CompiledProfile], telemetries: list[dict]) -> list[int]:
+        """Máscara de reglas disparadas por cada lectura, en el mismo orden."""
+        n = len(telemetries)
+        ALERT_RULES_BATCH.observe(n)
+        self.evaluated += n
+        return [profile.evaluate(t) for profile, t in zip(profiles, telemetries)]
+
+    def request_reload(self) -> None:
+        self._reload.set()
+
+    async def load(self) -> None:
+        t0 = time.perf_counter()
+        async with self._session_factory() as session:
+            rows = (await session.execute(select(perfil_umbral))).scalars().all()
+
+        profiles = {
+            row.id_perfil: CompiledProfile(
+                row.id_perfil, row.nombre, {field: getattr(row, field) for field in LIMIT_FIELDS},
+            )
+            for row in rows
+        }
+        self._profiles = profiles
+        # los que siguen sin aparecer no existen: no piden otra recarga por lectura
+        self._missing = {id_perfil for id_perfil in self._missing if id_perfil not in profiles}
+        self.reloads += 1
+        logger.info("[THRESHOLDS] %d perfiles cargados en %.1f ms", len(profiles), (time.perf_counter() - t0) * 1000)
+
+    async def run(self) -> None:
+        while True:
+            self._reload.clear()
+            try:
+                await self.load()
+                ALERT_THRESHOLD_RELOADS.labels("ok").inc()
+                if self.on_reload is not None:
+                    self.on_reload(self)
+            except Exception:
+                ALERT_THRESHOLD_RELOADS.labels("error").inc()
+                logger.exception("[THRESHOLDS] No se pudieron cargar los perfiles, se mantienen los anteriores")
+            try:
+                await asyncio.wait_for(self._reload.wait(), timeout=self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def edge_limits(self) -> dict:
+        """
+        Límite más estricto de cada regla entre el global y todos los perfiles
+        (None = ningún perfil la usa): una lectura que dispara algún perfil
+        siempre los cruza. El borde (tesis_raspberry/edge.py) los usa para
+        reenviar al instante lo que puede abrir o cerrar una alerta.
+        """
+        limits = {}
+        profiles = (self.default, *self._profiles.values())
+        for i, (field, _, op, _) in enumerate(RULES):
+            values = [p.limits[i] for p in profiles if not math.isnan(p.limits[i])]
+            if not values:
+                limits[field] = None
+            else:
+                limits[field] = max(values) if op == "<" else min(values)
+        return limits
+
+    def stats(self) -> dict:
+        return {
+            "profiles": len(self._profiles),
+            "reloads": self.reloads,
+            "unknown": self.unknown,
+            "evaluated": self.evaluated,
+            "missing": len(self._missing),
+        }
@@ -2,34 +2,107 @@ import time
 import paho.mqtt.client as mqtt
 import json
 import asyncio
+import concurrent.futures
 import threading
+import zlib
 from datetime import datetime, timedelta
-from collections import deque
 from app.core.config import settings
 from app.utils.logging_config import configure_logging
-from app.schemas.lecturas import LecturaBaseMQTT
-from sqlalchemy import select
-from app.models.enums import DeviceRole
-from app.models.dispositivos import dispositivos
 from pydantic import ValidationError
-from app.database.session import AsyncSessionLocal
-from app.models.usuarios import usuarios
-from app.utils.Correo import send_alert_email
+from app.utils.Correo import AlertOutbox
+from app.mqtt.persistence import LecturaBatchWriter
+from app.mqtt.registry import DeviceRegistryCache
+from app.mqtt.heartbeat import HeartbeatTracker
+from app.mqtt.thresholds import CompiledProfile, ThresholdProfiles
+from app.mqtt.rollup import HourlyRollup
+from app.mqtt.ringbuffer import SensorRingBuffer
+from app.mqtt.checkpoint import WorkerCheckpoint
+from app.service.live_hub import encode_event
+from app.mqtt.ingest_queue import SensorQueue, POLICY_BLOCK
+from app.mqtt.codec import CodecError, decode_batch, is_binary
+from app.mqtt.parsing import (
+    BINARY_TOPIC_SUFFIX, parse_topic, parse_payload, parse_summary_topic, parse_summary, invalid_reason,
+    device_ts_valid,
+)
+from app.utils.metrics import Counter, Gauge, Histogram, start_http_server
 configure_logging()
 
 import logging
 logger = logging.getLogger(__name__)
 
-def main():
+# -----------------------------
+# Métricas (GET /metrics en WORKER_METRICS_PORT)
+# -----------------------------
+MQTT_RECEIVED = Counter("mqtt_messages_received_total", "Mensajes de telemetría recibidos")
+MQTT_OTHER_PARTITION = Counter("mqtt_messages_other_partition_total", "Mensajes de sensores de otra partición (descartados)")
+MQTT_INVALID_TOPIC = Counter("mqtt_invalid_topic_total", "Mensajes con topic inválido")
+MQTT_INVALID_PAYLOAD = Counter("mqtt_invalid_payload_total", "Payloads rechazados", ["reason"])
+MQTT_BATCHES = Counter("mqtt_batches_received_total", "Lotes recibidos del bridge")
+MQTT_SUMMARIES = Counter("mqtt_summaries_received_total", "Resúmenes de ventana recibidos del bridge")
+MQTT_BINARY = Counter("mqtt_messages_binary_total", "Mensajes con payload binario (app.mqtt.codec)")
+MQTT_DEVICE_TS_REJECTED = Counter("mqtt_device_timestamp_rejected_total", "Timestamps de dispositivo fuera de DEVICE_TS_MAX_SKEW_SECONDS / DEVICE_TS_MAX_AGE_SECONDS (en lotes, lecturas descartadas)")
+WORKER_DUPLICATES = Counter("worker_duplicate_readings_total", "Lecturas repetidas (misma secuencia que la anterior del sensor)")
+WORKER_UNKNOWN_DEVICE = Counter("worker_unknown_device_total", "Lecturas de dispositivos no registrados o inválidos")
+WORKER_PROCESSED = Counter("worker_readings_processed_total", "Lecturas válidas procesadas")
+WORKER_ALERTS = Counter("worker_alerts_total", "Alertas generadas", ["kind"])
+WORKER_QUEUE_DEPTH = Gauge("worker_queue_depth", "Lecturas esperando en la cola de cada shard", ["shard"])
+WORKER_DEVICES_OFFLINE = Gauge("worker_devices_offline", "Gateways y sensores sin reportar (DEVICE_OFFLINE_MISSED_INTERVALS)")
+WORKER_QUEUE_BLOCK_TIMEOUTS = Counter("worker_queue_block_timeouts_total", "Lecturas descartadas tras INGEST_QUEUE_BLOCK_TIMEOUT_SECONDS con la cola llena (política block)")
+WORKER_QUEUE_WAIT = Histogram("worker_queue_wait_seconds", "Tiempo de espera en cola hasta el consumer")
+
+def partition_for(mac_esp: str, partition_count: int) -> int:
+    """Proceso dueño de un sensor en modo multi-proceso (ver launcher.py)."""
+    return zlib.crc32(mac_esp.encode()) % partition_count
+
+
+def main(partition_index: int = 0, partition_count: int = 1):
     # buffers en memoria
-    realtime_buffer = {}   # sensor_key -> deque[(ts, telemetry_dict)]
-    hourly_acc = {}        # sensor_key -> {"hour_start": dt, "sum": {...}, "count": int}
+    realtime_buffer = {}   # sensor_key -> SensorRingBuffer (ventana columnar de los últimos minutos)
+    rollup = HourlyRollup()  # sensor_key -> acumulador horario (min/max/suma/cantidad)
     alert_state = {}       # sensor_key -> {"is_anomalous": bool, "last_email_at": dt|None, "last_reasons": list[str]}
+    last_sequence = {}     # sensor_key -> última secuencia recibida (payload binario)
 
     client = mqtt.Client(client_id="", protocol=mqtt.MQTTv311)  # auto-generate client ID
 
     loop = asyncio.new_event_loop()
-    queue = None  # se asignará dentro del hilo
+    num_shards = max(1, settings.WORKER_CONSUMERS)
+    queues = None  # list[SensorQueue], una por shard; se asignan dentro del hilo
+    # política block: encolados programados por el hilo de paho y ya aplicados
+    # por el loop; cada lista la escribe un solo hilo
+    put_scheduled = [0] * num_shards
+    put_applied = [0] * num_shards
+    # métricas por shard: procesados y lag (espera en cola) del último item / máximo del intervalo
+    shard_stats = [{"processed": 0, "lag_ms_last": 0.0, "lag_ms_max": 0.0} for _ in range(num_shards)]
+    writer = None  # LecturaBatchWriter, se crea dentro del hilo del loop
+    registry = DeviceRegistryCache()  # solo se usa desde el hilo del loop
+    outbox = None  # AlertOutbox, se crea dentro del hilo del loop
+    heartbeat = None  # HeartbeatTracker, se crea dentro del hilo del loop
+    thresholds = None  # ThresholdProfiles, se crea dentro del hilo del loop
+    partitioned = partition_count > 1
+    checkpoint = None
+    if settings.CHECKPOINT_ENABLED:
+        checkpoint = WorkerCheckpoint(
+            name=f"worker_state_p{partition_index}" if partitioned else "worker_state"
+        )
+
+    def owns(mac_esp: str) -> bool:
+        return not partitioned or partition_for(mac_esp, partition_count) == partition_index
+
+    # -----------------------------
+    # Arranque en caliente: recuperar cooldowns, horas en curso y ventanas
+    # antes de suscribirse, sin ir a la base
+    # -----------------------------
+    if checkpoint is not None:
+        saved_alerts, saved_hourly, saved_realtime, saved_pending = checkpoint.load()
+        if partitioned:
+            # si cambió la cantidad de procesos, descartar los sensores que ya no son de este
+            for saved in (saved_alerts, saved_hourly, saved_realtime):
+                for key in [k for k in saved if not owns(k.split("/", 1)[1])]:
+                    del saved[key]
+        alert_state.update(saved_alerts)
+        rollup.restore(saved_hourly, saved_pending)
+        realtime_buffer.update(saved_realtime)
+        rollup.on_close = checkpoint.mark
 
     # -----------------------------
     # Helpers (Paso 1)
@@ -37,85 +110,53 @@ def main():
     def sensor_key(mac_gw: str, mac_esp: str) -> str:
         return f"{mac_gw}/{mac_esp}"
 
-    def hour_floor(dt: datetime) -> datetime:
-        return dt.replace(minute=0, second=0, microsecond=0)
-
-    def check_anomaly(telemetry: dict) -> list[str]:
-        reasons = []
-        ph = telemetry.get("ph")
-        turb = telemetry.get("turbidez")
-        tds = telemetry.get("tds")
-        # temperatura es informativa, no genera alerta
-
-        if ph is not None:
-            if ph < settings.PH_MIN:
-                reasons.append(f"pH bajo ({ph} < {settings.PH_MIN})")
-            elif ph > settings.PH_MAX:
-                reasons.append(f"pH alto ({ph} > {settings.PH_MAX})")
-
-        if turb is not None and turb >= settings.TURB_MAX:
-            reasons.append(f"Turbidez alta ({turb} >= {settings.TURB_MAX})")
-
-        if tds is not None and tds > settings.TDS_MAX:
-            reasons.append(f"TDS alto ({tds} > {settings.TDS_MAX})")
-
-        return reasons
+    def shard_for(key: str) -> int:
+        # hash estable: el mismo sensor siempre cae en el mismo consumer,
+        # así sus lecturas se procesan en orden
+        return zlib.crc32(key.encode()) % num_shards
 
     def update_realtime_buffer(key: str, ts: datetime, telemetry: dict):
-        dq = realtime_buffer.get(key)
-        if dq is None:
-            dq = deque()
-            realtime_buffer[key] = dq
-
-        dq.append((ts, telemetry))
-
-        # limpiar > 10 minutos
-        cutoff = ts - timedelta(minutes=10)
-        while dq and dq[0][0] < cutoff:
-            dq.popleft()
-
-    def update_hourly_acc(key: str, ts: datetime, telemetry: dict):
-        current_hour = hour_floor(ts)
-
-        acc = hourly_acc.get(key)
-        if acc is None:
-            hourly_acc[key] = {
-                "hour_start": current_hour,
-                "sum": {"ph": 0.0, "temperatura": 0.0, "turbidez": 0.0, "tds": 0.0},
-                "count": 0,
-            }
-            acc = hourly_acc[key]
-
-        # si cambió la hora, “flush” del promedio anterior (por ahora solo log)
-        if acc["hour_start"] != current_hour:
-            prev_hour = acc["hour_start"]
-            count = acc["count"]
-            if count > 0:
-                avg = {k: (acc["sum"][k] / count) for k in acc["sum"].keys()}
-                logger.info("[HOUR FLUSH] sensor=%s hour_start=%s avg=%s count=%s", key, prev_hour, avg, count)
-            else:
-                logger.info("[HOUR FLUSH] sensor=%s hour_start=%s (sin datos)", key, prev_hour)
-
-            # reset para nueva hora
-            hourly_acc[key] = {
-                "hour_start": current_hour,
-                "sum": {"ph": 0.0, "temperatura": 0.0, "turbidez": 0.0, "tds": 0.0},
-                "count": 0,
-            }
-            acc = hourly_acc[key]
-
-        # acumular (solo si existen valores)
-        # Nota: tu schema siempre trae los 4, pero igual dejamos defensivo
-        for field in ("ph", "temperatura", "turbidez", "tds"):
-            v = telemetry.get(field)
-            if v is not None:
-                acc["sum"][field] += float(v)
-
-        acc["count"] += 1
-
-    def apply_alert_logic(key: str, ts: datetime, telemetry: dict, user_email: str, mac_gw: str, mac_esp: str):
-        reasons = check_anomaly(telemetry)
-        is_anomalous_now = len(reasons) > 0
+        buf = realtime_buffer.get(key)
+        if buf is None:
+            buf = SensorRingBuffer(settings.REALTIME_BUFFER_CAPACITY, settings.LIVE_WINDOW_MINUTES * 60)
+            realtime_buffer[key] = buf
+
+        # agrega y descarta lo anterior a la ventana (10 minutos por defecto);
+        # una lectura más vieja que la última (lote atrasado) no entra
+        buf.append(ts.timestamp(), telemetry["ph"], telemetry["temperatura"], telemetry["turbidez"], telemetry["tds"])
+
+    def publish_live(mac_gw: str, mac_esp: str, ts: datetime, telemetry: dict):
+        # QoS 0: si la API no está escuchando no importa perder el evento;
+        # paho encola y envía desde su propio hilo, no bloquea al consumer
+        if not settings.LIVE_PUBLISH_ENABLED:
+            return
+        client.publish(
+            f"{settings.MQTT_LIVE_TOPIC_PREFIX}/{mac_esp}",
+            encode_event(mac_gw, mac_esp, ts, telemetry),
+            qos=0,
+        )
+
+    edge_limits_sent = None
+
+    def publish_edge_limits(profiles: ThresholdProfiles):
+        # retained: el bridge lo recibe al (re)conectarse aunque no haya cambios
+        nonlocal edge_limits_sent
+        if not settings.MQTT_EDGE_LIMITS_TOPIC:
+            return
+        payload = json.dumps(profiles.edge_limits(), sort_keys=True, separators=(",", ":"))
+        if payload == edge_limits_sent:
+            return
+        client.publish(settings.MQTT_EDGE_LIMITS_TOPIC, payload, qos=1, retain=True)
+        edge_limits_sent = payload
+        logger.info("[THRESHOLDS] Límites del borde publicados en %s: %s", settings.MQTT_EDGE_LIMITS_TOPIC, payload)
+
+    def apply_alert_logic(
+        key: str, ts: datetime, telemetry: dict, user_email: str, mac_gw: str, mac_esp: str,
+        profile: CompiledProfile, mask: int,
+    ):
+        # mask: reglas del perfil que disparó la lectura (ThresholdProfiles.evaluate_batch);
+        # los motivos se arman solo si se envía un correo
+        is_anomalous_now = mask != 0
 
         st = alert_state.get(key)
         if st is None:
@@ -126,13 +167,15 @@ def main():
 
         # normal -> anómalo
         if (not st["is_anomalous"]) and is_anomalous_now:
+            reasons = profile.reasons(telemetry, mask)
             st["is_anomalous"] = True
             st["last_email_at"] = ts  
             st["last_reasons"] = reasons
             logger.warning("[ALERT NEW] sensor=%s ts=%s reasons=%s telemetry=%s", key, ts, reasons, telemetry)
+            WORKER_ALERTS.labels("new").inc()
             
-            # Enviar correo al usuario correspondiente
-            send_alert_email(
+            # Encolar correo al usuario correspondiente (no bloquea el loop)
+            outbox.enqueue(
                 to_email=user_email,
                 subject="Alerta de condición anómala en sensor",
                 reasons=reasons,
@@ -146,12 +189,14 @@ def main():
         if st["is_anomalous"] and is_anomalous_now:
             last = st["last_email_at"]
             if last is None or (ts - last) >= cooldown:
+                reasons = profile.reasons(telemetry, mask)
                 st["last_email_at"] = ts  # hora de envio del recordatorio
                 st["last_reasons"] = reasons
                 logger.warning("[ALERT REMINDER] sensor=%s ts=%s reasons=%s telemetry=%s", key, ts, reasons, telemetry)
+                WORKER_ALERTS.labels("reminder").inc()
                 
-                # Enviar correo al usuario correspondiente
-                send_alert_email(
+                # Encolar correo al usuario correspondiente (no bloquea el loop)
+                outbox.enqueue(
                     to_email=user_email,
                     subject="Recordatorio de condición anómala en sensor",
                     reasons=reasons,
@@ -160,8 +205,11 @@ def main():
                     telemetry=telemetry,
                 )
             else:
-                st["last_reasons"] = reasons
-                logger.info("[ALERT STILL] sensor=%s ts=%s reasons=%s (cooldown activo)", key, ts, reasons)
+                # last_reasons queda con los del último correo
+                logger.info(
+                    "[ALERT STILL] sensor=%s ts=%s reglas=%s perfil=%s (cooldown activo)",
+                    key, ts, profile.rule_names(mask), profile.nombre,
+                )
             return
 
         # anómalo -> recuperado
@@ -171,109 +219,187 @@ def main():
             prev_reasons = st["last_reasons"]
             st["last_reasons"] = []
             logger.info("[ALERT RECOVERED] sensor=%s ts=%s prev_reasons=%s", key, ts, prev_reasons)
+            WORKER_ALERTS.labels("recovered").inc()
             return
 
         # normal -> normal (no hacer nada)
 
+    def evaluate_alerts(batch: list[tuple]):
+        """
+        Evalúa las reglas de un micro-lote de lecturas de una vez y aplica
+        las transiciones de alerta en el orden en que llegaron.
+        """
+        profiles = [thresholds.get(registro.id_perfil) for _, _, _, registro, _, _ in batch]
+        masks = thresholds.evaluate_batch(profiles, [telemetry for _, _, telemetry, _, _, _ in batch])
+        for (key, ts, telemetry, registro, mac_gw, mac_esp), profile, mask in zip(batch, profiles, masks):
+            apply_alert_logic(key, ts, telemetry, registro.correo, mac_gw, mac_esp, profile, mask)
+            if checkpoint is not None:
+                checkpoint.mark(key)
+
+    def device_offline(dev, silent_seconds: float):
+        kind = "gateway" if dev.gateway else "sensor"
+        logger.warning("[ALERT OFFLINE] %s=%s id=%s sin datos hace %.0fs", kind, dev.mac, dev.id, silent_seconds)
+        WORKER_ALERTS.labels("offline").inc()
+        outbox.enqueue(
+            to_email=dev.correo,
+            subject=f"Alerta de {kind} sin reportar",
+            reasons=[
+                f"Sin datos hace {silent_seconds / 60:.0f} min "
+                f"({settings.DEVICE_OFFLINE_MISSED_INTERVALS} intervalos de {settings.DEVICE_HEARTBEAT_INTERVAL_SECONDS:.0f} s)"
+            ],
+            sensor_mac=dev.mac,
+            gateway_mac=dev.mac_gw,
+        )
+
+    def device_online(dev):
+        kind = "gateway" if dev.gateway else "sensor"
+        logger.info("[ALERT ONLINE] %s=%s id=%s volvió a reportar", kind, dev.mac, dev.id)
+        WORKER_ALERTS.labels("online").inc()
+
     # -----------------------------
     # Consumer async (Paso 1)
     # -----------------------------
-    async def consumer():
-        logger.info("[CONSUMER] Iniciado")
+    async def consumer(shard: int):
+        queue = queues[shard]
+        stats = shard_stats[shard]
+        # lecturas ya procesadas que esperan la evaluación de alertas: se
+        # evalúan juntas cuando la cola se vacía o se junta ALERT_RULES_BATCH_SIZE
+        pending_alerts = []
+        logger.info("[CONSUMER %d] Iniciado", shard)
         while True:
-            item = await queue.get()  # queue ya existe dentro del loop
+            if pending_alerts and (queue.qsize() == 0 or len(pending_alerts) >= settings.ALERT_RULES_BATCH_SIZE):
+                try:
+                    evaluate_alerts(pending_alerts)
+                except Exception as e:
+                    logger.exception("[CONSUMER %d] Error evaluando alertas lecturas=%d err=%s", shard, len(pending_alerts), e)
+                pending_alerts = []
+            item = await queue.get()
             try:
-                ts = datetime.now()
-                key = sensor_key(item["mac_gw"], item["mac_esp"])
+                lag = time.monotonic() - item["enqueued_at"]
+                WORKER_QUEUE_WAIT.observe(lag)
+                lag_ms = lag * 1000
+                stats["processed"] += 1
+                stats["lag_ms_last"] = lag_ms
+                if lag_ms > stats["lag_ms_max"]:
+                    stats["lag_ms_max"] = lag_ms
+
+                ts = item["ts"]
+                key = item["key"]
+                summary = item["summary"]
+                seq = item["seq"]
+                if seq is not None:
+                    # reentrega QoS 1 (o del bridge): misma secuencia que la anterior
+                    if last_sequence.get(key) == seq:
+                        WORKER_DUPLICATES.inc()
+                        continue
+                    last_sequence[key] = seq
                 telemetry = item["telemetry"]
                 mac_gw = item["mac_gw"]
                 mac_esp = item["mac_esp"]
-                gw = None
-                esp = None
-                user_id = None
-                user = None
-
                 # ------------------------------------------
-                # 1) Dentro del async with: solo gateway y sensor
+                # 1) Resolver gateway -> sensor -> usuario (cache con TTL;
+                #    solo va a la base en un miss)
                 # ------------------------------------------
-                async with AsyncSessionLocal() as session:
-                    stmt_gw = select(dispositivos).where(dispositivos.mac == mac_gw)
-                    stmt_esp = select(dispositivos).where(dispositivos.mac == mac_esp)
-
-                    gw = (await session.execute(stmt_gw)).scalar_one_or_none()
-                    esp = (await session.execute(stmt_esp)).scalar_one_or_none()
-
-                # ------------------------------------------
-                # 2) Validación de dispositivos
-                # ------------------------------------------
-
-                if gw is None:
-                    logger.warning("[DEVICE INVALID] gateway no registrado mac_gw=%s", mac_gw)
+                registro = await registry.resolve(mac_gw, mac_esp)
+                if registro is None:
+                    WORKER_UNKNOWN_DEVICE.inc()
                     continue
-
-                if esp is None:
-                    logger.warning("[DEVICE INVALID] sensor no registrado mac_esp=%s", mac_esp)
-                    continue
-
-                if gw.rol_dispositivo != DeviceRole.gateway:
-                    logger.warning("[DEVICE INVALID] mac_gw=%s no es gateway (rol=%s)", mac_gw, gw.rol_dispositivo)
-                    continue
-
-                if esp.rol_dispositivo != DeviceRole.sensor:
-                    logger.warning("[DEVICE INVALID] mac_esp=%s no es sensor (rol=%s)", mac_esp, esp.rol_dispositivo)
-                    continue
-
-                if esp.id_padre != gw.id_dispositivo:
-                    logger.warning(
-                        "[DEVICE INVALID] relación inválida: sensor.id_padre=%s gateway.id=%s mac_esp=%s mac_gw=%s",
-                        esp.id_padre,
-                        gw.id_dispositivo,
-                        mac_esp,
-                        mac_gw,
+                if heartbeat is not None:
+                    # un resumen también prueba que el sensor siguió midiendo
+                    heartbeat.mark(registro.id_gateway, True, mac_gw, None, registro.correo)
+                    heartbeat.mark(registro.id_sensor, False, mac_esp, mac_gw, registro.correo)
+
+                if summary is not None:
+                    # lecturas que el bridge no reenvió: solo cuentan para lectura_hora
+                    rollup.add_summary(
+                        key, registro.id_sensor, ts, summary["cantidad"],
+                        summary["min"], summary["max"], summary["promedio"],
                     )
+                    if checkpoint is not None:
+                        checkpoint.mark(key)
                     continue
 
                 # ------------------------------------------
-                # 3) Consultar usuario SOLO si el dispositivo es válido
+                # 2) Si todo es válido, procesar los datos
                 # ------------------------------------------
-
-                if esp is not None:
-                    user_id = esp.id_usuario  # Obtener el id_usuario del sensor
-
-                    # Consulta para obtener el usuario por id_usuario
-                    async with AsyncSessionLocal() as session:
-                        stmt_user = select(usuarios).where(usuarios.id_usuario == user_id)
-                        user = (await session.execute(stmt_user)).scalar_one_or_none()
-
-                    if user is None:
-                        logger.warning("[USER INVALID] no existe usuario id_usuario=%s (mac_esp=%s)", user_id, mac_esp)
-                        continue
-
-                    # Loggear datos del usuario
-                    logger.info("[USER VALID] id_usuario=%s nombre=%s correo=%s", user.id_usuario, user.nombre, user.correo)
-
-                # ------------------------------------------
-                # 4) Si todo es válido, procesar los datos
-                # ------------------------------------------
-                logger.info("[DEVICE OK] mac_gw=%s mac_esp=%s", mac_gw, mac_esp)
+                logger.debug("[DEVICE OK] mac_gw=%s mac_esp=%s", mac_gw, mac_esp)
+                writer.add(registro.id_sensor, ts, telemetry)
                 update_realtime_buffer(key, ts, telemetry)
-                update_hourly_acc(key, ts, telemetry)
-                apply_alert_logic(key, ts, telemetry, user.correo, mac_gw, mac_esp)  # Pasa el correo a apply_alert_logic
+                publish_live(mac_gw, mac_esp, ts, telemetry)
+                rollup.add(key, registro.id_sensor, ts, telemetry)
+                # alertas: evaluate_alerts (también marca el checkpoint del sensor)
+                pending_alerts.append((key, ts, telemetry, registro, mac_gw, mac_esp))
+                WORKER_PROCESSED.inc()
 
             except Exception as e:
-                logger.exception("[CONSUMER] Error procesando item=%s err=%s", item, e)
-            finally:
-                queue.task_done()
+                logger.exception("[CONSUMER %d] Error procesando item=%s err=%s", shard, item, e)
+
+    # -----------------------------
+    # Métricas por shard
+    # -----------------------------
+    async def report_stats():
+        while True:
+            await asyncio.sleep(settings.WORKER_STATS_INTERVAL_SECONDS)
+            for shard, (q, stats) in enumerate(zip(queues, shard_stats)):
+                q_stats = q.stats()
+                logger.info(
+                    "[STATS] shard=%d depth=%d/%d procesados=%d lag_ms_last=%.1f lag_ms_max=%.1f descartadas=%d coalescidas=%d",
+                    shard, q_stats["depth"], q_stats["maxsize"], stats["processed"],
+                    stats["lag_ms_last"], stats["lag_ms_max"], q_stats["dropped"], q_stats["coalesced"],
+                )
+                stats["lag_ms_max"] = 0.0
+            logger.info(
+                "[STATS] registry=%s writer=%s rollup=%s outbox=%s",
+                registry.stats(), writer.stats(), rollup.stats(), outbox.stats(),
+            )
+            logger.info("[STATS] thresholds=%s", thresholds.stats())
+            if heartbeat is not None:
+                logger.info("[STATS] heartbeat=%s", heartbeat.stats())
+            if checkpoint is not None:
+                logger.info("[STATS] checkpoint=%s", checkpoint.stats())
+
     # -----------------------------
     # Loop thread
     # -----------------------------
     def start_loop():
-        nonlocal queue
+        nonlocal queues, writer, outbox, heartbeat, thresholds
         asyncio.set_event_loop(loop)
-        queue = asyncio.Queue()
-
-        # Paso 1: arrancar consumer dentro del loop
-        loop.create_task(consumer())
+        queues = [
+            SensorQueue(settings.INGEST_QUEUE_MAXSIZE, settings.INGEST_QUEUE_POLICY)
+            for _ in range(num_shards)
+        ]
+        writer = LecturaBatchWriter()
+        outbox = AlertOutbox()
+        thresholds = ThresholdProfiles()
+        thresholds.on_reload = publish_edge_limits
+        if settings.HEARTBEAT_ENABLED:
+            # en multi-proceso cada proceso ve solo parte de los sensores de un gateway
+            heartbeat = HeartbeatTracker(confirm_gateways=partitioned)
+            heartbeat.on_offline = device_offline
+            heartbeat.on_online = device_online
+            WORKER_DEVICES_OFFLINE.set_function(lambda: heartbeat.offline_count)
+        for shard, q in enumerate(queues):
+            WORKER_QUEUE_DEPTH.labels(shard).set_function(q.qsize)
+
+        # Paso 1: arrancar un consumer por shard dentro del loop
+        for shard in range(num_shards):
+            loop.create_task(consumer(shard))
+        logger.info("[CONSUMER] Pool de %d consumers", num_shards)
+        loop.create_task(report_stats())
+        # Persistencia por lotes de las lecturas validadas
+        loop.create_task(writer.run())
+        # Correos de alerta fuera del camino de ingesta
+        loop.create_task(outbox.run())
+        # Perfiles de umbrales: carga inicial y recarga en caliente
+        loop.create_task(thresholds.run())
+        # Cierre y guardado de los resúmenes horarios (incluye sensores inactivos)
+        loop.create_task(rollup.run())
+        # ultimo_heartbeat en lote y detección de dispositivos sin reportar
+        if heartbeat is not None:
+            loop.create_task(heartbeat.run())
+        # Checkpoint periódico del estado en memoria
+        if checkpoint is not None:
+            loop.create_task(checkpoint.run(alert_state, rollup.acc, realtime_buffer))
 
         loop.run_forever()
 
@@ -287,62 +413,277 @@ def main():
             logger.info("[MQTT] Conectado a %s:%s", settings.MQTT_BROKER, settings.MQTT_PORT)
             logger.info("[MQTT] Suscrito a %s", settings.MQTT_TOPIC)
             client.subscribe(settings.MQTT_TOPIC, qos=1)
+            if settings.MQTT_BINARY_TOPIC_ENABLED:
+                # misma telemetría en formato binario: <MQTT_TOPIC>/bin
+                client.subscribe(settings.MQTT_TOPIC + BINARY_TOPIC_SUFFIX, qos=1)
+            if settings.MQTT_SUMMARY_TOPIC:
+                # lecturas que el bridge resumió por ventana (procesamiento en el borde)
+                client.subscribe(settings.MQTT_SUMMARY_TOPIC, qos=1)
+            if settings.MQTT_BATCH_TOPIC:
+                # lotes de varios mensajes armados por el bridge de la Raspberry
+                client.subscribe(settings.MQTT_BATCH_TOPIC, qos=1)
+            client.subscribe(settings.MQTT_CONTROL_TOPIC, qos=1)
+            if settings.MQTT_LIVE_SNAPSHOT_TOPIC:
+                # la API pide la ventana de tiempo real al abrir la primera conexión en vivo
+                client.subscribe(settings.MQTT_LIVE_SNAPSHOT_TOPIC, qos=0)
+            if edge_limits_sent is not None:
+                # por si la carga de perfiles terminó antes de conectar
+                client.publish(settings.MQTT_EDGE_LIMITS_TOPIC, edge_limits_sent, qos=1, retain=True)
         else:
             logger.error("[MQTT] Error de conexión rc=%s", rc)
 
-    def on_message(client, userdata, msg):
+    def on_control(msg):
+        try:
+            event = json.loads(msg.payload)
+        except ValueError as e:
+            logger.warning("[REGISTRY] Evento de control inválido payload=%r err=%s", msg.payload, e)
+            return
+        if "perfiles" in event:
+            # cambio de perfil_umbral (app.service.registry_events.notify_threshold_change)
+            logger.info("[THRESHOLDS] Recarga pedida evento=%s", event)
+            if thresholds is not None:
+                loop.call_soon_threadsafe(thresholds.request_reload)
+            return
+        # el cache vive en el loop: aplicar la invalidación desde ese hilo
+        loop.call_soon_threadsafe(registry.handle_event, event)
+
+    def reply_snapshot(req_id: str, mac_gw: str | None, mac_esp: str, with_stats: bool):
+        # corre en el loop: los ring buffers solo se tocan desde ese hilo
+        if mac_gw:
+            buf = realtime_buffer.get(sensor_key(mac_gw, mac_esp))
+        else:
+            buf = next((b for k, b in realtime_buffer.items() if k.split("/", 1)[1] == mac_esp), None)
+        rows, stats = [], None
+        if buf is not None:
+            # un sensor que dejó de reportar conserva lecturas fuera de la ventana
+            buf.evict(time.time() - buf.window_seconds)
+            # float32 -> 7 cifras significativas, para no mandar 7.199999809265137
+            rows = [[ts] + [float(f"{v:.7g}") for v in values] for ts, *values in buf.rows()]
+            if with_stats:
+                stats = {
+                    metric: {k: float(f"{v:.7g}") for k, v in values.items()}
+                    for metric, values in buf.window_stats().items()
+                }
+        client.publish(
+            f"{settings.MQTT_LIVE_SNAPSHOT_TOPIC}/reply/{req_id}",
+            json.dumps({"mac_gw": mac_gw, "mac_esp": mac_esp, "rows": rows, "stats": stats}, separators=(",", ":")),
+            qos=0,
+        )
+
+    def on_snapshot_request(msg):
         try:
-            payload = msg.payload.decode("utf-8", errors="strict")
-            data = json.loads(payload)
+            req = json.loads(msg.payload)
+            req_id, mac_gw, mac_esp = str(req["id"]), req.get("mac_gw"), req["mac_esp"]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning("[LIVE] Pedido de ventana inválido payload=%r err=%s", msg.payload, e)
+            return
+        # en modo multi-proceso responde solo el dueño del sensor
+        if not owns(mac_esp):
+            return
+        loop.call_soon_threadsafe(reply_snapshot, req_id, mac_gw, mac_esp, bool(req.get("stats")))
+
+    def on_telemetry(topic: str, macs: tuple[str, str, bool], payload: bytes, batched: bool = False):
+        MQTT_RECEIVED.inc()
+        mac_gw, mac_esp, binary_topic = macs
+        # en modo multi-proceso cada sensor tiene un único dueño; los demás
+        # procesos lo descartan antes de parsear el JSON
+        if not owns(mac_esp):
+            MQTT_OTHER_PARTITION.inc()
+            return
+        logger.debug("[MQTT] Extraído mac_gw=%s mac_esp=%s", mac_gw, mac_esp)
 
-            # Validación Pydantic v2
-            tele = LecturaBaseMQTT.model_validate(data)
+        binary = binary_topic or is_binary(payload)
+        if binary:
+            MQTT_BINARY.inc()
+        try:
+            # JSON: validación Pydantic v2 directo sobre los bytes -> dict
+            # binario: struct sobre el buffer del mensaje (app.mqtt.codec)
+            telemetry, device_ts, seq = parse_payload(payload, binary)
+        except (ValidationError, CodecError) as e:
+            reason = invalid_reason(e)
+            MQTT_INVALID_PAYLOAD.labels(reason).inc()
+            if reason == "json":
+                logger.warning("[MQTT] JSON inválido. topic=%s payload=%r err=%s", topic, payload, e)
+            elif reason == "binary":
+                logger.warning("[MQTT] Payload binario inválido. topic=%s payload=%r err=%s", topic, payload, e)
+            else:
+                logger.warning("[MQTT] Payload no cumple schema. topic=%s payload=%r err=%s", topic, payload, e)
+            return
 
-            parts = msg.topic.split("/")
-            # esperado: ["gateways", "<mac_gw>", "sensors", "<mac_esp>", "telemetry"]
-            if len(parts) != 5 or parts[0] != "gateways" or parts[2] != "sensors" or parts[4] != "telemetry":
-                logger.warning("[MQTT] Topic inválido: %s", msg.topic)
+        if queues is None:
+            logger.warning("[MQTT] cola no lista aún, descartando mensaje topic=%s", topic)
+            return
+
+        received_at = datetime.now()
+        ts = received_at
+        if device_ts is not None:
+            # se usa la hora de medición del dispositivo si su reloj es razonable:
+            # no adelantada más que el skew ni más vieja que DEVICE_TS_MAX_AGE_SECONDS
+            # (DEVICE_TS_BATCH_MAX_AGE_SECONDS en lotes, que traen lecturas atrasadas)
+            max_age = settings.DEVICE_TS_BATCH_MAX_AGE_SECONDS if batched else settings.DEVICE_TS_MAX_AGE_SECONDS
+            if device_ts_valid(device_ts, received_at.timestamp(), max_age):
+                ts = datetime.fromtimestamp(device_ts)
+            elif batched:
+                # una lectura atrasada con la hora de recepción quedaría en otra
+                # hora del resumen: se descarta en vez de reescribirla
+                MQTT_DEVICE_TS_REJECTED.inc()
+                logger.info("[MQTT] Lectura de lote con timestamp fuera de rango, descartada topic=%s ts=%s", topic, device_ts)
                 return
+            else:
+                MQTT_DEVICE_TS_REJECTED.inc()
+
+        key = sensor_key(mac_gw, mac_esp)
+        enqueue(key, {
+            "key": key,
+            "mac_gw": mac_gw,
+            "mac_esp": mac_esp,
+            "topic": topic,
+            "telemetry": telemetry,
+            "summary": None,
+            "ts": ts,
+            "seq": seq,
+        })
+        logger.debug("[MQTT] OK topic=%s data=%s", topic, telemetry)
+
+    def on_summary(topic: str, macs: tuple[str, str], payload: bytes):
+        MQTT_SUMMARIES.inc()
+        mac_gw, mac_esp = macs
+        if not owns(mac_esp):
+            MQTT_OTHER_PARTITION.inc()
+            return
+        try:
+            summary = parse_summary(payload)
+        except ValidationError as e:
+            MQTT_INVALID_PAYLOAD.labels("summary").inc()
+            logger.warning("[MQTT] Resumen inválido. topic=%s payload=%r err=%s", topic, payload, e)
+            return
+        if queues is None:
+            logger.warning("[MQTT] cola no lista aún, descartando mensaje topic=%s", topic)
+            return
 
-            mac_gw = parts[1]
-            mac_esp = parts[3]
-            logger.info("[MQTT] Extraído mac_gw=%s mac_esp=%s", mac_gw, mac_esp)
+        # la ventana puede llegar tarde (spool del bridge): se usa su inicio,
+        # salvo que el reloj del bridge esté adelantado
+        ts = datetime.fromtimestamp(summary["desde"])
+        if summary["desde"] - time.time() > settings.DEVICE_TS_MAX_SKEW_SECONDS:
+            MQTT_DEVICE_TS_REJECTED.inc()
+            ts = datetime.now()
+        key = sensor_key(mac_gw, mac_esp)
+        enqueue(key, {
+            "key": key,
+            "mac_gw": mac_gw,
+            "mac_esp": mac_esp,
+            "topic": topic,
+            "telemetry": None,
+            "summary": summary,
+            "ts": ts,
+            "seq": None,
+        })
+
+    def enqueue(key: str, item: dict):
+        """Encola en el shard del sensor (mismo orden que llegaron sus mensajes)."""
+        shard = shard_for(key)
+        topic = item["topic"]
+
+        if settings.INGEST_QUEUE_POLICY == POLICY_BLOCK:
+            q = queues[shard]
+            if q.qsize() + put_scheduled[shard] - put_applied[shard] < q.maxsize:
+                # hay lugar (contando lo ya programado y aún no encolado): no
+                # hace falta esperar la vuelta del loop
+                put_scheduled[shard] += 1
+
+                def _put_fast():
+                    put_applied[shard] += 1
+                    item["enqueued_at"] = time.monotonic()
+                    q.put_nowait(key, item)
+
+                loop.call_soon_threadsafe(_put_fast)
+                logger.debug("[MQTT] Encolado topic=%s", topic)
+                return
 
-            item = {
-                "mac_gw": mac_gw,
-                "mac_esp": mac_esp,
-                "topic": msg.topic,
-                "telemetry": tele.model_dump(),
-            }
+            # backpressure: el hilo de paho espera hasta que haya lugar en la
+            # cola, deja de leer del socket y el broker retiene los mensajes
+            async def _put_wait():
+                await q.put(key, item)
+                item["enqueued_at"] = time.monotonic()
 
-            def _put():
-                if queue is None:
-                    logger.warning("[MQTT] cola no lista aún, descartando mensaje topic=%s", msg.topic)
+            future = asyncio.run_coroutine_threadsafe(_put_wait(), loop)
+            try:
+                future.result(timeout=settings.INGEST_QUEUE_BLOCK_TIMEOUT_SECONDS)
+            except concurrent.futures.TimeoutError:
+                if future.cancel():
+                    # el consumer no libera lugar: se descarta esta lectura
+                    # en vez de frenar al broker indefinidamente
+                    WORKER_QUEUE_BLOCK_TIMEOUTS.inc()
+                    logger.warning(
+                        "[QUEUE] Cola llena por más de %.0fs, lectura descartada topic=%s",
+                        settings.INGEST_QUEUE_BLOCK_TIMEOUT_SECONDS, topic,
+                    )
                     return
-                queue.put_nowait(item)
-                logger.info("[MQTT] Encolado topic=%s", item["topic"])
+            logger.debug("[MQTT] Encolado topic=%s", topic)
+        else:
+            def _put():
+                item["enqueued_at"] = time.monotonic()
+                queues[shard].put_nowait(key, item)
+                logger.debug("[MQTT] Encolado topic=%s", topic)
 
             loop.call_soon_threadsafe(_put)
 
-        except UnicodeDecodeError as e:
-            logger.warning("[MQTT] Payload no es UTF-8 válido. topic=%s err=%s", msg.topic, e)
-            return
-        except json.JSONDecodeError as e:
-            logger.warning("[MQTT] JSON inválido. topic=%s payload=%r err=%s", msg.topic, payload, e)
-            return
-        except ValidationError as e:
-            logger.warning("[MQTT] Payload no cumple schema. topic=%s payload=%r err=%s", msg.topic, payload, e)
+    def on_batch(topic: str, payload: bytes):
+        try:
+            entries = decode_batch(payload)
+        except CodecError as e:
+            MQTT_INVALID_PAYLOAD.labels("batch").inc()
+            logger.warning("[MQTT] Lote inválido. topic=%s bytes=%d err=%s", topic, len(payload), e)
             return
+        MQTT_BATCHES.inc()
+        logger.debug("[MQTT] Lote topic=%s mensajes=%d", topic, len(entries))
+        for entry_topic, entry_payload in entries:
+            macs = parse_topic(entry_topic)
+            if macs is not None:
+                on_telemetry(entry_topic, macs, entry_payload, batched=True)
+                continue
+            summary_macs = parse_summary_topic(entry_topic)
+            if summary_macs is not None:
+                on_summary(entry_topic, summary_macs, entry_payload)
+                continue
+            MQTT_RECEIVED.inc()
+            MQTT_INVALID_TOPIC.inc()
+            logger.warning("[MQTT] Topic inválido en lote: %s", entry_topic)
 
-        logger.info("[MQTT] OK topic=%s data=%s", msg.topic, tele.model_dump())
+    def on_message(client, userdata, msg):
+        topic = msg.topic  # en paho es una property que decodifica en cada acceso
+        macs = parse_topic(topic)
+        if macs is not None:
+            on_telemetry(topic, macs, msg.payload)
+        elif (summary_macs := parse_summary_topic(topic)) is not None:
+            on_summary(topic, summary_macs, msg.payload)
+        elif topic == settings.MQTT_CONTROL_TOPIC:
+            on_control(msg)
+        elif settings.MQTT_LIVE_SNAPSHOT_TOPIC and topic == settings.MQTT_LIVE_SNAPSHOT_TOPIC:
+            on_snapshot_request(msg)
+        elif settings.MQTT_BATCH_TOPIC and mqtt.topic_matches_sub(settings.MQTT_BATCH_TOPIC, topic):
+            on_batch(topic, msg.payload)
+        else:
+            MQTT_RECEIVED.inc()
+            MQTT_INVALID_TOPIC.inc()
+            logger.warning("[MQTT] Topic inválido: %s", topic)
 
     client.on_connect = on_connect
     client.on_message = on_message
 
+    if settings.WORKER_METRICS_PORT:
+        # en modo multi-proceso cada partición usa el puerto siguiente
+        port = settings.WORKER_METRICS_PORT + partition_index
+        start_http_server(port, settings.WORKER_METRICS_HOST)
+        logger.info("[METRICS] GET http://%s:%d/metrics", settings.WORKER_METRICS_HOST, port)
+
     client.connect(settings.MQTT_BROKER, settings.MQTT_PORT, keepalive=60)
     client.loop_start()
 
-    logger.info("[INFO] Worker MQTT corriendo. Ctrl+C para salir.")
+    if partitioned:
+        logger.info("[INFO] Worker MQTT partición %d/%d corriendo. Ctrl+C para salir.", partition_index, partition_count)
+    else:
+        logger.info("[INFO] Worker MQTT corriendo. Ctrl+C para salir.")
     try:
         while True:
             time.sleep(1)
@@ -351,6 +692,39 @@ def main():
     finally:
         client.loop_stop()
         client.disconnect()
+        # escribir las lecturas que quedaron en memoria
+        if writer is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(writer.close(), loop).result(timeout=10)
+            except Exception:
+                logger.exception("[INFO] No se pudo vaciar el writer de lecturas")
+            try:
+                # con checkpoint las horas en curso siguen en memoria y se retoman al
+                # volver; sin checkpoint se guardan parciales y el upsert las combina
+                asyncio.run_coroutine_threadsafe(
+                    rollup.close(partial=checkpoint is None), loop
+                ).result(timeout=10)
+            except Exception:
+                logger.exception("[INFO] No se pudo guardar el resumen horario")
+        if heartbeat is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(heartbeat.close(), loop).result(timeout=10)
+            except Exception:
+                logger.exception("[INFO] No se pudo guardar ultimo_heartbeat")
+        if outbox is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(outbox.close(), loop).result(timeout=30)
+            except Exception:
+                logger.exception("[INFO] No se pudieron enviar las alertas pendientes")
+        if checkpoint is not None:
+            try:
+                # foto final; incluye las filas horarias que no se pudieron escribir
+                asyncio.run_coroutine_threadsafe(
+                    checkpoint.save_full(alert_state, rollup.acc, realtime_buffer, rollup.pending_rows()),
+                    loop,
+                ).result(timeout=30)
+            except Exception:
+                logger.exception("[INFO] No se pudo guardar el checkpoint final")
 
 
 if __name__ == "__main__":
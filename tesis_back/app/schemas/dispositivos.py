@@ -16,6 +16,7 @@ class DispositivoBase(BaseModel):
     longitud: float | None = None
     ultimo_heartbeat: datetime | None = None
     id_padre: int | None = None
+    id_perfil_umbral: int | None = None
 
 
 # -------------------------------------------------------------------
@@ -31,6 +32,7 @@ class DispositivoCreate(BaseModel):
     latitud: float | None = None
     longitud: float | None = None
     id_padre: int | None = None
+    id_perfil_umbral: int | None = None
 
 
 # -------------------------------------------------------------------
@@ -46,6 +48,7 @@ class DispositivoUpdate(BaseModel):
     latitud: float | None = None
     longitud: float | None = None
     id_padre: int | None = None
+    id_perfil_umbral: int | None = None
 
     class Config:
         extra = "forbid"
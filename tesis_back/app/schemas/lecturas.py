@@ -1,5 +1,7 @@
 from datetime import datetime
-from pydantic import BaseModel
+from typing import Annotated
+from pydantic import BaseModel, ConfigDict, Field
+from typing_extensions import TypedDict
 
 # -------------------------------------------------------------------
 # Esquema base: campos comunes de la lectura
@@ -14,6 +16,48 @@ class LecturaBaseMQTT(BaseModel):
         # Para evitar que te manden campos raros que no existen
         extra = "forbid"
     
+
+# Misma validación que LecturaBaseMQTT pero el resultado es un dict plano:
+# el worker valida los bytes del payload directo (TypeAdapter.validate_json)
+# sin pasar por un modelo ni model_dump()
+class TelemetriaMQTT(TypedDict):
+    __pydantic_config__ = ConfigDict(extra="forbid")
+
+    ph: float
+    temperatura: float
+    turbidez: float
+    tds: float
+
+
+# Resumen de una ventana de lecturas que el bridge no reenvió de a una
+# (procesamiento en el borde); desde/hasta en epoch (segundos)
+class ResumenMQTT(TypedDict):
+    __pydantic_config__ = ConfigDict(extra="forbid")
+
+    desde: float
+    hasta: float
+    cantidad: Annotated[int, Field(gt=0)]
+    min: TelemetriaMQTT
+    max: TelemetriaMQTT
+    promedio: TelemetriaMQTT
+
+# -------------------------------------------------------------------
+# Ingesta HTTP por lotes (POST /ingest/batch)
+# -------------------------------------------------------------------
+# Cada lectura es una fila compacta [mac_esp, ts, ph, temperatura, turbidez, tds];
+# ts en epoch (segundos) o null para usar la hora de recepción
+class LoteIngesta(TypedDict):
+    __pydantic_config__ = ConfigDict(extra="forbid", allow_inf_nan=False)
+
+    lecturas: list[tuple[str, float | None, float, float, float, float]]
+
+
+class IngestaResultado(BaseModel):
+    aceptadas: int
+    rechazadas: int
+    sensores_invalidos: list[str]  # MACs que no son sensores hijos del gateway
+    mensajes: int  # lotes MQTT publicados hacia el worker
+
 # -------------------------------------------------------------------
 # Valores a ingresar a la base de datos
 class LecturaBaseMSQL(BaseModel):
@@ -24,4 +68,49 @@ class LecturaBaseMSQL(BaseModel):
     valor_conductividad: float
     class Config:
         # Para evitar que te manden campos raros que no existen
-        extra = "forbid"
\ No newline at end of file
+        extra = "forbid"
+
+# -------------------------------------------------------------------
+# Resumen horario por sensor (tabla lectura_hora)
+# -------------------------------------------------------------------
+class LecturaHoraRead(BaseModel):
+    id_dispositivo: int
+    hora_inicio: datetime
+    cantidad: int
+    ph_min: float
+    ph_max: float
+    ph_promedio: float
+    temperatura_min: float
+    temperatura_max: float
+    temperatura_promedio: float
+    turbidez_min: float
+    turbidez_max: float
+    turbidez_promedio: float
+    conductividad_min: float
+    conductividad_max: float
+    conductividad_promedio: float
+
+    class Config:
+        from_attributes = True
+
+
+# -------------------------------------------------------------------
+# Lecturas devueltas por la API (crudas o promediadas por intervalo)
+# -------------------------------------------------------------------
+class LecturaRead(BaseModel):
+    id_lectura: int | None = None  # None cuando el punto es un promedio
+    fecha_de_medicion: datetime
+    valor_ph: float
+    valor_temperatura: float
+    valor_turbidez: float
+    valor_conductividad: float
+    cantidad: int | None = None  # lecturas promediadas en el punto
+
+    class Config:
+        from_attributes = True
+
+
+class LecturaPage(BaseModel):
+    lecturas: list[LecturaRead]
+    siguiente: str | None = None  # cursor para la siguiente página (None = no hay más)
+    muestreo: str
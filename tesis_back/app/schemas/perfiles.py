@@ -0,0 +1,51 @@
+from datetime import datetime
+from pydantic import BaseModel
+
+
+# -------------------------------------------------------------------
+# Límites de un perfil de umbrales (None = sin alerta para ese límite)
+# -------------------------------------------------------------------
+class PerfilUmbralBase(BaseModel):
+    nombre: str
+    ph_min: float | None = None
+    ph_max: float | None = None
+    temperatura_min: float | None = None
+    temperatura_max: float | None = None
+    turbidez_max: float | None = None
+    tds_max: float | None = None
+
+
+# -------------------------------------------------------------------
+# Lo que RECIBE la API cuando se crea un perfil
+# -------------------------------------------------------------------
+class PerfilUmbralCreate(PerfilUmbralBase):
+
+    class Config:
+        extra = "forbid"
+
+
+# -------------------------------------------------------------------
+# Lo que RECIBE la API al actualizar un perfil (solo los campos enviados)
+# -------------------------------------------------------------------
+class PerfilUmbralUpdate(BaseModel):
+    nombre: str | None = None
+    ph_min: float | None = None
+    ph_max: float | None = None
+    temperatura_min: float | None = None
+    temperatura_max: float | None = None
+    turbidez_max: float | None = None
+    tds_max: float | None = None
+
+    class Config:
+        extra = "forbid"
+
+
+# -------------------------------------------------------------------
+# Lo que DEVUELVE la API al consultar un perfil
+# -------------------------------------------------------------------
+class PerfilUmbralRead(PerfilUmbralBase):
+    id_perfil: int
+    fecha_de_actualizacion: datetime
+
+    class Config:
+        from_attributes = True
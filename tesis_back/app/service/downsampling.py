@@ -0,0 +1,42 @@
+def lttb(xs: list[float], ys: list[float], threshold: int) -> list[int]:
+    """
+    Largest-Triangle-Three-Buckets: elige `threshold` puntos de la serie
+    (xs, ys) que preservan su forma visual. Devuelve los índices elegidos,
+    en orden; siempre incluye el primero y el último.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    selected = [0]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0  # índice del último punto elegido
+
+    for i in range(threshold - 2):
+        # rango del bucket actual
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+
+        # promedio del bucket siguiente (el último "bucket" es el punto final)
+        next_start = end
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(ys[next_start:next_end]) / count
+
+        ax, ay = xs[a], ys[a]
+        best_area = -1.0
+        best = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best_area = area
+                best = j
+
+        selected.append(best)
+        a = best
+
+    selected.append(n - 1)
+    return selected
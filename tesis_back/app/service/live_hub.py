@@ -0,0 +1,262 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+import paho.mqtt.client as mqtt
+from sqlalchemy import select
+from app.core.config import settings
+from app.database.session import AsyncSessionLocal
+from app.models.lectura import lectura
+from app.mqtt.ringbuffer import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+def encode_event(mac_gw: str | None, mac_esp: str, ts: datetime, telemetry: dict) -> str:
+    """Formato común de los eventos en vivo (worker -> MQTT -> API -> cliente)."""
+    return json.dumps({
+        "mac_gw": mac_gw,
+        "mac_esp": mac_esp,
+        "ts": ts.isoformat(),
+        "telemetry": telemetry,
+    }, separators=(",", ":"))
+
+
+class LiveSubscriber:
+    """
+    Buffer de envío de una conexión. Si el cliente es lento y el buffer se
+    llena, se descartan los eventos más viejos: nunca se frena al hub ni
+    a las demás conexiones.
+    """
+
+    def __init__(self, mac: str, maxsize: int):
+        self.mac = mac
+        self._events: deque[str] = deque(maxlen=maxsize)
+        self._ready = asyncio.Event()
+        self.dropped = 0
+
+    def push(self, event: str) -> None:
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append(event)
+        self._ready.set()
+
+    async def get(self) -> str:
+        while not self._events:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._events.popleft()
+
+
+class LiveHub:
+    """
+    Fan-out de la telemetría en vivo que publica el worker MQTT.
+
+    Guarda la ventana de los últimos LIVE_WINDOW_MINUTES solo de los sensores
+    que alguien está mirando (backfill la pide al ring buffer del worker y
+    sigue con los eventos en vivo), para que un suscriptor nuevo reciba
+    primero esa ventana y después los eventos en vivo. Los eventos de sensores sin
+    suscriptores se descartan y la ventana se libera con el último que se va.
+    Todo el estado se toca solo desde el event loop de la API.
+    """
+
+    def __init__(
+        self,
+        window: timedelta = timedelta(minutes=settings.LIVE_WINDOW_MINUTES),
+        client_buffer: int = settings.LIVE_CLIENT_BUFFER,
+    ):
+        self.window = window
+        self.client_buffer = client_buffer
+        self._buffers: dict[str, deque[tuple[datetime, str]]] = {}
+        self._subs: dict[str, set[LiveSubscriber]] = {}
+        self._backfilled: set[str] = set()
+        self._snapshots: dict[str, asyncio.Future] = {}  # id de pedido -> respuesta del worker
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._client: mqtt.Client | None = None
+
+    # -----------------------------
+    # Ciclo de vida
+    # -----------------------------
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        topic = f"{settings.MQTT_LIVE_TOPIC_PREFIX}/#"
+        reply_prefix = f"{settings.MQTT_LIVE_SNAPSHOT_TOPIC}/reply/"
+
+        def on_connect(client, userdata, flags, rc):
+            if rc == 0:
+                logger.info("[LIVE] Suscrito a %s", topic)
+                client.subscribe(topic, qos=0)
+                if settings.MQTT_LIVE_SNAPSHOT_TOPIC:
+                    client.subscribe(reply_prefix + "#", qos=0)
+            else:
+                logger.error("[LIVE] Error de conexión rc=%s", rc)
+
+        def on_message(client, userdata, msg):
+            if settings.MQTT_LIVE_SNAPSHOT_TOPIC and msg.topic.startswith(reply_prefix):
+                req_id = msg.topic[len(reply_prefix):]
+                self._loop.call_soon_threadsafe(self._resolve_snapshot, req_id, msg.payload)
+                return
+            try:
+                data = json.loads(msg.payload)
+                ts = datetime.fromisoformat(data["ts"])
+                mac = data["mac_esp"]
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning("[LIVE] Evento inválido topic=%s err=%s", msg.topic, e)
+                return
+            event = msg.payload.decode("utf-8")
+            self._loop.call_soon_threadsafe(self._dispatch, mac, ts, event)
+
+        self._client = mqtt.Client(client_id="", protocol=mqtt.MQTTv311)
+        self._client.on_connect = on_connect
+        self._client.on_message = on_message
+        self._client.connect_async(settings.MQTT_BROKER, settings.MQTT_PORT, keepalive=60)
+        self._client.loop_start()
+
+    def stop(self) -> None:
+        if self._client is not None:
+            self._client.loop_stop()
+            self._client.disconnect()
+            self._client = None
+
+    # -----------------------------
+    # Ventana por sensor
+    # -----------------------------
+    def _trim(self, buf: deque, now: datetime) -> None:
+        cutoff = now - self.window
+        while buf and buf[0][0] < cutoff:
+            buf.popleft()
+
+    def _dispatch(self, mac: str, ts: datetime, event: str) -> None:
+        buf = self._buffers.get(mac)
+        if buf is None:
+            # nadie mira este sensor
+            return
+        buf.append((ts, event))
+        self._trim(buf, ts)
+
+        for sub in self._subs.get(mac, ()):
+            sub.push(event)
+
+    def _resolve_snapshot(self, req_id: str, payload: bytes) -> None:
+        fut = self._snapshots.pop(req_id, None)
+        if fut is not None and not fut.done():
+            fut.set_result(payload)
+
+    async def snapshot(self, mac: str, mac_gw: str | None, stats: bool = False) -> dict | None:
+        """
+        Pide al worker su ventana de tiempo real del sensor (SensorRingBuffer)
+        por MQTT: {"rows": [[ts, ph, temperatura, turbidez, tds], ...],
+        "stats": window_stats() o None}. Devuelve None si el worker no
+        responde en LIVE_SNAPSHOT_TIMEOUT_SECONDS.
+        """
+        if not settings.MQTT_LIVE_SNAPSHOT_TOPIC or self._client is None:
+            return None
+        req_id = uuid.uuid4().hex
+        fut = asyncio.get_running_loop().create_future()
+        self._snapshots[req_id] = fut
+        try:
+            request = json.dumps({"id": req_id, "mac_gw": mac_gw, "mac_esp": mac, "stats": stats})
+            if self._client.publish(settings.MQTT_LIVE_SNAPSHOT_TOPIC, request, qos=0).rc != mqtt.MQTT_ERR_SUCCESS:
+                return None
+            payload = await asyncio.wait_for(fut, settings.LIVE_SNAPSHOT_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("[LIVE] El worker no respondió el pedido de ventana mac=%s", mac)
+            return None
+        finally:
+            self._snapshots.pop(req_id, None)
+        try:
+            return json.loads(payload)
+        except ValueError as e:
+            logger.warning("[LIVE] Ventana inválida del worker mac=%s err=%s", mac, e)
+            return None
+
+    async def _lecturas_base(self, id_dispositivo: int) -> list[tuple[datetime, tuple]]:
+        """Respaldo de backfill: la ventana desde las lecturas ya persistidas."""
+        desde = datetime.now() - self.window
+        stmt = (
+            select(
+                lectura.fecha_de_medicion,
+                lectura.valor_ph,
+                lectura.valor_temperatura,
+                lectura.valor_turbidez,
+                lectura.valor_conductividad,
+            )
+            .where(lectura.id_dispositivo == id_dispositivo, lectura.fecha_de_medicion >= desde)
+            .order_by(lectura.fecha_de_medicion)
+        )
+        async with AsyncSessionLocal() as session:
+            filas = (await session.execute(stmt)).all()
+        return [(f[0], tuple(float(v) for v in f[1:])) for f in filas]
+
+    async def backfill(self, mac: str, mac_gw: str | None, id_dispositivo: int) -> None:
+        """
+        Completa la ventana con la que guarda el worker en memoria, una sola
+        vez mientras el sensor tenga suscriptores. Solo si el worker no
+        responde (caído, o MQTT_LIVE_SNAPSHOT_TOPIC vacío) se consulta la base;
+        si esa consulta falla, el próximo suscriptor la reintenta.
+        """
+        if mac in self._backfilled:
+            return
+        # desde ya se guardan los eventos en vivo que lleguen durante el pedido
+        self._buffers.setdefault(mac, deque())
+
+        try:
+            snap = await self.snapshot(mac, mac_gw)
+            if snap is not None:
+                origen = "worker"
+                filas = [(datetime.fromtimestamp(row[0]), tuple(row[1:])) for row in snap["rows"]]
+            else:
+                origen = "base"
+                filas = await self._lecturas_base(id_dispositivo)
+        except Exception:
+            if mac not in self._subs:
+                self._buffers.pop(mac, None)
+            raise
+
+        self._backfilled.add(mac)
+        buf = self._buffers.setdefault(mac, deque())
+        # solo lo anterior a lo que ya llegó en vivo, para no duplicar
+        primero = buf[0][0] if buf else None
+        previos = [
+            (ts, encode_event(mac_gw, mac, ts, dict(zip(METRICS, valores))))
+            for ts, valores in filas
+            if primero is None or ts < primero
+        ]
+        buf.extendleft(reversed(previos))
+        logger.info("[LIVE] Ventana completada desde %s mac=%s lecturas=%d", origen, mac, len(previos))
+
+    # -----------------------------
+    # Suscripciones
+    # -----------------------------
+    def subscribe(self, mac: str) -> LiveSubscriber:
+        """Registra una conexión y le carga la ventana actual antes de los eventos en vivo."""
+        sub = LiveSubscriber(mac, self.client_buffer)
+        buf = self._buffers.get(mac)
+        if buf:
+            self._trim(buf, datetime.now())
+            for _, event in buf:
+                sub.push(event)
+        self._subs.setdefault(mac, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: LiveSubscriber) -> None:
+        subs = self._subs.get(sub.mac)
+        if subs is None:
+            return
+        subs.discard(sub)
+        if not subs:
+            # sin suscriptores no se mantiene la ventana: el próximo la rearma
+            del self._subs[sub.mac]
+            self._buffers.pop(sub.mac, None)
+            self._backfilled.discard(sub.mac)
+
+    def stats(self) -> dict:
+        return {
+            "sensors": len(self._buffers),
+            "subscribers": sum(len(s) for s in self._subs.values()),
+        }
+
+
+live_hub = LiveHub()
@@ -0,0 +1,103 @@
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from app.core.config import settings
+from app.utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+AUTH_CACHE = Counter("auth_cache_total", "Consultas al cache de autenticación", ["cache", "result"])
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """Usuario autenticado: lo que usan los endpoints, sin el objeto ORM."""
+    id_usuario: int
+    rol: str
+    correo: str
+    estado_cuenta: int
+
+
+class PrincipalCache:
+    """
+    Cache en proceso del camino de autenticación de la API.
+
+    - Claims: token -> (exp, sub). Un token ya verificado no se vuelve a
+      decodificar (firma incluida) hasta que vence; la clave es el token
+      completo, así uno alterado nunca coincide.
+    - Principals: id_usuario (sub) -> Principal con un TTL corto. En un hit
+      get_current_user no va a la base.
+    - update_user, delete_user y change_password invalidan por id_usuario.
+      Con varios procesos de uvicorn cada uno tiene su cache: el TTL acota
+      lo que otro proceso puede ver desactualizado.
+    """
+
+    def __init__(
+        self,
+        ttl: float = settings.AUTH_PRINCIPAL_TTL_SECONDS,
+        max_entries: int = settings.AUTH_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._claims: OrderedDict[str, tuple[float, int]] = OrderedDict()
+        self._principals: OrderedDict[int, tuple[float, Principal]] = OrderedDict()
+        self.invalidations = 0
+
+    # -----------------------------
+    # Claims del JWT
+    # -----------------------------
+    def get_claims(self, token: str) -> int | None:
+        """sub de un token ya verificado y no vencido, o None."""
+        cached = self._claims.get(token)
+        if cached is not None:
+            exp, sub = cached
+            if exp > time.time():
+                self._claims.move_to_end(token)
+                AUTH_CACHE.labels("claims", "hit").inc()
+                return sub
+            del self._claims[token]
+        AUTH_CACHE.labels("claims", "miss").inc()
+        return None
+
+    def put_claims(self, token: str, exp: float, sub: int) -> None:
+        self._claims[token] = (exp, sub)
+        self._claims.move_to_end(token)
+        while len(self._claims) > self.max_entries:
+            self._claims.popitem(last=False)
+
+    # -----------------------------
+    # Principals
+    # -----------------------------
+    def get_principal(self, id_usuario: int) -> Principal | None:
+        cached = self._principals.get(id_usuario)
+        if cached is not None:
+            expires_at, principal = cached
+            if expires_at > time.monotonic():
+                self._principals.move_to_end(id_usuario)
+                AUTH_CACHE.labels("principal", "hit").inc()
+                return principal
+            del self._principals[id_usuario]
+        AUTH_CACHE.labels("principal", "miss").inc()
+        return None
+
+    def put_principal(self, principal: Principal) -> None:
+        self._principals[principal.id_usuario] = (time.monotonic() + self.ttl, principal)
+        self._principals.move_to_end(principal.id_usuario)
+        while len(self._principals) > self.max_entries:
+            self._principals.popitem(last=False)
+
+    def invalidate_user(self, id_usuario: int) -> None:
+        if self._principals.pop(id_usuario, None) is not None:
+            self.invalidations += 1
+            logger.debug("[AUTH CACHE] invalidado id_usuario=%s", id_usuario)
+
+    def stats(self) -> dict:
+        return {
+            "claims": len(self._claims),
+            "principals": len(self._principals),
+            "invalidations": self.invalidations,
+        }
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,83 @@
+import json
+import logging
+import threading
+import paho.mqtt.client as mqtt
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# avisos sin enviar que paho guarda mientras el broker no está (luego se descartan)
+MAX_QUEUED = 1000
+
+
+class ControlPublisher:
+    """
+    Cliente MQTT persistente de la API para los avisos de control al worker.
+
+    publish() solo encola en paho (QoS 1) y vuelve: el request no espera al
+    broker. Sin conexión paho guarda hasta MAX_QUEUED avisos y los envía al
+    reconectar; los que no entran se descartan y se loguea cada tanto.
+    """
+
+    def __init__(self):
+        self._client: mqtt.Client | None = None
+        self._lock = threading.Lock()
+        self.published = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._client is not None:
+                return
+            client = mqtt.Client(client_id="", protocol=mqtt.MQTTv311)
+            client.max_queued_messages_set(MAX_QUEUED)
+            client.reconnect_delay_set(1, 30)
+            client.connect_async(settings.MQTT_BROKER, settings.MQTT_PORT, keepalive=60)
+            client.loop_start()
+            self._client = client
+
+    def stop(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.loop_stop()
+            client.disconnect()
+
+    def publish(self, payload: str) -> bool:
+        if self._client is None:
+            self.start()
+        rc = self._client.publish(settings.MQTT_CONTROL_TOPIC, payload, qos=1).rc
+        # NO_CONN: queda en la cola de paho y sale al reconectar
+        if rc in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+            self.published += 1
+            return True
+        self.failed += 1
+        if self.failed % 100 == 1:
+            logger.warning("[CONTROL] Avisos descartados=%d (broker no disponible) rc=%s", self.failed, rc)
+        return False
+
+
+control_publisher = ControlPublisher()
+
+
+async def notify_registry_change(*, macs: list[str] | None = None, id_usuario: int | None = None) -> None:
+    """
+    Avisa al worker MQTT que debe invalidar su cache de registro.
+
+    Es best-effort y no espera al broker: si el aviso se pierde, el TTL
+    del cache acota el tiempo que el worker puede ver datos viejos.
+    """
+    event = {"macs": list(macs or []), "id_usuario": id_usuario}
+    if control_publisher.publish(json.dumps(event)):
+        logger.debug("[REGISTRY] invalidación publicada %s", event)
+
+
+async def notify_threshold_change(id_perfil: int) -> None:
+    """
+    Avisa al worker MQTT que un perfil de umbrales cambió, para que recargue
+    los perfiles sin reiniciar. Best-effort como notify_registry_change: si
+    se pierde, THRESHOLD_PROFILES_REFRESH_SECONDS acota la demora.
+    """
+    event = {"perfiles": [id_perfil]}
+    if control_publisher.publish(json.dumps(event)):
+        logger.debug("[THRESHOLDS] cambio de perfil publicado %s", event)
@@ -1,48 +1,59 @@
+import asyncio
 import smtplib
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import List, Optional
 from app.core.config import settings
+from app.utils.metrics import Counter, Gauge, Histogram
 import logging
 
 logger = logging.getLogger(__name__)
 
-def send_alert_email(
-    *,
-    to_email: str,
-    subject: str,
-    reasons: List[str],
-    sensor_mac: str,
-    gateway_mac: Optional[str] = None,
-    telemetry: Optional[dict] = None,
-) -> bool:
-    """
-    Envía un correo de alerta.
-    Retorna True si se envió, False si falló (y loguea el error).
-    """
+ALERTS_ENQUEUED = Counter("alerts_enqueued_total", "Alertas encoladas para enviar por correo")
+ALERTS_DROPPED = Counter("alerts_dropped_total", "Alertas descartadas con la outbox llena")
+ALERTS_SENT = Counter("alerts_sent_total", "Alertas entregadas (un correo puede agrupar varias)")
+ALERT_EMAILS_SENT = Counter("alert_emails_sent_total", "Correos de alerta enviados")
+ALERT_EMAIL_FAILURES = Counter("alert_email_failures_total", "Correos de alerta que fallaron tras los reintentos")
+ALERT_EMAIL_SECONDS = Histogram(
+    "alert_email_send_seconds",
+    "Latencia de cada intento de envío SMTP",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+ALERT_OUTBOX_DEPTH = Gauge("alert_outbox_depth", "Alertas en la outbox esperando envío")
+
 
+def _smtp_config() -> tuple | None:
     smtp_host = getattr(settings, "SMTP_HOST", None)
     smtp_port = getattr(settings, "SMTP_PORT", None)
     smtp_user = getattr(settings, "SMTP_USER", None)
     smtp_pass = getattr(settings, "SMTP_PASSWORD", None)
-    from_name = getattr(settings, "SMTP_FROM_NAME", "Tesis Water Monitor")
 
     if not all([smtp_host, smtp_port, smtp_user, smtp_pass]):
         logger.error("[EMAIL] Faltan variables SMTP en .env (HOST/PORT/USER/PASSWORD).")
-        return False
+        return None
+    return smtp_host, int(smtp_port), smtp_user, smtp_pass
+
+
+def _is_permanent(e: Exception) -> bool:
+    """Errores SMTP que no se arreglan reintentando (respuestas 5xx)."""
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code >= 500
+    return False
 
-    # Construcción del correo
-    msg = MIMEMultipart()
-    msg["From"] = f"{from_name} <{smtp_user}>"
-    msg["To"] = to_email
-    msg["Subject"] = subject
 
+def _alert_body_lines(
+    reasons: List[str],
+    sensor_mac: str,
+    gateway_mac: Optional[str] = None,
+    telemetry: Optional[dict] = None,
+) -> list[str]:
     reasons_text = "\n".join(f"- {r}" for r in reasons) if reasons else "- (sin detalle)"
-    body_lines = [
-        "Se detectó una condición anómala en un sensor del sistema de monitoreo.",
-        "",
-        f"Sensor MAC: {sensor_mac}",
-    ]
+    body_lines = [f"Sensor MAC: {sensor_mac}"]
     if gateway_mac:
         body_lines.append(f"Gateway MAC: {gateway_mac}")
 
@@ -55,16 +66,53 @@ def send_alert_email(
         body_lines.append("Última telemetría recibida:")
         for k, v in telemetry.items():
             body_lines.append(f"- {k}: {v}")
+    return body_lines
 
-    body_lines.append("")
-    body_lines.append("Este es un mensaje automático.")
 
+def _build_message(from_addr: str, to_email: str, subject: str, body_lines: list[str]) -> MIMEMultipart:
+    from_name = getattr(settings, "SMTP_FROM_NAME", "Tesis Water Monitor")
+
+    msg = MIMEMultipart()
+    msg["From"] = f"{from_name} <{from_addr}>"
+    msg["To"] = to_email
+    msg["Subject"] = subject
     msg.attach(MIMEText("\n".join(body_lines), "plain", "utf-8"))
+    return msg
+
+
+def send_alert_email(
+    *,
+    to_email: str,
+    subject: str,
+    reasons: List[str],
+    sensor_mac: str,
+    gateway_mac: Optional[str] = None,
+    telemetry: Optional[dict] = None,
+) -> bool:
+    """
+    Envía un correo de alerta.
+    Retorna True si se envió, False si falló (y loguea el error).
+
+    Abre una conexión SMTP por llamada y bloquea; el worker MQTT usa AlertOutbox.
+    """
+
+    config = _smtp_config()
+    if config is None:
+        return False
+    smtp_host, smtp_port, smtp_user, smtp_pass = config
+
+    # Construcción del correo
+    body_lines = ["Se detectó una condición anómala en un sensor del sistema de monitoreo.", ""]
+    body_lines += _alert_body_lines(reasons, sensor_mac, gateway_mac, telemetry)
+    body_lines.append("")
+    body_lines.append("Este es un mensaje automático.")
+    msg = _build_message(smtp_user, to_email, subject, body_lines)
 
     # Envío SMTP
     try:
-        with smtplib.SMTP(smtp_host, int(smtp_port), timeout=15) as server:
-            server.starttls()
+        with smtplib.SMTP(smtp_host, smtp_port, timeout=settings.SMTP_TIMEOUT_SECONDS) as server:
+            if settings.SMTP_STARTTLS:
+                server.starttls()
             server.login(smtp_user, smtp_pass)
             server.sendmail(smtp_user, [to_email], msg.as_string())
 
@@ -74,3 +122,256 @@ def send_alert_email(
     except Exception as e:
         logger.exception("[EMAIL] Falló envío a=%s sensor=%s err=%s", to_email, sensor_mac, e)
         return False
+
+
+class _SmtpSession:
+    """
+    Conexión SMTP persistente (STARTTLS + login una sola vez).
+    Se usa siempre desde el mismo hilo (el executor de AlertOutbox).
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self._server: smtplib.SMTP | None = None
+        self._last_used = 0.0
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=settings.SMTP_TIMEOUT_SECONDS)
+        try:
+            server.ehlo()
+            if settings.SMTP_STARTTLS:
+                server.starttls()
+                server.ehlo()
+            # un servidor SMTP local de pruebas normalmente no ofrece AUTH
+            if server.has_extn("auth"):
+                server.login(self.user, self.password)
+        except Exception:
+            server.close()
+            raise
+        logger.info("[EMAIL] Sesión SMTP abierta %s:%s", self.host, self.port)
+        return server
+
+    def _alive(self) -> bool:
+        if self._server is None:
+            return False
+        # tras un rato sin uso el servidor pudo cerrar la conexión
+        if time.monotonic() - self._last_used < settings.SMTP_IDLE_CHECK_SECONDS:
+            return True
+        try:
+            return self._server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, to_email: str, msg: str) -> None:
+        if not self._alive():
+            self.close()
+            self._server = self._connect()
+        try:
+            self._server.sendmail(self.user, [to_email], msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout):
+            # la conexión murió entre el chequeo y el envío: un reintento inmediato.
+            # Las demás SMTPException (también OSError) suben a _send_with_retry
+            self.close()
+            self._server = self._connect()
+            self._server.sendmail(self.user, [to_email], msg)
+        self._last_used = time.monotonic()
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            self._server.close()
+        self._server = None
+
+
+class AlertOutbox:
+    """
+    Despacho asíncrono de correos de alerta para el worker MQTT.
+
+    - enqueue() no bloquea el event loop: solo deja la alerta en la cola.
+    - run() junta las alertas de una ventana (ALERT_BATCH_WINDOW_SECONDS)
+      y manda un solo correo por destinatario.
+    - Cada destinatario se envía en su propia tarea: el SMTP bloqueante
+      corre en un hilo dedicado con sesión persistente y los reintentos
+      (backoff exponencial) de un destinatario no demoran a los demás.
+      Los rechazos permanentes (5xx) no se reintentan.
+    """
+
+    def __init__(
+        self,
+        batch_window: float = settings.ALERT_BATCH_WINDOW_SECONDS,
+        max_retries: int = settings.ALERT_MAX_RETRIES,
+        retry_base: float = settings.ALERT_RETRY_BASE_SECONDS,
+        maxsize: int = settings.ALERT_OUTBOX_MAXSIZE,
+    ):
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smtp")
+        self._session: _SmtpSession | None = None
+        self._sending: set[asyncio.Task] = set()
+        self._closing = asyncio.Event()
+        self._batch: list[dict] = []  # lote de la ventana en curso
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.emails_sent = 0
+        self.emails_failed = 0
+        self.last_send_ms = 0.0
+        ALERT_OUTBOX_DEPTH.set_function(self._queue.qsize)
+
+    def enqueue(
+        self,
+        *,
+        to_email: str,
+        subject: str,
+        reasons: List[str],
+        sensor_mac: str,
+        gateway_mac: Optional[str] = None,
+        telemetry: Optional[dict] = None,
+    ) -> bool:
+        alert = {
+            "to_email": to_email,
+            "subject": subject,
+            "reasons": list(reasons),
+            "sensor_mac": sensor_mac,
+            "gateway_mac": gateway_mac,
+            "telemetry": dict(telemetry) if telemetry else None,
+        }
+        try:
+            self._queue.put_nowait(alert)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            ALERTS_DROPPED.inc()
+            logger.error("[EMAIL] Outbox llena, alerta descartada a=%s sensor=%s", to_email, sensor_mac)
+            return False
+        self.enqueued += 1
+        ALERTS_ENQUEUED.inc()
+        return True
+
+    async def run(self) -> None:
+        logger.info("[EMAIL] Outbox iniciada ventana=%.1fs", self.batch_window)
+        while not self._closing.is_set():
+            self._batch.append(await self._queue.get())
+            deadline = time.monotonic() + self.batch_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            # close() pudo llevarse el lote mientras se esperaba la ventana
+            batch, self._batch = self._batch, []
+            if batch:
+                await self._dispatch(batch)
+
+    async def close(self) -> None:
+        """Envía lo que quede en la cola y cierra la sesión SMTP."""
+        # los reintentos en espera hacen un último intento sin esperar el backoff
+        self._closing.set()
+        # el lote que run() está juntando vive en self._batch, no se pierde
+        batch, self._batch = self._batch, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await self._dispatch(batch)
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+        if self._session is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._session.close)
+        self._executor.shutdown(wait=False)
+
+    async def _dispatch(self, batch: list[dict]) -> None:
+        por_destinatario: dict[str, list[dict]] = {}
+        for alert in batch:
+            por_destinatario.setdefault(alert["to_email"], []).append(alert)
+
+        for to_email, alerts in por_destinatario.items():
+            task = asyncio.create_task(self._send_with_retry(to_email, alerts))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    def _render(self, from_addr: str, to_email: str, alerts: list[dict]) -> str:
+        if len(alerts) == 1:
+            subject = alerts[0]["subject"]
+            body_lines = ["Se detectó una condición anómala en un sensor del sistema de monitoreo.", ""]
+        else:
+            subject = f"{len(alerts)} alertas de condición anómala en sensores"
+            body_lines = [f"Se detectaron {len(alerts)} condiciones anómalas en sensores del sistema de monitoreo.", ""]
+
+        for i, alert in enumerate(alerts):
+            if len(alerts) > 1:
+                body_lines.append(f"[{i + 1}] {alert['subject']}")
+            body_lines += _alert_body_lines(
+                alert["reasons"], alert["sensor_mac"], alert["gateway_mac"], alert["telemetry"],
+            )
+            body_lines.append("")
+
+        body_lines.append("Este es un mensaje automático.")
+        return _build_message(from_addr, to_email, subject, body_lines).as_string()
+
+    async def _send_with_retry(self, to_email: str, alerts: list[dict]) -> None:
+        config = _smtp_config()
+        if config is None:
+            self.emails_failed += 1
+            ALERT_EMAIL_FAILURES.inc()
+            return
+        if self._session is None:
+            self._session = _SmtpSession(*config)
+
+        msg = self._render(self._session.user, to_email, alerts)
+        sensores = ",".join(sorted({a["sensor_mac"] for a in alerts}))
+        loop = asyncio.get_running_loop()
+
+        for attempt in range(self.max_retries + 1):
+            t0 = time.perf_counter()
+            try:
+                await loop.run_in_executor(self._executor, self._session.send, to_email, msg)
+            except Exception as e:
+                ALERT_EMAIL_SECONDS.observe(time.perf_counter() - t0)
+                if attempt >= self.max_retries or _is_permanent(e) or self._closing.is_set():
+                    self.emails_failed += 1
+                    ALERT_EMAIL_FAILURES.inc()
+                    logger.exception("[EMAIL] Falló envío definitivo a=%s sensores=%s err=%s", to_email, sensores, e)
+                    return
+                delay = min(self.retry_base * (2 ** attempt), 60.0)
+                logger.warning(
+                    "[EMAIL] Falló envío a=%s intento=%d reintento_en=%.1fs err=%s",
+                    to_email, attempt + 1, delay, e,
+                )
+                try:
+                    await asyncio.wait_for(self._closing.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            elapsed = time.perf_counter() - t0
+            self.last_send_ms = elapsed * 1000
+            self.emails_sent += 1
+            ALERT_EMAIL_SECONDS.observe(elapsed)
+            ALERT_EMAILS_SENT.inc()
+            ALERTS_SENT.inc(len(alerts))
+            logger.info(
+                "[EMAIL] Enviado a=%s alertas=%d sensores=%s latencia_ms=%.1f",
+                to_email, len(alerts), sensores, self.last_send_ms,
+            )
+            return
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize(),
+            "sending": len(self._sending),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "emails_sent": self.emails_sent,
+            "emails_failed": self.emails_failed,
+            "last_send_ms": round(self.last_send_ms, 2),
+        }
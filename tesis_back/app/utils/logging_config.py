@@ -1,44 +1,157 @@
+import atexit
 import logging
-import logging.config
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from app.core.config import settings
+from app.utils.metrics import Counter
 
 # Carpeta donde se guardarán los logs (tesis_back/logs)
 LOGS_DIR = Path(__file__).resolve().parents[2] / "logs"
 LOGS_DIR.mkdir(exist_ok=True)
 
+FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
 
-def configure_logging() -> None:
+LOG_RECORDS_SUPPRESSED = Counter("log_records_suppressed_total", "Logs descartados por el límite de frecuencia")
+LOG_RECORDS_DROPPED = Counter("log_records_dropped_total", "Logs descartados con la cola de logging llena")
+
+_listener: QueueListener | None = None
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Límite de frecuencia por evento: token bucket por (logger, plantilla del
+    mensaje), así "[DEVICE OK] mac_gw=%s ..." cuenta como un solo evento sin
+    importar el sensor. Solo aplica a DEBUG e INFO de los loggers indicados:
+    WARNING en adelante (p.ej. "[ALERT NEW]") siempre pasa. Al volver a pasar un registro se agrega cuántos
+    similares se suprimieron.
+    """
+
+    def __init__(self, prefixes: tuple[str, ...], rate: float, burst: int):
+        super().__init__()
+        self.prefixes = prefixes
+        self.rate = rate
+        self.burst = burst
+        self._buckets: dict[tuple[str, str], list] = {}  # key -> [tokens, último, suprimidos]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not record.name.startswith(self.prefixes):
+            return True
+        # en modo síncrono el mismo filtro está en varios handlers: decidir una sola vez
+        decided = getattr(record, "_rate_limit_pass", None)
+        if decided is not None:
+            return decided
+
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                LOG_RECORDS_SUPPRESSED.inc()
+                record._rate_limit_pass = False
+                return False
+            bucket[0] = tokens - 1
+            suppressed, bucket[2] = bucket[2], 0
+
+        if suppressed:
+            if record.args and isinstance(record.args, tuple):
+                record.msg = f"{record.msg} [+%d similares suprimidos]"
+                record.args = record.args + (suppressed,)
+            elif not record.args:
+                record.msg = f"{record.msg} [+{suppressed} similares suprimidos]"
+        record._rate_limit_pass = True
+        return True
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    Encola el registro sin formatear: el mensaje se arma en el hilo del
+    listener, fuera del camino de ingesta. Por eso los argumentos de los logs
+    no deben mutarse después de loguear (en este proyecto son strings,
+    números o dicts que no se vuelven a tocar).
+    Con la cola llena se descarta el registro en lugar de bloquear.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()  # vacía lo que quede en la cola
+        _listener = None
+
+
+def configure_logging(log_name: str = "app.log") -> None:
     """
-    Configura el sistema de logs para toda la API.
-    - Consola (nivel INFO)
-    - Archivo logs/app.log (nivel DEBUG)
+    Configura el sistema de logs para toda la API y el worker.
+    - Consola (LOG_CONSOLE_LEVEL, INFO por defecto)
+    - Archivo rotativo logs/<log_name> (LOG_FILE_LEVEL, INFO por defecto)
+    - Con LOG_ASYNC los handlers corren en un hilo aparte (QueueHandler +
+      QueueListener): loguear desde el camino caliente es solo encolar.
+    - Límite de frecuencia para los loggers de LOG_RATE_LIMITED_LOGGERS.
+    Se puede volver a llamar (p.ej. cada partición del launcher con su archivo).
     """
-    logging_config = {
-        "version": 1,
-        "disable_existing_loggers": False,
-        "formatters": {
-            "standard": {
-                "format": "%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-            },
-        },
-        "handlers": {
-            "console": {
-                "class": "logging.StreamHandler",
-                "level": "INFO",
-                "formatter": "standard",
-            },
-            "file": {
-                "class": "logging.FileHandler",
-                "level": "DEBUG",
-                "formatter": "standard",
-                "filename": str(LOGS_DIR / "app.log"),
-                "encoding": "utf-8",
-            },
-        },
-        "root": {
-            "level": "DEBUG",
-            "handlers": ["console", "file"],
-        },
-    }
-
-    logging.config.dictConfig(logging_config)
+    global _listener
+    _stop_listener()
+
+    formatter = logging.Formatter(FORMAT)
+    console = logging.StreamHandler()
+    console.setLevel(settings.LOG_CONSOLE_LEVEL)
+    console.setFormatter(formatter)
+
+    file = RotatingFileHandler(
+        LOGS_DIR / log_name,
+        maxBytes=settings.LOG_FILE_MAX_BYTES,
+        backupCount=settings.LOG_FILE_BACKUPS,
+        encoding="utf-8",
+    )
+    file.setLevel(settings.LOG_FILE_LEVEL)
+    file.setFormatter(formatter)
+    handlers = [console, file]
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    # el nivel más bajo de los handlers: lo de menor nivel ni se crea
+    root.setLevel(min(console.level, file.level))
+
+    rate_filter = None
+    if settings.LOG_RATE_LIMIT_PER_SECOND > 0:
+        prefixes = tuple(p.strip() for p in settings.LOG_RATE_LIMITED_LOGGERS.split(",") if p.strip())
+        rate_filter = RateLimitFilter(prefixes, settings.LOG_RATE_LIMIT_PER_SECOND, settings.LOG_RATE_LIMIT_BURST)
+
+    if settings.LOG_ASYNC:
+        q: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_MAXSIZE)
+        queue_handler = _NonBlockingQueueHandler(q)
+        if rate_filter is not None:
+            # el filtro corre antes de encolar: lo suprimido no cuesta nada más
+            queue_handler.addFilter(rate_filter)
+        root.addHandler(queue_handler)
+        _listener = QueueListener(q, *handlers, respect_handler_level=True)
+        _listener.start()
+    else:
+        for handler in handlers:
+            if rate_filter is not None:
+                handler.addFilter(rate_filter)
+            root.addHandler(handler)
+
+
+atexit.register(_stop_listener)
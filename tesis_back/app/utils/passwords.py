@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from app.core.config import settings
+from app.utils.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_seconds",
+    "Duración de cada hash/verificación bcrypt en el pool",
+    ["op"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+PASSWORD_HASH_WAIT = Histogram(
+    "password_hash_queue_seconds",
+    "Espera por un lugar en el pool de bcrypt",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+PASSWORD_HASH_REJECTED = Counter("password_hash_rejected_total", "Pedidos de bcrypt rechazados con 503 (pool saturado)")
+PASSWORD_HASH_WAITING = Gauge("password_hash_waiting", "Pedidos de bcrypt esperando lugar en el pool")
+
+
+# Funciones de módulo: son las que corren en los procesos del pool
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _warm_up() -> None:
+    # carga el backend bcrypt de passlib en el proceso hijo
+    pwd_context.hash("warm-up")
+
+
+class PasswordPool:
+    """
+    bcrypt fuera del event loop de la API.
+
+    - Cada hash/verificación corre en un pool dedicado: procesos (uso real
+      de varios núcleos) o hilos (PASSWORD_HASH_EXECUTOR=thread).
+    - Un semáforo del tamaño del pool deja la cola en asyncio, donde se
+      puede limitar: con más de `max_waiting` pedidos esperando, o si uno
+      espera más de `queue_timeout` segundos, se responde 503 con
+      Retry-After en lugar de acumular logins.
+    - El pool se crea en el primer uso o en start(); los procesos se
+      lanzan con spawn, sin heredar el estado (hilos, conexiones) de uvicorn.
+    """
+
+    def __init__(
+        self,
+        executor_kind: str = settings.PASSWORD_HASH_EXECUTOR,
+        workers: int = settings.PASSWORD_HASH_WORKERS,
+        queue_timeout: float = settings.PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS,
+        max_waiting: int = settings.PASSWORD_HASH_MAX_WAITING,
+    ):
+        self.executor_kind = executor_kind
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.queue_timeout = queue_timeout
+        self.max_waiting = max_waiting
+        self._executor: Executor | None = None
+        self._semaphore = asyncio.Semaphore(self.workers)
+        self.waiting = 0
+
+        self.completed = 0
+        self.rejected = 0
+        PASSWORD_HASH_WAITING.set_function(lambda: self.waiting)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            else:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            logger.info("[PASSWORD] Pool bcrypt iniciado tipo=%s workers=%d", self.executor_kind, self.workers)
+        return self._executor
+
+    def start(self) -> None:
+        """Crea el pool y precalienta los workers (el primer login no paga el arranque)."""
+        executor = self._get_executor()
+        for _ in range(self.workers):
+            executor.submit(_warm_up)
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _busy(self) -> HTTPException:
+        self.rejected += 1
+        PASSWORD_HASH_REJECTED.inc()
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servicio ocupado, intente nuevamente en unos segundos.",
+            headers={"Retry-After": str(max(1, round(self.queue_timeout)))},
+        )
+
+    async def _run(self, op: str, fn, *args):
+        if self.waiting >= self.max_waiting:
+            logger.warning("[PASSWORD] Pool saturado, esperando=%d op=%s", self.waiting, op)
+            raise self._busy()
+
+        t0 = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("[PASSWORD] Timeout esperando el pool (%.1fs) op=%s", self.queue_timeout, op)
+            raise self._busy()
+        finally:
+            self.waiting -= 1
+
+        try:
+            t1 = time.perf_counter()
+            PASSWORD_HASH_WAIT.observe(t1 - t0)
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(self._get_executor(), fn, *args)
+            except BrokenProcessPool:
+                # un proceso hijo murió: se recrea el pool para los próximos pedidos
+                logger.exception("[PASSWORD] Pool bcrypt roto, se recrea")
+                self.stop()
+                raise self._busy()
+            PASSWORD_HASH_SECONDS.labels(op).observe(time.perf_counter() - t1)
+            self.completed += 1
+            return result
+        finally:
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", verify_password, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+password_pool = PasswordPool()
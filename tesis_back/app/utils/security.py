@@ -1,5 +1,5 @@
+import time
 from jose import jwt, JWTError
-from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
 from app.core.config import settings
 from fastapi import Depends, HTTPException, status
@@ -7,17 +7,13 @@ from app.models.usuarios import usuarios
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.database.session import get_db_session
+from app.service.principal_cache import Principal, principal_cache
 from fastapi.security import OAuth2PasswordBearer
+# versiones síncronas (scripts); los endpoints usan app.utils.passwords.password_pool
+from app.utils.passwords import pwd_context, hash_password, verify_password
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
 
 
 def create_access_token(user_id: int, role: str, expires_minutes: int):
@@ -34,37 +30,64 @@ async def get_current_user(
     token: str = Depends(oauth2_scheme),
     session: AsyncSession = Depends(get_db_session),
 ):
+    return await get_user_from_token(token, session)
+
+
+async def get_user_from_token(token: str, session: AsyncSession) -> Principal:
+    """
+    Valida el JWT y devuelve el usuario (Principal). Separado de
+    get_current_user para los WebSocket, que reciben el token por query
+    string. Con el token y el usuario en cache (principal_cache) no se
+    decodifica el JWT ni se consulta la base.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Credenciales no válidas.",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(
-            token,
-            settings.SECRET_KEY,
-            algorithms=[settings.Algorithm],
-        )
-        user_id = payload.get("sub")
-        if user_id is None:
+    user_id = principal_cache.get_claims(token)
+    if user_id is None:
+        try:
+            payload = jwt.decode(
+                token,
+                settings.SECRET_KEY,
+                algorithms=[settings.Algorithm],
+            )
+            sub = payload.get("sub")
+            if sub is None:
+                raise credentials_exception
+            user_id = int(sub)
+        except (JWTError, ValueError):
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        exp = payload.get("exp")
+        principal_cache.put_claims(token, float(exp) if exp is not None else time.time() + principal_cache.ttl, user_id)
+
+    principal = principal_cache.get_principal(user_id)
+    if principal is not None:
+        return principal
 
     result = await session.execute(
-        select(usuarios).where(usuarios.id_usuario == int(user_id))
+        select(usuarios.id_usuario, usuarios.rol, usuarios.correo, usuarios.estado_cuenta)
+        .where(usuarios.id_usuario == user_id)
     )
-    user = result.scalar_one_or_none()
+    row = result.one_or_none()
 
-    if user is None:
+    if row is None:
         raise credentials_exception
 
-    return user
+    principal = Principal(
+        id_usuario=row.id_usuario,
+        rol=row.rol,
+        correo=row.correo,
+        estado_cuenta=row.estado_cuenta,
+    )
+    principal_cache.put_principal(principal)
+    return principal
 
 def require_role(*allowed_roles:str):
     async def role_checker(
-        current_user: usuarios = Depends(get_current_user),
+        current_user: Principal = Depends(get_current_user),
     ):
         if current_user.rol not in allowed_roles:
             raise HTTPException(
@@ -0,0 +1,154 @@
+import json
+import random
+from datetime import datetime
+from dataclasses import dataclass
+from sqlalchemy import BigInteger, select, text
+from sqlalchemy.ext.compiler import compiles
+from app.core.config import settings
+from app.database.session import AsyncSessionLocal, engine
+from app.models import Base
+from app.models.dispositivos import dispositivos
+from app.models.enums import DeviceRole, OrigenRole, UserRole
+from app.models.usuarios import usuarios
+
+BENCH_EMAIL = "bench@example.invalid"
+
+
+@compiles(BigInteger, "sqlite")
+def _bigint_sqlite(type_, compiler, **kw):
+    # en SQLite solo INTEGER PRIMARY KEY es autoincremental
+    return "INTEGER"
+
+
+def _mac(prefix: int, n: int) -> str:
+    return f"{prefix:02X}:BE:{(n >> 24) & 0xFF:02X}:{(n >> 16) & 0xFF:02X}:{(n >> 8) & 0xFF:02X}:{n & 0xFF:02X}"
+
+
+@dataclass(frozen=True, slots=True)
+class SimSensor:
+    mac_gw: str
+    mac_esp: str
+    topic: str
+    registered: bool
+
+
+class Fleet:
+    """
+    Flota simulada de gateways y sensores con MACs deterministas
+    (la misma configuración genera siempre las mismas MACs, así el
+    seed de la base es reutilizable entre corridas).
+    """
+
+    def __init__(self, gateways: int, sensors_per_gateway: int, unknown_ratio: float = 0.0, seed: int = 1):
+        self.sensors: list[SimSensor] = []
+        rng = random.Random(seed)
+        n = 0
+        for g in range(gateways):
+            mac_gw = _mac(0x02, g)
+            for _ in range(sensors_per_gateway):
+                # los no registrados ejercitan el cache negativo del worker; usan
+                # otro prefijo para que un seed anterior nunca los haya creado
+                registered = rng.random() >= unknown_ratio
+                mac_esp = _mac(0x06 if registered else 0x0A, n)
+                n += 1
+                self.sensors.append(SimSensor(
+                    mac_gw=mac_gw,
+                    mac_esp=mac_esp,
+                    topic=f"gateways/{mac_gw}/sensors/{mac_esp}/telemetry",
+                    registered=registered,
+                ))
+        self.gateways = sorted({s.mac_gw for s in self.sensors})
+
+
+def sample_values(rng: random.Random, anomaly_ratio: float) -> tuple[float, float, float, float]:
+    """(ph, temperatura, turbidez, tds); una fracción anomaly_ratio supera algún umbral."""
+    ph = round(rng.uniform(6.8, 7.8), 2)
+    temp = round(rng.uniform(22.0, 28.0), 1)
+    turb = round(rng.uniform(0.5, 2.5), 2)
+    tds = round(rng.uniform(30.0, 90.0), 1)
+
+    if rng.random() < anomaly_ratio:
+        anomaly_type = rng.choice(("turb", "tds", "ph_low", "ph_high"))
+        if anomaly_type == "turb":
+            turb = round(rng.uniform(settings.TURB_MAX, settings.TURB_MAX + 4), 2)
+        elif anomaly_type == "tds":
+            tds = round(rng.uniform(settings.TDS_MAX + 10, settings.TDS_MAX + 100), 1)
+        elif anomaly_type == "ph_low":
+            ph = round(rng.uniform(settings.PH_MIN - 1, settings.PH_MIN - 0.1), 2)
+        else:
+            ph = round(rng.uniform(settings.PH_MAX + 0.1, settings.PH_MAX + 1), 2)
+
+    return ph, temp, turb, tds
+
+
+def build_payload(rng: random.Random, anomaly_ratio: float) -> bytes:
+    ph, temp, turb, tds = sample_values(rng, anomaly_ratio)
+    return json.dumps({"ph": ph, "temperatura": temp, "turbidez": turb, "tds": tds}).encode()
+
+
+async def create_schema() -> None:
+    async with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            # lector (benchmark) y escritor (worker) concurrentes
+            await conn.execute(text("PRAGMA journal_mode=WAL"))
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def seed(fleet: Fleet) -> dict:
+    """Registra el usuario, los gateways y los sensores registrados que falten."""
+    async with AsyncSessionLocal() as session:
+        user = (await session.execute(
+            select(usuarios).where(usuarios.correo == BENCH_EMAIL)
+        )).scalar_one_or_none()
+        if user is None:
+            user = usuarios(
+                nombre="Bench",
+                apellido="Carga",
+                correo=BENCH_EMAIL,
+                password_hash="!",  # no puede iniciar sesión
+                rol=UserRole.usuario,
+                estado_cuenta=1,
+                ultimo_inicio=datetime.now(),
+            )
+            session.add(user)
+            await session.flush()
+
+        wanted = fleet.gateways + [s.mac_esp for s in fleet.sensors if s.registered]
+        existing: dict[str, int] = {}
+        for i in range(0, len(wanted), 1000):
+            chunk = wanted[i:i + 1000]
+            rows = await session.execute(
+                select(dispositivos.mac, dispositivos.id_dispositivo).where(dispositivos.mac.in_(chunk))
+            )
+            existing.update(dict(rows.all()))
+
+        def new_device(mac: str, rol, id_padre: int | None) -> dispositivos:
+            return dispositivos(
+                id_usuario=user.id_usuario,
+                id_padre=id_padre,
+                nombre=f"bench {mac}",
+                rol_dispositivo=rol,
+                origen=OrigenRole.simulado,
+                mac=mac,
+                estado_dispositivo=1,
+                device_key=f"bench-{mac}",
+            )
+
+        created = 0
+        gws = [new_device(mac, DeviceRole.gateway, None) for mac in fleet.gateways if mac not in existing]
+        session.add_all(gws)
+        await session.flush()
+        for gw in gws:
+            existing[gw.mac] = gw.id_dispositivo
+        created += len(gws)
+
+        sensors = [
+            new_device(s.mac_esp, DeviceRole.sensor, existing[s.mac_gw])
+            for s in fleet.sensors
+            if s.registered and s.mac_esp not in existing
+        ]
+        session.add_all(sensors)
+        created += len(sensors)
+        await session.commit()
+
+    return {"devices_created": created, "devices_total": len(wanted)}
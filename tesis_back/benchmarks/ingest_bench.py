@@ -0,0 +1,321 @@
+"""
+Benchmark de punta a punta de la ingesta MQTT:
+generador de carga -> broker -> worker (subproceso) -> base.
+
+Mide mensajes/s procesados, latencia publish -> procesado (p50/p95/p99,
+vía los eventos live/<mac_esp> que publica el worker), profundidad de cola
+(líneas [STATS] del worker), filas escritas por segundo y RSS del worker.
+Escribe una línea JSON por muestra y una línea final con el resumen.
+
+Ejemplo:
+  python -m benchmarks.ingest_bench --gateways 200 --sensors-per-gateway 10 \\
+      --rate 2000 --duration 60 --output bench.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+import paho.mqtt.client as mqtt
+from sqlalchemy import func, select
+from app.core.config import settings
+from app.database.session import AsyncSessionLocal, engine
+from app.models.lectura import lectura
+from benchmarks.fleet import Fleet, create_schema, seed
+from benchmarks.loadgen import LoadGenerator
+
+ROOT = Path(__file__).resolve().parents[1]
+STATS_DEPTH = re.compile(r"\[STATS\] shard=(\d+) depth=(\d+)/")
+
+
+def percentile(sorted_values: list[float], p: float) -> float | None:
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return round(sorted_values[k], 3)
+
+
+def rss_bytes(pid: int) -> int:
+    """RSS del proceso y sus hijos (modo launcher), leído de /proc."""
+    total = 0
+    pending = [pid]
+    while pending:
+        p = pending.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+            with open(f"/proc/{p}/task/{p}/children") as f:
+                pending.extend(int(c) for c in f.read().split())
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            continue
+    return total
+
+
+class LatencyTracker:
+    """
+    Empareja cada publish con su evento live/<mac_esp> en orden FIFO por
+    sensor (el worker procesa las lecturas de un sensor en orden). Con la
+    política de cola `block` no hay descartes que desalineen el FIFO.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[str, deque[float]] = {}
+        self._samples: list[float] = []
+        self.matched = 0
+
+    def published(self, sensor, t: float) -> None:
+        if not sensor.registered:
+            return  # el worker no publica eventos de sensores no registrados
+        with self._lock:
+            self._pending.setdefault(sensor.mac_esp, deque()).append(t)
+
+    def processed(self, mac_esp: str, t: float) -> None:
+        with self._lock:
+            q = self._pending.get(mac_esp)
+            if not q:
+                return
+            self._samples.append((t - q.popleft()) * 1000)
+            self.matched += 1
+
+    def drain(self) -> list[float]:
+        with self._lock:
+            samples, self._samples = self._samples, []
+        return samples
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return sum(len(q) for q in self._pending.values())
+
+
+class WorkerProcess:
+    def __init__(self, processes: int, env: dict):
+        module = "app.mqtt.launcher" if processes > 1 else "app.mqtt.worker"
+        # el worker cierra ordenado con SIGINT; el launcher con SIGTERM (lo reenvía a los hijos)
+        self.stop_signal = signal.SIGTERM if processes > 1 else signal.SIGINT
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", module],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        )
+        self._lock = threading.Lock()
+        self._depths: dict[str, int] = {}
+        self.connected = threading.Event()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self) -> None:
+        # el pipe debe vaciarse siempre o el worker se bloquea al loguear
+        for line in self.proc.stdout:
+            if "[MQTT] Conectado" in line:
+                self.connected.set()
+            m = STATS_DEPTH.search(line)
+            if m:
+                with self._lock:
+                    self._depths[m.group(1)] = int(m.group(2))
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return sum(self._depths.values())
+
+    def stop(self, timeout: float = 60) -> None:
+        self.proc.send_signal(self.stop_signal)
+        try:
+            self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+async def max_lectura_id() -> int:
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(select(func.max(lectura.id_lectura)))).scalar() or 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta MQTT de punta a punta")
+    parser.add_argument("--gateways", type=int, default=100)
+    parser.add_argument("--sensors-per-gateway", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=1000, help="mensajes por segundo (total)")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--warmup", type=float, default=5, help="segundos iniciales fuera del resumen")
+    parser.add_argument("--anomaly-ratio", type=float, default=0.05)
+    parser.add_argument("--unknown-ratio", type=float, default=0.0)
+    parser.add_argument("--qos", type=int, default=1, choices=(0, 1))
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=1, help=">1 usa app.mqtt.launcher")
+    parser.add_argument("--binary", action="store_true", help="payload binario (app.mqtt.codec) en <topic>/bin")
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--create-schema", action="store_true", help="crear tablas (SQLite siempre)")
+    parser.add_argument("--output", help="archivo JSON lines (por defecto stdout)")
+    parser.add_argument("--label", default="", help="etiqueta libre, p.ej. versión")
+    args = parser.parse_args()
+
+    out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+
+    def emit(record: dict) -> None:
+        out.write(json.dumps(record, separators=(",", ":")) + "\n")
+        out.flush()
+
+    fleet = Fleet(args.gateways, args.sensors_per_gateway, args.unknown_ratio)
+
+    async def prepare() -> tuple[dict, int]:
+        if args.create_schema or engine.dialect.name == "sqlite":
+            await create_schema()
+        seeded = await seed(fleet)
+        first = await max_lectura_id()
+        # las conexiones quedan atadas a este loop; el muestreo usa otro
+        await engine.dispose()
+        return seeded, first
+
+    seeded, first_id = asyncio.run(prepare())
+
+    env = dict(os.environ)
+    env.update({
+        "INGEST_QUEUE_POLICY": "block",
+        "WORKER_STATS_INTERVAL_SECONDS": str(args.sample_interval),
+        "LIVE_PUBLISH_ENABLED": "true",
+        "CHECKPOINT_ENABLED": "false",
+        "WORKER_PROCESSES": str(args.processes),
+    })
+    worker = WorkerProcess(args.processes, env)
+
+    tracker = LatencyTracker()
+    live = mqtt.Client(client_id="", protocol=mqtt.MQTTv311)
+
+    def on_live(client, userdata, msg):
+        tracker.processed(msg.topic.rsplit("/", 1)[1], time.perf_counter())
+
+    live.on_message = on_live
+    live.on_connect = lambda c, u, f, rc: c.subscribe(f"{settings.MQTT_LIVE_TOPIC_PREFIX}/#", qos=0)
+    live.connect(settings.MQTT_BROKER, settings.MQTT_PORT, keepalive=60)
+    live.loop_start()
+
+    if not worker.connected.wait(30):
+        worker.stop()
+        raise SystemExit("El worker no se conectó al broker en 30 s")
+
+    gen = LoadGenerator(
+        fleet, settings.MQTT_BROKER, settings.MQTT_PORT, args.rate,
+        anomaly_ratio=args.anomaly_ratio, qos=args.qos, connections=args.connections,
+        on_publish=tracker.published, binary=args.binary,
+    )
+    gen_thread = threading.Thread(target=gen.run, args=(args.warmup + args.duration,), daemon=True)
+
+    # la base se consulta desde un loop propio, fuera del hilo del generador
+    db_loop = asyncio.new_event_loop()
+    threading.Thread(target=db_loop.run_forever, daemon=True).start()
+
+    def db_rows() -> int:
+        return asyncio.run_coroutine_threadsafe(max_lectura_id(), db_loop).result(30) - first_id
+
+    started_at = datetime.now().isoformat(timespec="seconds")
+    t_start = time.perf_counter()
+    gen_thread.start()
+
+    all_latencies: list[float] = []
+    rss_max = 0
+    prev_t, prev_pub, prev_proc, prev_rows = t_start, 0, 0, 0
+    summary_from = None
+
+    try:
+        while gen_thread.is_alive() or tracker.in_flight():
+            time.sleep(args.sample_interval)
+            now = time.perf_counter()
+            elapsed = now - t_start
+            dt = now - prev_t
+            rows = db_rows()
+            rss = rss_bytes(worker.proc.pid)
+            rss_max = max(rss_max, rss)
+            lat = sorted(tracker.drain())
+            # una muestra cuenta para el resumen solo si empezó después del warmup
+            in_warmup = (prev_t - t_start) < args.warmup
+            if not in_warmup:
+                all_latencies.extend(lat)
+                if summary_from is None:
+                    summary_from = (prev_t, prev_pub, prev_proc, prev_rows)
+
+            emit({
+                "t": round(elapsed, 3),
+                "warmup": in_warmup,
+                "published": gen.published,
+                "processed": tracker.matched,
+                "publish_rate": round((gen.published - prev_pub) / dt, 1),
+                "msgs_per_s": round((tracker.matched - prev_proc) / dt, 1),
+                "lat_p50_ms": percentile(lat, 50),
+                "lat_p95_ms": percentile(lat, 95),
+                "lat_p99_ms": percentile(lat, 99),
+                "queue_depth": worker.queue_depth(),
+                "db_rows": rows,
+                "db_rows_per_s": round((rows - prev_rows) / dt, 1),
+                "rss_mb": round(rss / 2**20, 1),
+            })
+            prev_t, prev_pub, prev_proc, prev_rows = now, gen.published, tracker.matched, rows
+
+            # ya no se publica y no llega nada: lo pendiente se perdió
+            if not gen_thread.is_alive() and elapsed > args.warmup + args.duration + 30:
+                break
+    except KeyboardInterrupt:
+        gen.stop()
+    finally:
+        gen.close()
+        live.loop_stop()
+        live.disconnect()
+        worker.stop()
+
+    final_rows = db_rows()
+    db_loop.call_soon_threadsafe(db_loop.stop)
+
+    t0, pub0, proc0, rows0 = summary_from or (t_start, 0, 0, 0)
+    span = prev_t - t0
+    all_latencies.sort()
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+
+    emit({
+        "summary": True,
+        "label": args.label,
+        "commit": commit,
+        "started_at": started_at,
+        "python": platform.python_version(),
+        "db": engine.dialect.name,
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "label")},
+        "sensors": len(fleet.sensors),
+        "seed": seeded,
+        "published": gen.published,
+        "bytes_per_msg": round(gen.bytes_published / gen.published, 1) if gen.published else None,
+        "processed": tracker.matched,
+        "unmatched": tracker.in_flight(),
+        "msgs_per_s": round((tracker.matched - proc0) / span, 1) if span > 0 else None,
+        "lat_p50_ms": percentile(all_latencies, 50),
+        "lat_p95_ms": percentile(all_latencies, 95),
+        "lat_p99_ms": percentile(all_latencies, 99),
+        "lat_max_ms": round(all_latencies[-1], 3) if all_latencies else None,
+        "db_rows": final_rows,
+        "db_rows_per_s": round((prev_rows - rows0) / span, 1) if span > 0 else None,
+        "rss_max_mb": round(rss_max / 2**20, 1),
+    })
+    if out is not sys.stdout:
+        out.close()
+
+
+if __name__ == "__main__":
+    main()
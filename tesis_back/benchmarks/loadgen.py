@@ -0,0 +1,142 @@
+import argparse
+import json
+import random
+import threading
+import time
+import paho.mqtt.client as mqtt
+from app.mqtt import codec
+from app.mqtt.parsing import BINARY_TOPIC_SUFFIX
+from benchmarks.fleet import Fleet, build_payload, sample_values
+
+TICK_SECONDS = 0.005
+
+
+class LoadGenerator:
+    """
+    Publica la telemetría de una flota simulada a una tasa total fija,
+    repartida en round-robin entre los sensores (cada sensor publica a
+    rate / sensores mensajes por segundo). Los gateways se reparten entre
+    `connections` clientes MQTT.
+
+    `on_publish(sensor, t)` se llama justo antes de cada publish con el
+    instante (time.perf_counter) para medir la latencia de punta a punta.
+
+    Con `binary` publica el formato de app.mqtt.codec (con timestamp y
+    secuencia) en <topic>/bin en lugar de JSON.
+    """
+
+    def __init__(
+        self,
+        fleet: Fleet,
+        broker: str,
+        port: int,
+        rate: float,
+        anomaly_ratio: float = 0.0,
+        qos: int = 1,
+        connections: int = 4,
+        on_publish=None,
+        seed: int = 1,
+        binary: bool = False,
+    ):
+        self.fleet = fleet
+        self.rate = rate
+        self.anomaly_ratio = anomaly_ratio
+        self.qos = qos
+        self.on_publish = on_publish
+        self.binary = binary
+        self.bytes_published = 0
+        self._rng = random.Random(seed)
+        self._stop = threading.Event()
+        self.published = 0
+
+        self._clients = []
+        for _ in range(max(1, connections)):
+            client = mqtt.Client(client_id="", protocol=mqtt.MQTTv311)
+            client.max_inflight_messages_set(1000)
+            client.max_queued_messages_set(0)
+            client.connect(broker, port, keepalive=60)
+            client.loop_start()
+            self._clients.append(client)
+        gw_client = {mac: i % len(self._clients) for i, mac in enumerate(fleet.gateways)}
+        self._client_for = [self._clients[gw_client[s.mac_gw]] for s in fleet.sensors]
+        self._topics = [s.topic + BINARY_TOPIC_SUFFIX if binary else s.topic for s in fleet.sensors]
+        self._sequence = [0] * len(fleet.sensors)
+
+    def _payload(self, idx: int) -> bytes:
+        if not self.binary:
+            return build_payload(self._rng, self.anomaly_ratio)
+        seq = self._sequence[idx]
+        self._sequence[idx] = seq + 1
+        return codec.encode(*sample_values(self._rng, self.anomaly_ratio), timestamp=time.time(), sequence=seq)
+
+    def run(self, duration: float) -> None:
+        sensors = self.fleet.sensors
+        n = len(sensors)
+        idx = 0
+        start = time.perf_counter()
+        end = start + duration
+        while not self._stop.is_set():
+            now = time.perf_counter()
+            if now >= end:
+                break
+            due = int((now - start) * self.rate) - self.published
+            for _ in range(due):
+                sensor = sensors[idx]
+                payload = self._payload(idx)
+                if self.on_publish is not None:
+                    self.on_publish(sensor, time.perf_counter())
+                self._client_for[idx].publish(self._topics[idx], payload, qos=self.qos)
+                self.published += 1
+                self.bytes_published += len(payload)
+                idx += 1
+                if idx == n:
+                    idx = 0
+            time.sleep(TICK_SECONDS)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def close(self) -> None:
+        for client in self._clients:
+            client.loop_stop()
+            client.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga MQTT (flota simulada)")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--gateways", type=int, default=100)
+    parser.add_argument("--sensors-per-gateway", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=500, help="mensajes por segundo (total)")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--anomaly-ratio", type=float, default=0.05)
+    parser.add_argument("--unknown-ratio", type=float, default=0.0, help="fracción de sensores no registrados")
+    parser.add_argument("--qos", type=int, default=1, choices=(0, 1))
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--binary", action="store_true", help="payload binario (app.mqtt.codec) en <topic>/bin")
+    args = parser.parse_args()
+
+    fleet = Fleet(args.gateways, args.sensors_per_gateway, args.unknown_ratio)
+    gen = LoadGenerator(
+        fleet, args.broker, args.port, args.rate,
+        anomaly_ratio=args.anomaly_ratio, qos=args.qos, connections=args.connections, binary=args.binary,
+    )
+    t0 = time.perf_counter()
+    try:
+        gen.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    elapsed = time.perf_counter() - t0
+    gen.close()
+    print(json.dumps({
+        "published": gen.published,
+        "elapsed_s": round(elapsed, 3),
+        "msgs_per_s": round(gen.published / elapsed, 1) if elapsed else 0.0,
+        "bytes_per_msg": round(gen.bytes_published / gen.published, 1) if gen.published else 0.0,
+        "sensors": len(fleet.sensors),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Benchmark de login bajo carga: API (subproceso uvicorn) -> bcrypt.
+
+Lanza una tormenta de POST /auth/login con `--concurrency` clientes y, en
+paralelo, una sonda que pide GET /auth/me (JWT + consulta a la base, sin
+bcrypt) cada `--probe-interval` segundos. Con bcrypt en el event loop la
+sonda espera detrás de cada hash; con el pool (app.utils.passwords) debe
+seguir respondiendo en milisegundos. Mide logins/s, latencia de login,
+503 por pool saturado y latencia de la sonda. Escribe una línea JSON con
+el resumen.
+
+Ejemplo:
+  python -m benchmarks.login_bench --concurrency 32 --duration 20
+  python -m benchmarks.login_bench --executor thread --label hilos
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+import httpx
+from sqlalchemy import select
+from app.database.session import AsyncSessionLocal, engine
+from app.models.enums import UserRole
+from app.models.usuarios import usuarios
+from app.utils.passwords import hash_password
+from benchmarks.fleet import create_schema
+from benchmarks.ingest_bench import percentile
+
+ROOT = Path(__file__).resolve().parents[1]
+LOGIN_EMAIL = "login-bench@example.com"  # EmailStr rechaza dominios .invalid
+LOGIN_PASSWORD = "login-bench-password"
+
+
+async def seed_login_user() -> None:
+    async with AsyncSessionLocal() as session:
+        user = (await session.execute(
+            select(usuarios).where(usuarios.correo == LOGIN_EMAIL)
+        )).scalar_one_or_none()
+        if user is None:
+            session.add(usuarios(
+                nombre="Bench",
+                apellido="Login",
+                correo=LOGIN_EMAIL,
+                password_hash=hash_password(LOGIN_PASSWORD),
+                rol=UserRole.usuario,
+                estado_cuenta=1,
+                ultimo_inicio=datetime.now(),
+            ))
+            await session.commit()
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get("/metrics")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise SystemExit(f"La API no respondió en {timeout:.0f} s")
+
+
+async def storm(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", limits=limits, timeout=60) as client:
+        await wait_ready(client)
+        r = await client.post("/auth/login", json={"correo": LOGIN_EMAIL, "password": LOGIN_PASSWORD})
+        r.raise_for_status()
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        login_ms: list[float] = []
+        probe_ms: list[float] = []
+        statuses: dict[int, int] = {}
+        stop_at = time.perf_counter() + args.duration
+
+        async def login_loop():
+            body = {"correo": LOGIN_EMAIL, "password": LOGIN_PASSWORD}
+            while time.perf_counter() < stop_at:
+                t0 = time.perf_counter()
+                resp = await client.post("/auth/login", json=body)
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+                if resp.status_code == 200:
+                    login_ms.append((time.perf_counter() - t0) * 1000)
+                elif resp.status_code == 503:
+                    await asyncio.sleep(float(resp.headers.get("Retry-After", 1)))
+
+        async def probe_loop():
+            while time.perf_counter() < stop_at:
+                t0 = time.perf_counter()
+                resp = await client.get("/auth/me", headers=headers)
+                resp.raise_for_status()
+                probe_ms.append((time.perf_counter() - t0) * 1000)
+                await asyncio.sleep(args.probe_interval)
+
+        t_start = time.perf_counter()
+        await asyncio.gather(probe_loop(), *(login_loop() for _ in range(args.concurrency)))
+        span = time.perf_counter() - t_start
+
+    login_ms.sort()
+    probe_ms.sort()
+    return {
+        "logins": len(login_ms),
+        "logins_per_s": round(len(login_ms) / span, 1),
+        "status": statuses,
+        "login_p50_ms": percentile(login_ms, 50),
+        "login_p95_ms": percentile(login_ms, 95),
+        "login_p99_ms": percentile(login_ms, 99),
+        "probes": len(probe_ms),
+        "probe_p50_ms": percentile(probe_ms, 50),
+        "probe_p99_ms": percentile(probe_ms, 99),
+        "probe_max_ms": round(probe_ms[-1], 3) if probe_ms else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de login (bcrypt) con sonda de latencia")
+    parser.add_argument("--concurrency", type=int, default=32, help="clientes haciendo login en paralelo")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    parser.add_argument("--executor", choices=("process", "thread"), default="process")
+    parser.add_argument("--workers", type=int, default=0, help="PASSWORD_HASH_WORKERS (0 = min(4, núcleos))")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="archivo JSON lines (por defecto stdout)")
+    parser.add_argument("--label", default="", help="etiqueta libre, p.ej. versión")
+    args = parser.parse_args()
+
+    async def prepare() -> None:
+        if engine.dialect.name == "sqlite":
+            await create_schema()
+        await seed_login_user()
+        await engine.dispose()
+
+    asyncio.run(prepare())
+
+    env = dict(os.environ)
+    env.update({
+        "PASSWORD_HASH_EXECUTOR": args.executor,
+        "PASSWORD_HASH_WORKERS": str(args.workers),
+        "LOG_CONSOLE_LEVEL": "WARNING",
+    })
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    started_at = datetime.now().isoformat(timespec="seconds")
+    try:
+        result = asyncio.run(storm(args))
+    finally:
+        api.terminate()
+        try:
+            api.wait(30)
+        except subprocess.TimeoutExpired:
+            api.kill()
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+
+    record = {
+        "summary": True,
+        "label": args.label,
+        "commit": commit,
+        "started_at": started_at,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "label")},
+        **result,
+    }
+    line = json.dumps(record, separators=(",", ":")) + "\n"
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as out:
+            out.write(line)
+    else:
+        sys.stdout.write(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Microbenchmark del parseo de un mensaje de telemetría en on_message:
+costo de CPU por mensaje del camino anterior (decode + json.loads +
+LecturaBaseMQTT + model_dump + split del topic) contra el actual
+(regex precompilada + TypeAdapter.validate_json sobre los bytes) y
+contra el payload binario de app.mqtt.codec.
+
+Ejemplo:
+  python -m benchmarks.parse_bench --messages 200000
+"""
+import argparse
+import json
+import random
+import time
+from app.mqtt import codec
+from app.mqtt.parsing import BINARY_TOPIC_SUFFIX, parse_payload, parse_topic
+from app.schemas.lecturas import LecturaBaseMQTT
+from benchmarks.fleet import build_payload, sample_values
+
+
+def parse_legacy(topic: str, payload: bytes) -> tuple[str, str, dict]:
+    """El camino de on_message antes del fast path (incluye el model_dump del log)."""
+    parts = topic.split("/")
+    if len(parts) != 5 or parts[0] != "gateways" or parts[2] != "sensors" or parts[4] != "telemetry":
+        raise ValueError(topic)
+    data = json.loads(payload.decode("utf-8"))
+    tele = LecturaBaseMQTT.model_validate(data)
+    telemetry = tele.model_dump()
+    tele.model_dump()
+    return parts[1], parts[3], telemetry
+
+
+def parse_fast(topic: str, payload: bytes) -> tuple[str, str, dict]:
+    mac_gw, mac_esp, binary = parse_topic(topic)
+    telemetry, _, _ = parse_payload(payload, binary or codec.is_binary(payload))
+    return mac_gw, mac_esp, telemetry
+
+
+def measure(fn, messages: list[tuple[str, bytes]], repeat: int) -> float:
+    """Mejor de `repeat` pasadas, en microsegundos por mensaje."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for topic, payload in messages:
+            fn(topic, payload)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(messages) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo por mensaje del parseo de telemetría")
+    parser.add_argument("--messages", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    topics = [
+        f"gateways/AA:BB:CC:00:00:{i % 256:02X}/sensors/0B:BE:00:00:{i // 256 % 256:02X}:{i % 256:02X}/telemetry"
+        for i in range(args.messages)
+    ]
+    messages = [(topic, build_payload(rng, 0.05)) for topic in topics]
+    binary = [
+        (topic + BINARY_TOPIC_SUFFIX, codec.encode(*sample_values(rng, 0.05), timestamp=time.time(), sequence=i))
+        for i, topic in enumerate(topics)
+    ]
+    assert parse_legacy(*messages[0]) == parse_fast(*messages[0])
+
+    legacy = measure(parse_legacy, messages, args.repeat)
+    fast = measure(parse_fast, messages, args.repeat)
+    fast_binary = measure(parse_fast, binary, args.repeat)
+    print(json.dumps({
+        "messages": args.messages,
+        "legacy_us_per_msg": round(legacy, 3),
+        "fast_us_per_msg": round(fast, 3),
+        "binary_us_per_msg": round(fast_binary, 3),
+        "speedup": round(legacy / fast, 2),
+        "binary_vs_fast": round(fast_binary / fast, 2),
+        "json_bytes_per_msg": round(sum(len(p) for _, p in messages) / len(messages), 1),
+        "binary_bytes_per_msg": round(sum(len(p) for _, p in binary) / len(binary), 1),
+    }))
+
+
+if __name__ == "__main__":
+    main()
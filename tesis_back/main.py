@@ -1,5 +1,8 @@
+import asyncio
 import logging
-from fastapi import FastAPI, Depends
+import time
+from fastapi import FastAPI, Depends, Request
+from fastapi.responses import Response
 from pydantic import ValidationError
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -11,6 +14,14 @@ from app.api.system import router as system_router
 from app.api.user import router as users_router
 from app.api.device import router as device_router
 from app.api.auth import router as auth_router
+from app.api.lecturas import router as lecturas_router
+from app.api.live import router as live_router
+from app.api.ingest import router as ingest_router
+from app.api.perfiles import router as perfiles_router
+from app.service.live_hub import live_hub
+from app.service.registry_events import control_publisher
+from app.utils.passwords import password_pool
+from app.utils.metrics import CONTENT_TYPE, REGISTRY, Gauge, Histogram
 # -------------------------------------------------
 # Configuración global de logging
 # -------------------------------------------------
@@ -34,17 +45,64 @@ app.include_router(system_router)
 app.include_router(users_router)
 app.include_router(device_router)
 app.include_router(auth_router)
+app.include_router(lecturas_router)
+app.include_router(live_router)
+app.include_router(ingest_router)
+app.include_router(perfiles_router)
+
+# -------------------------------------------------
+# Métricas HTTP
+# -------------------------------------------------
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Latencia de las peticiones HTTP por ruta (hasta enviar los encabezados)",
+    ["method", "route", "status"],
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Peticiones HTTP en curso",
+)
+
+
+@app.middleware("http")
+async def medir_peticiones(request: Request, call_next):
+    HTTP_REQUESTS_IN_PROGRESS.inc()
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUESTS_IN_PROGRESS.dec()
+        # plantilla de la ruta (/dispositivos/{mac}), no la URL: pocas etiquetas
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            request.method,
+            route.path if route is not None else "sin_ruta",
+            status,
+        ).observe(time.perf_counter() - t0)
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas en formato Prometheus (API, base de datos y proceso)."""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 # -------------------------------------------------
 # Validación adicional del archivo .env
 # -------------------------------------------------
 
 def validacion_env(settings: Settings) -> None:
     """
-    Valida que ninguna variable cargada desde Settings sea None
-    o un string vacío. Todas las variables son críticas, por lo tanto
-    si alguna no tiene contenido se detiene la ejecución.
+    Valida que ninguna variable requerida cargada desde Settings sea None
+    o un string vacío. Las requeridas son críticas, por lo tanto si alguna
+    no tiene contenido se detiene la ejecución. Las opcionales (con valor
+    por defecto) pueden quedar vacías, p.ej. DATABASE_URL.
     """
     for name, value in settings.model_dump().items():
+        if not Settings.model_fields[name].is_required():
+            continue
         if value is None:
             logger.critical("La variable de entorno %s es None.", name)
             raise RuntimeError(f"Variable crítica sin valor: {name}")
@@ -100,10 +158,20 @@ async def startup_event():
     safe_settings = settings.model_dump(exclude={"DB_PASSWORD", "MQTT_PASSWORD"})
     logger.debug("Configuraciones cargadas (sin exponer secretos)")
 
+    # telemetría en vivo publicada por el worker MQTT
+    live_hub.start(asyncio.get_running_loop())
+    # avisos de control al worker (cache de registro, perfiles) por una conexión persistente
+    control_publisher.start()
+    # bcrypt en procesos aparte: se lanzan ahora y no en el primer login
+    password_pool.start()
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Finalizando la aplicación Tesis Back API")
+    live_hub.stop()
+    control_publisher.stop()
+    password_pool.stop()
 
 
 
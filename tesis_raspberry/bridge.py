@@ -1,15 +1,78 @@
+import json
+import threading
 import time
 import paho.mqtt.client as mqtt
-from settings import Settings
+from edge import EdgeProcessor
+from settings import BASE_DIR, Settings
+from uplink import Spool, Uplink
 
 
 def main():
     settings = Settings()
+    if settings.EDGE_ENABLED and None in (settings.PH_MIN, settings.PH_MAX, settings.TURB_MAX, settings.TDS_MAX):
+        raise SystemExit("[EDGE] EDGE_ENABLED requiere PH_MIN, PH_MAX, TURB_MAX y TDS_MAX (los mismos del backend)")
 
     # --- Cliente B2 (broker central) ---
-    client_b2 = mqtt.Client(client_id="bridge-b2")
-    client_b2.connect(settings.MQTT_B2_HOST, settings.MQTT_B2_PORT, keepalive=60)
-    client_b2.loop_start()
+    spool_path = BASE_DIR / settings.BRIDGE_SPOOL_PATH
+    spool = Spool(str(spool_path), settings.BRIDGE_SPOOL_MAX_BYTES)
+    pending = spool.stats()
+    if pending["pending"]:
+        print(f"[SPOOL] {pending['pending']} mensajes pendientes de una ejecución anterior")
+    uplink = Uplink(
+        settings.MQTT_B2_HOST,
+        settings.MQTT_B2_PORT,
+        spool,
+        max_inflight=settings.BRIDGE_MAX_INFLIGHT,
+        batch_max=settings.BRIDGE_BATCH_MAX_MESSAGES,
+        batch_delay=settings.BRIDGE_BATCH_MAX_DELAY_MS / 1000,
+        batch_topic=settings.BRIDGE_BATCH_TOPIC,
+        replay_rate=settings.BRIDGE_REPLAY_RATE,
+    )
+    uplink.start()
+
+    # --- Procesamiento en el borde (opcional) ---
+    edge = None
+    if settings.EDGE_ENABLED:
+        edge = EdgeProcessor(
+            deadband={
+                "ph": settings.EDGE_DEADBAND_PH,
+                "temperatura": settings.EDGE_DEADBAND_TEMPERATURA,
+                "turbidez": settings.EDGE_DEADBAND_TURBIDEZ,
+                "tds": settings.EDGE_DEADBAND_TDS,
+            },
+            max_interval=settings.EDGE_MAX_INTERVAL_SECONDS,
+            window=settings.EDGE_SUMMARY_WINDOW_SECONDS,
+            limits={
+                "ph_min": settings.PH_MIN,
+                "ph_max": settings.PH_MAX,
+                "turbidez_max": settings.TURB_MAX,
+                "tds_max": settings.TDS_MAX,
+            },
+        )
+        print(f"[EDGE] Deadband + resúmenes cada {settings.EDGE_SUMMARY_WINDOW_SECONDS:.0f} s")
+
+        def on_limits(payload: bytes):
+            # los perfiles de umbrales pueden ser más estrictos que el global:
+            # sin esto una lectura que solo dispara un perfil quedaría en el deadband
+            try:
+                limits = json.loads(payload)
+                edge.set_limits(limits)
+            except (ValueError, TypeError, AttributeError) as e:
+                print(f"[EDGE] Límites inválidos en {settings.EDGE_LIMITS_TOPIC}: {e}")
+                return
+            print(f"[EDGE] Límites actualizados: {edge.limits}")
+
+        if settings.EDGE_LIMITS_TOPIC:
+            uplink.subscribe(settings.EDGE_LIMITS_TOPIC, on_limits)
+
+        def flush_windows():
+            # resúmenes de sensores que dejaron de reportar
+            while True:
+                time.sleep(1)
+                for topic, payload in edge.flush_due():
+                    uplink.forward(topic, payload)
+
+        threading.Thread(target=flush_windows, name="edge-windows", daemon=True).start()
 
     # --- Callbacks B1 ---
     def on_connect_b1(client, userdata, flags, rc):
@@ -21,11 +84,13 @@ def main():
             print(f"[B1] Error de conexión rc={rc}")
 
     def on_message_b1(client, userdata, msg):
-        # Reenviar a B2 manteniendo el mismo tópico
-        result = client_b2.publish(topic=msg.topic, payload=msg.payload, qos=1)
-        # publish() es async; esperamos a que se encole
-        result.wait_for_publish()
-        #print(f"[BRIDGE] {msg.topic} -> B2 (qos=1)")
+        # Reenviar a B2 manteniendo el mismo tópico, sin esperar la confirmación
+        # (varios en vuelo; sin B2 va al spool y se reenvía al reconectar)
+        if edge is None:
+            uplink.forward(msg.topic, msg.payload)
+            return
+        for topic, payload in edge.process(msg.topic, msg.payload):
+            uplink.forward(topic, payload)
 
     # --- Cliente B1 (broker Raspberry) ---
     client_b1 = mqtt.Client(client_id="bridge-b1")
@@ -37,15 +102,43 @@ def main():
 
     print("[INFO] Bridge corriendo. Ctrl+C para salir.")
     try:
+        last = uplink.stats()
+        last_t = time.monotonic()
         while True:
-            time.sleep(1)
+            time.sleep(settings.BRIDGE_STATS_INTERVAL_SECONDS)
+            stats = uplink.stats()
+            now = time.monotonic()
+            dt = now - last_t
+            spool_stats = stats["spool"]
+            print(
+                f"[STATS] b2={'ok' if stats['connected'] else 'caido'} "
+                f"reenviados={stats['forwarded']} ({(stats['forwarded'] - last['forwarded']) / dt:.1f}/s) "
+                f"lotes={stats['batches']} en_vuelo={stats['inflight']} "
+                f"spool_pendientes={spool_stats['pending']} spool_bytes={spool_stats['bytes']} "
+                f"spooleados={spool_stats['appended']} descartados={spool_stats['dropped']} "
+                f"reproducidos={stats['replayed']} ({(stats['replayed'] - last['replayed']) / dt:.1f}/s)"
+            )
+            if edge is not None:
+                edge_stats = edge.stats()
+                received = edge_stats["received"]
+                print(
+                    f"[EDGE] recibidas={received} reenviadas={edge_stats['forwarded']} "
+                    f"suprimidas={edge_stats['suppressed']} anomalias={edge_stats['anomalies']} "
+                    f"resumenes={edge_stats['summaries']} "
+                    f"reduccion={received / max(1, edge_stats['forwarded'] + edge_stats['summaries']):.1f}x"
+                )
+            last, last_t = stats, now
     except KeyboardInterrupt:
         print("\n[INFO] Cerrando...")
     finally:
+        # primero B1: no entran mensajes nuevos mientras se vacía el uplink
         client_b1.loop_stop()
-        client_b2.loop_stop()
         client_b1.disconnect()
-        client_b2.disconnect()
+        if edge is not None:
+            # ventanas en curso: resumen parcial (el worker lo combina en la misma hora)
+            for topic, payload in edge.flush_all():
+                uplink.forward(topic, payload)
+        uplink.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,203 @@
+import json
+import math
+import re
+import threading
+import time
+
+# gateways/<mac_gw>/sensors/<mac_esp>/telemetry (solo JSON; el binario pasa tal cual)
+TOPIC_RE = re.compile(r"gateways/([^/]+)/sensors/([^/]+)/telemetry")
+FIELDS = ("ph", "temperatura", "turbidez", "tds")
+# mismas reglas que app/mqtt/thresholds.py: (límite, índice en FIELDS, comparación)
+RULES = (
+    ("ph_min", 0, "<"),
+    ("ph_max", 0, ">"),
+    ("temperatura_min", 1, "<"),
+    ("temperatura_max", 1, ">"),
+    ("turbidez_max", 2, ">="),
+    ("tds_max", 3, ">"),
+)
+LIMIT_FIELDS = tuple(rule[0] for rule in RULES)
+
+
+class _SensorState:
+    __slots__ = ("last", "last_at", "anomalous", "win_start", "count", "min", "max", "sum")
+
+    def __init__(self):
+        self.last = None          # valores de la última lectura reenviada
+        self.last_at = 0.0
+        self.anomalous = False
+        self.win_start = 0.0
+        self.count = 0            # lecturas suprimidas en la ventana
+        self.min = [math.inf] * 4
+        self.max = [-math.inf] * 4
+        self.sum = [0.0] * 4
+
+
+class EdgeProcessor:
+    """
+    Procesamiento en el borde por sensor, antes del uplink:
+    - deadband: una lectura se reenvía solo si alguna métrica se movió más
+      que su umbral respecto de la última reenviada, o si pasaron
+      `max_interval` segundos desde entonces.
+    - anomalías: una lectura fuera de los límites se reenvía siempre y al
+      instante, y también la primera normal después (para que el worker
+      cierre la alerta). Los límites son, regla por regla, los más
+      estrictos entre el global y los perfiles de umbrales del backend: el
+      worker los publica (retained) en control/edge-limits y llegan por
+      set_limits; hasta entonces rigen PH_MIN/PH_MAX/TURB_MAX/TDS_MAX.
+    - resúmenes: las lecturas suprimidas se acumulan en ventanas de
+      `window` segundos alineadas al reloj (conviene un divisor de 3600) y
+      al cerrar la ventana se publica gateways/<gw>/sensors/<esp>/summary
+      con cantidad, min, max y promedio. El worker los suma a lectura_hora,
+      así el resumen horario sigue contando todas las lecturas.
+    """
+
+    def __init__(
+        self,
+        deadband: dict[str, float],
+        max_interval: float,
+        window: float,
+        limits: dict[str, float | None],
+    ):
+        self.deadband = tuple(deadband[f] for f in FIELDS)
+        self.max_interval = max_interval
+        self.window = window
+        self._checks: tuple = ()
+        self.set_limits(limits)
+        self._lock = threading.Lock()
+        self._sensors: dict[tuple[str, str], _SensorState] = {}
+
+        self.received = 0
+        self.forwarded = 0
+        self.suppressed = 0
+        self.anomalies = 0
+        self.summaries = 0
+
+    def set_limits(self, limits: dict[str, float | None]) -> None:
+        """Límites por regla (LIMIT_FIELDS); None o ausente = regla apagada."""
+        limits = {field: limits.get(field) for field in LIMIT_FIELDS}
+        checks = tuple(
+            (i, op, float(limits[field]))
+            for field, i, op in RULES
+            if limits[field] is not None
+        )
+        # se reemplaza la tupla entera: process() nunca ve una mezcla
+        self.limits = limits
+        self._checks = checks
+
+    def is_anomalous(self, values: tuple) -> bool:
+        for i, op, limit in self._checks:
+            value = values[i]
+            if op == "<":
+                if value < limit:
+                    return True
+            elif op == ">=":
+                if value >= limit:
+                    return True
+            elif value > limit:
+                return True
+        return False
+
+    def process(self, topic: str, payload: bytes, now: float | None = None) -> list[tuple[str, bytes]]:
+        """Mensajes a reenviar por una lectura: ninguno, la lectura y/o el resumen de la ventana anterior."""
+        m = TOPIC_RE.fullmatch(topic)
+        if m is None:
+            return [(topic, payload)]
+        try:
+            data = json.loads(payload)
+            values = tuple(float(data[f]) for f in FIELDS)
+        except (ValueError, TypeError, KeyError):
+            # que lo rechace (y lo cuente) el backend
+            return [(topic, payload)]
+
+        now = time.time() if now is None else now
+        out = []
+        with self._lock:
+            self.received += 1
+            key = (m.group(1), m.group(2))
+            st = self._sensors.get(key)
+            if st is None:
+                st = self._sensors[key] = _SensorState()
+                st.win_start = self._window_start(now)
+            elif now >= st.win_start + self.window:
+                self._close_window(key, st, out)
+                st.win_start = self._window_start(now)
+
+            anomalous = self.is_anomalous(values)
+            if anomalous:
+                self.anomalies += 1
+            forward = (
+                anomalous
+                or st.anomalous
+                or st.last is None
+                or now - st.last_at >= self.max_interval
+                or any(abs(v - prev) > band for v, prev, band in zip(values, st.last, self.deadband))
+            )
+            st.anomalous = anomalous
+            if forward:
+                st.last = values
+                st.last_at = now
+                self.forwarded += 1
+                out.append((topic, payload))
+            else:
+                self.suppressed += 1
+                st.count += 1
+                for i, v in enumerate(values):
+                    if v < st.min[i]:
+                        st.min[i] = v
+                    if v > st.max[i]:
+                        st.max[i] = v
+                    st.sum[i] += v
+        return out
+
+    def _window_start(self, now: float) -> float:
+        return now - (now % self.window)
+
+    def _close_window(self, key: tuple[str, str], st: _SensorState, out: list) -> None:
+        if st.count:
+            summary = {
+                "desde": st.win_start,
+                "hasta": st.win_start + self.window,
+                "cantidad": st.count,
+                "min": dict(zip(FIELDS, st.min)),
+                "max": dict(zip(FIELDS, st.max)),
+                "promedio": {f: s / st.count for f, s in zip(FIELDS, st.sum)},
+            }
+            out.append((
+                f"gateways/{key[0]}/sensors/{key[1]}/summary",
+                json.dumps(summary, separators=(",", ":")).encode(),
+            ))
+            self.summaries += 1
+        st.count = 0
+        st.min = [math.inf] * 4
+        st.max = [-math.inf] * 4
+        st.sum = [0.0] * 4
+
+    def flush_due(self, now: float | None = None) -> list[tuple[str, bytes]]:
+        """Resúmenes de las ventanas ya terminadas (sensores que dejaron de reportar)."""
+        now = time.time() if now is None else now
+        out = []
+        with self._lock:
+            for key, st in self._sensors.items():
+                if now >= st.win_start + self.window:
+                    self._close_window(key, st, out)
+                    st.win_start = self._window_start(now)
+        return out
+
+    def flush_all(self) -> list[tuple[str, bytes]]:
+        """Resúmenes de todas las ventanas, aunque no hayan terminado (al cerrar el bridge)."""
+        out = []
+        with self._lock:
+            for key, st in self._sensors.items():
+                self._close_window(key, st, out)
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "received": self.received,
+                "forwarded": self.forwarded,
+                "suppressed": self.suppressed,
+                "anomalies": self.anomalies,
+                "summaries": self.summaries,
+            }
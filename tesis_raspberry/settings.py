@@ -12,6 +12,32 @@ class Settings(BaseSettings):
     MQTT_B2_PORT: int
     MQTT_TOPIC_SUB: str
 
+    #Reenvío a B2 (ver uplink.py)
+    BRIDGE_MAX_INFLIGHT: int = 100 # publishes QoS 1 sin confirmar
+    BRIDGE_BATCH_MAX_MESSAGES: int = 1 # >1 agrupa mensajes en lotes (el worker los separa)
+    BRIDGE_BATCH_MAX_DELAY_MS: float = 200 # espera máxima para completar un lote
+    BRIDGE_BATCH_TOPIC: str = "bridge/b1/batch" # el worker se suscribe a bridge/+/batch
+    BRIDGE_SPOOL_PATH: str = "spool/bridge.spool" # relativo a tesis_raspberry/
+    BRIDGE_SPOOL_MAX_BYTES: int = 500_000_000 # 0 = sin límite; lleno, se descartan los mensajes nuevos
+    BRIDGE_REPLAY_RATE: float = 1000 # mensajes/s al vaciar el spool; 0 = sin límite
+    BRIDGE_STATS_INTERVAL_SECONDS: float = 10
+
+    #Procesamiento en el borde (ver edge.py)
+    EDGE_ENABLED: bool = False
+    EDGE_DEADBAND_PH: float = 0.05 # cambio mínimo respecto de la última lectura reenviada
+    EDGE_DEADBAND_TEMPERATURA: float = 0.2
+    EDGE_DEADBAND_TURBIDEZ: float = 0.1
+    EDGE_DEADBAND_TDS: float = 2
+    EDGE_MAX_INTERVAL_SECONDS: float = 300 # se reenvía al menos una lectura cada 5 min por sensor
+    EDGE_SUMMARY_WINDOW_SECONDS: float = 60 # divisor de 3600: una ventana nunca cruza dos horas
+    EDGE_LIMITS_TOPIC: str = "control/edge-limits" # límites del backend (global + perfiles); vacío usa solo los de abajo
+    # mismos límites globales que el backend; obligatorios con EDGE_ENABLED
+    # (rigen hasta recibir los de EDGE_LIMITS_TOPIC)
+    PH_MIN: float | None = None
+    PH_MAX: float | None = None
+    TURB_MAX: float | None = None
+    TDS_MAX: float | None = None
+
     model_config = SettingsConfigDict(
         env_file=str(ENV_FILE),
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,424 @@
+import os
+import struct
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+# -----------------------------
+# Formato de lote y de registro del spool
+# (el mismo que app/mqtt/codec.py del backend)
+# -----------------------------
+BATCH_MAGIC = 0xB7
+BATCH_VERSION = 1
+_BATCH_HEADER = struct.Struct("<BBH")   # magic, versión, cantidad
+_ENTRY_HEADER = struct.Struct("<HI")    # largo del topic, largo del payload
+BATCH_MAX_ENTRIES = 0xFFFF
+
+
+def encode_entry(topic: str, payload: bytes) -> bytes:
+    topic_bytes = topic.encode("utf-8")
+    return _ENTRY_HEADER.pack(len(topic_bytes), len(payload)) + topic_bytes + payload
+
+
+def encode_batch(entries: list[tuple[str, bytes]]) -> bytes:
+    out = bytearray(_BATCH_HEADER.pack(BATCH_MAGIC, BATCH_VERSION, len(entries)))
+    for topic, payload in entries:
+        out += encode_entry(topic, payload)
+    return bytes(out)
+
+
+class Spool:
+    """
+    Archivo append-only con los mensajes que no se pudieron enviar a B2.
+    Cada registro es (largo topic, largo payload, topic, payload). Lo ya
+    confirmado por B2 se guarda como offset en <path>.offset (a lo sumo una
+    vez por segundo), así al reiniciar se retoma desde ahí; cuando se
+    confirmó todo el archivo se trunca. Entrega al menos una vez: tras un
+    corte de energía se pueden repetir los últimos mensajes.
+    Seguro entre hilos (B1 agrega, el hilo de replay lee, B2 confirma).
+    """
+
+    OFFSET_SAVE_INTERVAL = 1.0
+
+    def __init__(self, path: str, max_bytes: int = 0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._offset_path = path + ".offset"
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a+b")
+
+        self.committed = self._load_offset()
+        self.size = self._recover()
+        if self.committed > self.size:
+            self.committed = 0
+        self.read_offset = self.committed
+        self.pending_count = self._count(self.read_offset, self.size)
+        self._last_offset_save = time.monotonic()
+
+        self.appended = 0
+        self.dropped = 0
+
+    def _load_offset(self) -> int:
+        try:
+            with open(self._offset_path, "r") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _save_offset(self) -> None:
+        tmp = self._offset_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(self.committed))
+        os.replace(tmp, self._offset_path)
+        self._last_offset_save = time.monotonic()
+
+    def _iter_records(self, start: int, end: int):
+        """(offset de inicio, offset de fin) de cada registro completo en [start, end)."""
+        offset = start
+        while offset + _ENTRY_HEADER.size <= end:
+            self._file.seek(offset)
+            topic_len, payload_len = _ENTRY_HEADER.unpack(self._file.read(_ENTRY_HEADER.size))
+            record_end = offset + _ENTRY_HEADER.size + topic_len + payload_len
+            if record_end > end:
+                return
+            yield offset, record_end
+            offset = record_end
+
+    def _recover(self) -> int:
+        """Descarta un registro a medio escribir al final (corte durante un append)."""
+        self._file.seek(0, os.SEEK_END)
+        size = self._file.tell()
+        valid = self.committed if self.committed <= size else 0
+        for _, record_end in self._iter_records(valid, size):
+            valid = record_end
+        if valid != size:
+            print(f"[SPOOL] Registro incompleto al final, se descartan {size - valid} bytes")
+            self._file.truncate(valid)
+        return valid
+
+    def _count(self, start: int, end: int) -> int:
+        return sum(1 for _ in self._iter_records(start, end))
+
+    def pending(self) -> bool:
+        """Quedan mensajes sin reenviar (mientras tanto lo nuevo también va al spool, para mantener el orden)."""
+        with self._lock:
+            return self.read_offset < self.size
+
+    def append(self, topic: str, payload: bytes) -> bool:
+        record = encode_entry(topic, payload)
+        with self._lock:
+            if self.max_bytes and self.size + len(record) > self.max_bytes:
+                self.dropped += 1
+                return False
+            self._file.write(record)
+            self._file.flush()  # al SO: sobrevive a que se caiga el proceso
+            self.size += len(record)
+            self.pending_count += 1
+            self.appended += 1
+        return True
+
+    def read(self, max_records: int) -> tuple[list[tuple[str, bytes]], int, int]:
+        """Hasta max_records mensajes en orden: (mensajes, offset de inicio, offset de fin)."""
+        entries = []
+        with self._lock:
+            start = self.read_offset
+            end = start
+            self._file.seek(start)
+            while len(entries) < max_records and end < self.size:
+                topic_len, payload_len = _ENTRY_HEADER.unpack(self._file.read(_ENTRY_HEADER.size))
+                topic = self._file.read(topic_len).decode("utf-8")
+                payload = self._file.read(payload_len)
+                entries.append((topic, payload))
+                end += _ENTRY_HEADER.size + topic_len + payload_len
+            self.read_offset = end
+            self.pending_count -= len(entries)
+        return entries, start, end
+
+    def rewind(self, start: int, count: int) -> None:
+        """Devuelve al spool lo leído que no se llegó a publicar."""
+        with self._lock:
+            if start < self.read_offset:
+                self.read_offset = start
+                self.pending_count += count
+
+    def commit(self, end: int) -> None:
+        """B2 confirmó los mensajes hasta `end`."""
+        with self._lock:
+            if end > self.committed:
+                self.committed = end
+            if self.committed >= self.size:
+                # todo confirmado: primero el offset a 0 y después truncar; si se corta
+                # en el medio se repite el archivo (al menos una vez) en lugar de perderlo
+                self.committed = self.read_offset = self.size = 0
+                self._save_offset()
+                self._file.truncate(0)
+            elif time.monotonic() - self._last_offset_save >= self.OFFSET_SAVE_INTERVAL:
+                self._save_offset()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": self.pending_count,
+                "bytes": self.size - self.committed,
+                "appended": self.appended,
+                "dropped": self.dropped,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._save_offset()
+            self._file.close()
+
+
+class Uplink:
+    """
+    Reenvío hacia el broker central (B2) sin esperar cada publish:
+    - hasta `max_inflight` publishes QoS 1 en vuelo (un semáforo que se
+      libera en on_publish); con la ventana llena el hilo de B1 espera,
+      así la presión vuelve al broker local en lugar de crecer en memoria.
+    - con `batch_max` > 1 agrupa mensajes en un lote (formato de
+      app/mqtt/codec.py) publicado en `batch_topic`, cada `batch_max`
+      mensajes o `batch_delay` segundos.
+    - sin conexión a B2 los mensajes van al spool; al reconectar se
+      reenvían en orden (a `replay_rate` mensajes/s, 0 = sin límite) y,
+      mientras quede spool, lo nuevo también se encola detrás.
+    """
+
+    SLOT_WAIT = 0.5
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        spool: Spool,
+        max_inflight: int = 100,
+        batch_max: int = 1,
+        batch_delay: float = 0.2,
+        batch_topic: str = "bridge/b1/batch",
+        replay_rate: float = 1000,
+        client_id: str = "bridge-b2",
+    ):
+        self.host = host
+        self.port = port
+        self.spool = spool
+        self.max_inflight = max(1, max_inflight)
+        self.batch_max = max(1, min(batch_max, BATCH_MAX_ENTRIES))
+        self.batch_delay = batch_delay
+        self.batch_topic = batch_topic
+        self.replay_rate = replay_rate
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_inflight)
+        self._connected = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._batch: list[tuple[str, bytes]] = []
+        self._batch_deadline = 0.0
+        # mid -> (mensajes, offset de fin en el spool o None); _acked_early cubre
+        # el PUBACK que llega antes de que publish() devuelva el mid
+        self._inflight: dict[int, tuple[int, int | None]] = {}
+        self._acked_early: set[int] = set()
+        self._subscriptions: list[str] = []
+
+        self.forwarded = 0
+        self.batches = 0
+        self.replayed = 0
+
+        self.client = mqtt.Client(client_id=client_id)
+        self.client.max_inflight_messages_set(self.max_inflight)
+        self.client.max_queued_messages_set(0)
+        self.client.reconnect_delay_set(1, 30)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+
+        self._threads = [
+            threading.Thread(target=self._replay_loop, name="uplink-replay", daemon=True),
+            threading.Thread(target=self._batch_timer, name="uplink-batch", daemon=True),
+        ]
+
+    # -----------------------------
+    # Conexión a B2
+    # -----------------------------
+    def start(self) -> None:
+        # connect_async: si B2 no está al arrancar se spoolea y se sigue reintentando
+        self.client.connect_async(self.host, self.port, keepalive=60)
+        self.client.loop_start()
+        for thread in self._threads:
+            thread.start()
+
+    def subscribe(self, topic: str, callback) -> None:
+        """Mensajes de B2 hacia la Raspberry: callback(payload) en el hilo de paho."""
+        self.client.message_callback_add(topic, lambda client, userdata, msg: callback(msg.payload))
+        self._subscriptions.append(topic)
+        if self._connected:
+            self.client.subscribe(topic, qos=1)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            print(f"[B2] Conectado a {self.host}:{self.port}")
+            for topic in self._subscriptions:
+                client.subscribe(topic, qos=1)
+            with self._lock:
+                self._connected = True
+            self._wake.set()
+        else:
+            print(f"[B2] Error de conexión rc={rc}")
+
+    def _on_disconnect(self, client, userdata, rc):
+        with self._lock:
+            self._connected = False
+            # el lote en armado pasa al spool antes que cualquier mensaje nuevo
+            batch, self._batch = self._batch, []
+            for topic, payload in batch:
+                self.spool.append(topic, payload)
+        if not self._stop.is_set():
+            print(f"[B2] Desconectado rc={rc}, mensajes al spool")
+
+    def _on_publish(self, client, userdata, mid):
+        with self._lock:
+            sent = self._inflight.pop(mid, None)
+            if sent is None:
+                self._acked_early.add(mid)
+                return
+        self._acked(*sent)
+
+    def _acked(self, count: int, spool_end: int | None) -> None:
+        self._slots.release()
+        if spool_end is not None:
+            self.spool.commit(spool_end)
+            self._wake.set()
+
+    # -----------------------------
+    # Envío
+    # -----------------------------
+    def forward(self, topic: str, payload: bytes) -> None:
+        """Llamado desde el hilo de B1 por cada mensaje."""
+        with self._lock:
+            if not self._connected or self.spool.pending():
+                self.spool.append(topic, payload)
+                return
+            if self.batch_max == 1:
+                entries = None
+            else:
+                if not self._batch:
+                    self._batch_deadline = time.monotonic() + self.batch_delay
+                self._batch.append((topic, payload))
+                if len(self._batch) < self.batch_max:
+                    return
+                entries, self._batch = self._batch, []
+
+        if entries is None:
+            self._send(topic, payload, [(topic, payload)], None)
+        else:
+            self._send(self.batch_topic, encode_batch(entries), entries, None)
+
+    def _acquire_slot(self) -> bool:
+        """Espera un lugar en la ventana; False si B2 se desconectó mientras tanto."""
+        while not self._slots.acquire(timeout=self.SLOT_WAIT):
+            if not self._connected or self._stop.is_set():
+                return False
+        return True
+
+    def _send(self, topic: str, payload: bytes, entries: list[tuple[str, bytes]], spool_end: int | None) -> bool:
+        if not self._acquire_slot():
+            if spool_end is None:
+                for entry_topic, entry_payload in entries:
+                    self.spool.append(entry_topic, entry_payload)
+            return False
+        # sin self._lock: paho llama a on_publish con su propio lock tomado
+        info = self.client.publish(topic, payload, qos=1)
+        with self._lock:
+            if len(entries) > 1:
+                self.batches += 1
+            if spool_end is None:
+                self.forwarded += len(entries)
+            else:
+                self.replayed += len(entries)
+            early = info.mid in self._acked_early
+            if early:
+                self._acked_early.discard(info.mid)
+            else:
+                self._inflight[info.mid] = (len(entries), spool_end)
+        if early:
+            self._acked(len(entries), spool_end)
+        return True
+
+    def _flush_batch(self) -> None:
+        with self._lock:
+            if not self._batch or not self._connected:
+                return
+            entries, self._batch = self._batch, []
+        self._send(self.batch_topic, encode_batch(entries), entries, None)
+
+    def _batch_timer(self) -> None:
+        while not self._stop.is_set():
+            time.sleep(min(self.batch_delay, 0.05) if self.batch_max > 1 else 1.0)
+            if self._batch and time.monotonic() >= self._batch_deadline:
+                self._flush_batch()
+
+    # -----------------------------
+    # Replay del spool
+    # -----------------------------
+    def _replay_loop(self) -> None:
+        started = None
+        sent = 0
+        while not self._stop.is_set():
+            if not self._connected or not self.spool.pending():
+                started = None
+                self._wake.wait(1.0)
+                self._wake.clear()
+                continue
+            if started is None:
+                started, sent = time.monotonic(), 0
+                print(f"[SPOOL] Reenviando {self.spool.stats()['pending']} mensajes pendientes")
+
+            entries, start, end = self.spool.read(self.batch_max)
+            if not entries:
+                continue
+            if len(entries) == 1:
+                topic, payload = entries[0]
+            else:
+                topic, payload = self.batch_topic, encode_batch(entries)
+            if not self._send(topic, payload, entries, end):
+                self.spool.rewind(start, len(entries))
+                continue
+
+            sent += len(entries)
+            if self.replay_rate > 0:
+                # no saturar el enlace ni el worker al volver de un corte largo
+                ahead = sent / self.replay_rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    # -----------------------------
+    # Métricas y cierre
+    # -----------------------------
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "connected": self._connected,
+                "forwarded": self.forwarded,
+                "batches": self.batches,
+                "replayed": self.replayed,
+                "inflight": len(self._inflight),
+            }
+        stats["spool"] = self.spool.stats()
+        return stats
+
+    def close(self, timeout: float = 10) -> None:
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        # el último lote sale si hay lugar en la ventana; si no, queda en el spool
+        self._flush_batch()
+        # esperar las confirmaciones pendientes; lo leído del spool sin
+        # confirmar se vuelve a enviar al arrancar de nuevo
+        deadline = time.monotonic() + timeout
+        while self._inflight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.client.loop_stop()
+        self.client.disconnect()
+        self.spool.close()